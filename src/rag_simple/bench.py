@@ -0,0 +1,161 @@
+from contextlib import redirect_stdout
+from importlib import metadata
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+from .kv_model import KVModel, Field
+from .llm_agent import StubAgentConfig
+from .manifest import BuildManifest
+from .project import RAGProject
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+class BenchConfig(KVModel):
+    files: int = Field(default=10)
+    docs: int = Field(default=1000)
+    lines: int = Field(default=5)
+    queries: int = Field(default=200)
+    limit: int = Field(default=5)
+    engine: str = Field(default="chroma")
+    dimension: int = Field(default=256)
+    embed_latency: float = Field(default=0.0)
+    embed_workers: int = Field(default=4)
+    seed: int = Field(default=0)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if len(values) == 0:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(q / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / (1 << 20)
+    return peak / (1 << 10)
+
+
+class Bench:
+    """
+    Build and query a synthetic corpus with the offline stub agent.
+    """
+
+    def __init__(self, config: BenchConfig = None, project_path: Path = None):
+        if config is None:
+            config = BenchConfig()
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.project_path = project_path
+        self.words = [self.make_word() for _ in range(2000)]
+        self.lines: list[str] = []
+
+    def make_word(self):
+        size = self.random.randint(3, 9)
+        return "".join(self.random.choices("abcdefghijklmnopqrstuvwxyz", k=size))
+
+    def make_line(self):
+        return " ".join(self.random.choices(self.words, k=self.random.randint(8, 14)))
+
+    def write_corpus(self, documents_dir: Path):
+        config = self.config
+        files = max(1, config.files)
+        for i in range(files):
+            count = config.docs // files + (1 if i < config.docs % files else 0)
+            data = []
+            for _ in range(count):
+                lines = [self.make_line() for _ in range(config.lines)]
+                self.lines.extend(lines)
+                data.append({"metadata": {"role": "system"}, "text": "\n".join(lines)})
+            with open(documents_dir / f"bench_{i}.yaml", "w") as file:
+                yaml.safe_dump_all(data, file)
+
+    def make_project(self, project_path: Path) -> RAGProject:
+        config = self.config
+        project = RAGProject.new(project_path)
+        if project is None:
+            raise FileExistsError(f"existing project {project_path}")
+        project.config.llm.embed.agent = "stub"
+        project.config.llm.embed.size = config.dimension
+        project.config.llm.embed.cache.enabled = False
+        project.config.llm.chat.agent = "stub"
+        project.config.vector_db.engine = config.engine
+        project.config.pipeline.embed_workers = config.embed_workers
+        # measure the index, not the query cache
+        project.config.query_cache.embeddings = 0
+        project.config.query_cache.results = 0
+        project.write_project_file()
+
+        agent_config = StubAgentConfig()
+        agent_config.dimension = config.dimension
+        agent_config.embed_latency = config.embed_latency
+        agent_config.to_toml(project.paths.agents_dir / "stub.toml")
+        return RAGProject(project_path)
+
+    def run_in(self, project_path: Path) -> dict:
+        config = self.config
+        project = self.make_project(project_path)
+        self.write_corpus(project.paths.documents_dir)
+
+        # keep stdout for results
+        with redirect_stdout(sys.stderr):
+            start = time.perf_counter()
+            project.build_db(dry_run=False, run_all=True)
+            build_time = time.perf_counter() - start
+        manifest = BuildManifest(project.paths.manifest_file).load()
+        chunks = sum(len(record.chunk_ids) for record in manifest.files.values())
+
+        latencies = []
+        flow_manager = project.flow_manager
+        for _ in range(config.queries):
+            query = self.random.choice(self.lines)
+            start = time.perf_counter()
+            flow_manager.retrieve_text(query, limit=config.limit)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        flow_manager.close()
+
+        return {
+            "version": metadata.version("rag-simple"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": config.dump(),
+            "build": {
+                "seconds": build_time,
+                "docs": config.docs,
+                "chunks": chunks,
+                "docs_per_second": config.docs / max(build_time, 1e-9),
+                "chunks_per_second": chunks / max(build_time, 1e-9),
+            },
+            "retrieve": {
+                "queries": len(latencies),
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "mean_ms": sum(latencies) / max(len(latencies), 1) * 1000,
+            },
+            "memory": {"peak_rss_mb": peak_rss_mb()},
+        }
+
+    def run(self) -> dict:
+        if self.project_path is not None:
+            return self.run_in(Path(self.project_path))
+        with tempfile.TemporaryDirectory(prefix="rag_bench_") as tmp:
+            return self.run_in(Path(tmp) / "project")
@@ -1,11 +1,16 @@
+from dataclasses import replace
 from functools import wraps
 from io import IOBase
 import sys
-from typing import Any, Iterable, Callable, Protocol
+import time
+from typing import Any, AsyncIterator, Awaitable, Iterable, Callable, Protocol
+from .context import ContextUsage, ContextWindow
 from .prompt import Knowledge, Prompt
+from .tracing import metrics, RateBuckets, TokenBuckets
 
 
 ChatFunc = Callable[[Prompt], Iterable[str]]
+AsyncChatFunc = Callable[[Prompt], AsyncIterator[str]]
 
 
 class RetrieveFunc(Protocol):
@@ -13,6 +18,11 @@ class RetrieveFunc(Protocol):
         pass
 
 
+class AsyncRetrieveFunc(Protocol):
+    def __call__(self, text, *, limit=5) -> Awaitable[list[Knowledge]]:
+        pass
+
+
 class Stream:
     def __init__(self, stream: Iterable[Any] = None):
         self.stream = stream
@@ -44,6 +54,35 @@ def make_stream(func):
     return wrapped
 
 
+class StreamTimer:
+    """
+    Time to the first token and tokens per second of a response.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.tokens = 0
+
+    def token(self):
+        if self.tokens == 0:
+            self.first = time.perf_counter()
+            metrics.observe("llm.chat.first_token", self.first - self.start)
+        self.tokens += 1
+
+    def done(self):
+        if self.tokens < 2:
+            return
+        elapsed = time.perf_counter() - self.first
+        if elapsed > 0:
+            metrics.observe(
+                "llm.chat.tokens_per_second",
+                (self.tokens - 1) / elapsed,
+                buckets=RateBuckets,
+                unit=None,
+            )
+
+
 class Response(Stream):
     def __init__(self, chatbot: "Chatbot", stream: Iterable = None):
         super().__init__(stream)
@@ -54,9 +93,12 @@ class Response(Stream):
 
     def iter_message(self):
         total = ""
+        timer = StreamTimer()
         for content in self.stream:
+            timer.token()
             yield content
             total += content
+        timer.done()
         self.chatbot.add_assistant_message(total)
 
     def print(self, file: IOBase = None, end="\n"):
@@ -69,35 +111,134 @@ class Response(Stream):
         print(end, end="", file=file)
 
 
+class AsyncResponse(Response):
+    def __init__(self, chatbot: "Chatbot", stream: AsyncIterator[str] = None):
+        super().__init__(chatbot, stream)
+
+    def __iter__(self):
+        raise TypeError("use `async for` with AsyncResponse")
+
+    def __aiter__(self):
+        return self.stream
+
+    async def iter_message(self):
+        total = ""
+        timer = StreamTimer()
+        async for content in self.stream:
+            timer.token()
+            yield content
+            total += content
+        timer.done()
+        self.chatbot.add_assistant_message(total)
+
+    async def drain(self) -> str:
+        total = ""
+        async for content in self.iter_message():
+            total += content
+        return total
+
+    async def print(self, file: IOBase = None, end="\n"):
+        if self.stream is None:
+            return
+        if file is None:
+            file = sys.stdout
+        async for content in self.iter_message():
+            print(content, end="", flush=True, file=file)
+        print(end, end="", file=file)
+
+
 class Chatbot:
     def __init__(self, chat: ChatFunc, retrieve: RetrieveFunc):
         self.chat_func = chat
         self.retrieve_func = retrieve
-        self.messages = Prompt()
-        self.added_knowledge = set()
+        self.preset: list[dict] = []
+        self.knowledge: list[Knowledge] = []
+        # what each retrieval found, the oldest first
+        self.retrieved: list[list[Knowledge]] = []
+        self.turns: list[dict] = []
+        self.added_knowledge: dict[str, Knowledge] = {}
         self.retrieval_prefix = ""
+        self.context = ContextWindow()
+        # estimated tokens of each chat request
+        self.usage: list[ContextUsage] = []
 
     def set_retrieval_prefix(self, prefix):
         self.retrieval_prefix = prefix
         return self
 
+    def set_context(self, context: ContextWindow):
+        self.context = context
+        return self
+
     def extend(self, iterable):
-        self.messages.extend(iterable)
+        self.preset.extend(iterable)
         return self
 
+    @property
+    def messages(self) -> Prompt:
+        """
+        Everything so far, not limited by the context window.
+        """
+        prompt = Prompt().extend(self.preset)
+        for knowledge in self.knowledge:
+            prompt.add_knowledge(knowledge)
+        return prompt.extend(self.turns)
+
     def add_assistant_message(self, text):
-        self.messages.add_message(text, role="assistant")
+        self.turns.append({"role": "assistant", "content": text})
+
+    def make_prompt(self, text) -> Prompt:
+        question = {"role": "user", "content": text}
+        prompt, usage = self.context.pack(
+            self.preset, self.retrieved, self.turns, question
+        )
+        self.turns.append(question)
+        self.usage.append(usage)
+        metrics.observe(
+            "chat.prompt_tokens", usage.total, buckets=TokenBuckets, unit="tokens"
+        )
+        return prompt
 
     @make_stream
     def retrieve(self, text, limit=5) -> Stream:
+        self.retrieved.append([])
         for knowledge in self.retrieve_func(text, limit=limit):
             yield knowledge
-            if knowledge.id not in self.added_knowledge:
-                knowledge.set_prefix(self.retrieval_prefix)
-                self.messages.add_knowledge(knowledge)
-                self.added_knowledge.add(knowledge.id)
+            self.add_knowledge(knowledge)
+
+    def add_knowledge(self, knowledge: Knowledge):
+        if len(self.retrieved) == 0:
+            self.retrieved.append([])
+        added = self.added_knowledge.get(knowledge.id)
+        if added is not None:
+            # prefixed already, but as close as this retrieval found it
+            self.retrieved[-1].append(replace(added, dist=knowledge.dist))
+            return
+        knowledge.set_prefix(self.retrieval_prefix)
+        self.knowledge.append(knowledge)
+        self.retrieved[-1].append(knowledge)
+        self.added_knowledge[knowledge.id] = knowledge
 
     def chat(self, text) -> Response:
-        self.messages.add_message(text, role="user")
-        stream = self.chat_func(self.messages)
+        stream = self.chat_func(self.make_prompt(text))
         return Response(self, stream)
+
+
+class AsyncChatbot(Chatbot):
+    """
+    The same as Chatbot, but retrieving and chatting on an event loop.
+    """
+
+    def __init__(self, chat: AsyncChatFunc, retrieve: AsyncRetrieveFunc):
+        super().__init__(chat, retrieve)
+
+    async def retrieve(self, text, limit=5) -> list[Knowledge]:
+        self.retrieved.append([])
+        result = await self.retrieve_func(text, limit=limit)
+        for knowledge in result:
+            self.add_knowledge(knowledge)
+        return result
+
+    def chat(self, text) -> AsyncResponse:
+        stream = self.chat_func(self.make_prompt(text))
+        return AsyncResponse(self, stream)
@@ -0,0 +1,116 @@
+import re
+
+from .kv_model import KVModel, Field
+
+
+class ChunkConfig(KVModel):
+    # line: one chunk for each line,
+    # chars / tokens: fixed-size windows of `size` characters / approximate tokens,
+    # sentences: consecutive sentences packed up to `size` characters
+    strategy: str = Field(default="line")
+    size: int = Field(default=512)
+    # characters / tokens shared by two neighbouring windows
+    overlap: int = Field(default=64)
+    # longer chunks are cut, 0 to disable
+    max_chars: int = Field(default=0)
+
+
+class Chunker:
+    """
+    Split the text of a document into sentence chunks.
+    """
+
+    Strategies = ("line", "chars", "tokens", "sentences")
+    # words, CJK characters and punctuation each count as one token
+    TokenPattern = re.compile(
+        r"[\u3040-\u30ff\u3400-\u9fff]|[^\W\u3040-\u30ff\u3400-\u9fff]+"
+        r"|[^\w\s]"
+    )
+    SentenceEnd = re.compile(r"(?<=[.!?;。！？；])\s+|(?<=[。！？；])|\n\s*\n")
+
+    def __init__(self, config: ChunkConfig = None):
+        if config is None:
+            config = ChunkConfig()
+        if config.strategy not in self.Strategies:
+            raise ValueError(f"unknown chunk strategy {config.strategy}")
+        self.config = config
+        self.size = max(1, config.size)
+        # windows move forward by at least half of their size
+        self.overlap = min(max(0, config.overlap), self.size // 2)
+
+    def split(self, text: str) -> list[str]:
+        strategy = self.config.strategy
+        if strategy == "line":
+            pieces = text.strip().split("\n")
+        elif strategy == "chars":
+            pieces = self.split_chars(text.strip(), self.size, self.overlap)
+        elif strategy == "tokens":
+            pieces = self.split_tokens(text)
+        else:
+            pieces = self.split_sentences(text)
+        max_chars = self.config.max_chars
+        if max_chars <= 0:
+            return pieces
+        capped = []
+        for piece in pieces:
+            if len(piece) <= max_chars:
+                capped.append(piece)
+                continue
+            for cut in self.split_chars(piece, max_chars, 0):
+                if cut.strip() != "":
+                    capped.append(cut.strip())
+        return capped
+
+    @staticmethod
+    def split_chars(text: str, size: int, overlap: int) -> list[str]:
+        step = size - overlap
+        pieces = []
+        for start in range(0, len(text), step):
+            pieces.append(text[start : start + size])
+            if start + size >= len(text):
+                break
+        return pieces
+
+    def split_tokens(self, text: str) -> list[str]:
+        spans = [match.span() for match in self.TokenPattern.finditer(text)]
+        step = self.size - self.overlap
+        pieces = []
+        for start in range(0, len(spans), step):
+            window = spans[start : start + self.size]
+            pieces.append(text[window[0][0] : window[-1][1]])
+            if start + self.size >= len(spans):
+                break
+        return pieces
+
+    def sentence_spans(self, text: str) -> list[tuple[int, int]]:
+        spans = []
+        start = 0
+        for match in self.SentenceEnd.finditer(text):
+            spans.append((start, match.start()))
+            start = match.end()
+        spans.append((start, len(text)))
+        return [(start, end) for start, end in spans if text[start:end].strip() != ""]
+
+    def split_sentences(self, text: str) -> list[str]:
+        """
+        Pack consecutive sentences, keeping the original spacing between them.
+        """
+        text = text.strip()
+        pieces = []
+        first = last = None
+        for start, end in self.sentence_spans(text):
+            if first is not None and end - first > self.size:
+                pieces.append(text[first:last])
+                first = None
+            if first is None:
+                first = start
+            last = end
+            # a single long sentence falls back to windows
+            if last - first > self.size:
+                pieces.extend(
+                    self.split_chars(text[first:last], self.size, self.overlap)
+                )
+                first = None
+        if first is not None:
+            pieces.append(text[first:last])
+        return pieces
@@ -1,5 +1,9 @@
 import argparse
+import json
+import sys
+
 from .project import RAGProject
+from .tracing import metrics
 
 
 def cmd_new(args):
@@ -25,22 +29,23 @@ def cmd_build(args):
         return -1
     dry_run = bool(args.dry_run)
     run_all = bool(args.all)
-    project.build_db(dry_run=dry_run, run_all=run_all)
+    project.build_db(dry_run=dry_run, run_all=run_all, resume=bool(args.resume))
 
 
 def cmd_ask(args):
-    keywords: list = args.keyword
-    if keywords is None:
-        keywords = []
-    if len(keywords) > 0:
-        print("Currently, keywords are not supported and are ignored.")
     project = RAGProject.find_possible_project()
     if project is None:
         print(
             f"Unable to find a rag project. Use environ ${RAGProject.Environ} to specify."
         )
         return -1
-    return project.ask(args.question, limit=args.limit)
+    return project.ask(
+        args.question,
+        limit=args.limit,
+        keywords=args.keyword,
+        mode=args.mode,
+        warm_up=args.warm_up,
+    )
 
 
 def cmd_retrieve(args):
@@ -52,7 +57,14 @@ def cmd_retrieve(args):
         return -1
     content = args.content
     limit = args.limit
-    project.retrieve(content, limit)
+    if args.from_file is not None:
+        return project.retrieve_file(
+            args.from_file, limit=limit, batch_size=args.batch_size, mode=args.mode
+        )
+    if content is None:
+        print("Give the content to retrieve, or --from-file.")
+        return -1
+    project.retrieve(content, limit, mode=args.mode)
 
 
 def cmd_clear(args):
@@ -70,6 +82,109 @@ def cmd_clear(args):
     project.clear()
 
 
+def cmd_export(args):
+    project = RAGProject.find_possible_project()
+    if project is None:
+        print(
+            f"Unable to find a rag project. Use environ ${RAGProject.Environ} to specify."
+        )
+        return -1
+    dtype = "float16" if args.float16 else "float32"
+    project.export_snapshot(args.path, dtype=dtype)
+
+
+def cmd_import(args):
+    project = RAGProject.find_possible_project()
+    if project is None:
+        print(
+            f"Unable to find a rag project. Use environ ${RAGProject.Environ} to specify."
+        )
+        return -1
+    from .snapshot import SnapshotError
+
+    try:
+        project.import_snapshot(args.path, force=bool(args.force))
+    except SnapshotError as err:
+        print(err)
+        return -1
+
+
+def cmd_serve(args):
+    project = RAGProject.find_possible_project()
+    if project is None:
+        print(
+            f"Unable to find a rag project. Use environ ${RAGProject.Environ} to specify."
+        )
+        return -1
+    from .server import RAGServer
+
+    config = project.config.serve
+    if args.host is not None:
+        config.host = args.host
+    if args.port is not None:
+        config.port = args.port
+    RAGServer(project, config).serve(warm_up=args.warm_up)
+
+
+def cmd_bench(args):
+    from .bench import Bench, BenchConfig
+
+    config = BenchConfig()
+    for key in BenchConfig.fields:
+        value = getattr(args, key, None)
+        if value is not None:
+            setattr(config, key, value)
+    try:
+        result = Bench(config, args.project).run()
+    except FileExistsError as err:
+        print(err)
+        return -1
+    text = json.dumps(result, indent=2)
+    if args.output is None:
+        print(text)
+        return
+    with open(args.output, "w") as file:
+        file.write(text + "\n")
+    print(f"results written to {args.output}", file=sys.stderr)
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        metavar="PATH",
+        help="collect timing histograms and write them to PATH ('-' for stderr)",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=["json", "prometheus"],
+        default="json",
+        help="format of --metrics",
+    )
+
+
+def add_mode_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--mode",
+        choices=["hybrid", "vector", "keyword"],
+        default=None,
+        help="retrieve by embeddings, keywords (no embedding call) or both fused, "
+        "default is retrieval.mode in rag_project.toml",
+    )
+
+
+def dump_metrics(path, metrics_format):
+    if metrics_format == "prometheus":
+        text = metrics.to_prometheus()
+    else:
+        text = metrics.to_json() + "\n"
+    if path == "-":
+        sys.stderr.write(text)
+        return
+    with open(path, "w") as file:
+        file.write(text)
+
+
 def main():
     parser = argparse.ArgumentParser(description="simple RAG project")
 
@@ -109,6 +224,13 @@ def main():
     parser_build = sub_parsers.add_parser("build", help="build chroma database")
     parser_build.add_argument("--dry-run", "-d", action="count", help="show files only")
     parser_build.add_argument("--all", "-a", action="count", help="rebuild all")
+    parser_build.add_argument(
+        "--resume",
+        "-r",
+        action="count",
+        help="reuse what an interrupted build has embedded",
+    )
+    add_metrics_arguments(parser_build)
     parser_build.set_defaults(func=cmd_build)
 
     parser_ask = sub_parsers.add_parser("ask", help="ask with built database")
@@ -117,19 +239,39 @@ def main():
         "-k",
         action="append",
         default=None,
-        help="give some keyword to help retrieving",
+        help="give some keyword to help retrieving, searched with the question",
     )
+    add_mode_argument(parser_ask)
     parser_ask.add_argument(
         "--limit", "-n", type=int, default=3, help="how many items you want to retrieve"
     )
+    parser_ask.add_argument(
+        "--warm-up",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="load models and the index in the background first, "
+        "default is ask.warm_up in rag_project.toml",
+    )
     parser_ask.add_argument("question", default=None, nargs="?")
+    add_metrics_arguments(parser_ask)
     parser_ask.set_defaults(func=cmd_ask)
 
     parser_retrieve = sub_parsers.add_parser(
         "retrieve", help="retrieve from vector database (chromadb)"
     )
-    parser_retrieve.add_argument("content")
+    parser_retrieve.add_argument("content", default=None, nargs="?")
     parser_retrieve.add_argument("--limit", default=5, type=int)
+    parser_retrieve.add_argument(
+        "--from-file",
+        "-f",
+        default=None,
+        help="queries in a .txt (one per line) or .jsonl file, results as JSONL",
+    )
+    parser_retrieve.add_argument(
+        "--batch-size", default=None, type=int, help="queries embedded at once"
+    )
+    add_mode_argument(parser_retrieve)
+    add_metrics_arguments(parser_retrieve)
     parser_retrieve.set_defaults(func=cmd_retrieve)
 
     parser_clear = sub_parsers.add_parser("clear", help="remove all embedding data")
@@ -138,5 +280,82 @@ def main():
     )
     parser_clear.set_defaults(func=cmd_clear)
 
+    parser_export = sub_parsers.add_parser(
+        "export", help="write the vector database to a portable snapshot"
+    )
+    parser_export.add_argument("path", help="snapshot directory")
+    parser_export.add_argument(
+        "--float16", action="count", help="store embeddings in half precision"
+    )
+    parser_export.set_defaults(func=cmd_export)
+
+    parser_import = sub_parsers.add_parser(
+        "import", help="replace the vector database by a snapshot"
+    )
+    parser_import.add_argument("path", help="snapshot directory")
+    parser_import.add_argument(
+        "--force",
+        "-f",
+        action="count",
+        help="import even if embedded by another model",
+    )
+    parser_import.set_defaults(func=cmd_import)
+
+    parser_serve = sub_parsers.add_parser(
+        "serve",
+        help="serve retrieve, embed and chat over HTTP, "
+        "reloading the index after each build",
+    )
+    parser_serve.add_argument(
+        "--host", default=None, help="default is serve.host in rag_project.toml"
+    )
+    parser_serve.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="default is serve.port in rag_project.toml",
+    )
+    parser_serve.add_argument(
+        "--warm-up",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="load models and the index first, default is serve.warm_up",
+    )
+    add_metrics_arguments(parser_serve)
+    parser_serve.set_defaults(func=cmd_serve)
+
+    parser_bench = sub_parsers.add_parser(
+        "bench", help="benchmark build and retrieval on a synthetic corpus"
+    )
+    parser_bench.add_argument("--files", type=int, help="number of document files")
+    parser_bench.add_argument("--docs", type=int, help="number of documents")
+    parser_bench.add_argument("--lines", type=int, help="lines of each document")
+    parser_bench.add_argument("--queries", type=int, help="number of queries")
+    parser_bench.add_argument("--limit", type=int, help="retrieval limit")
+    parser_bench.add_argument("--engine", help="vector database engine")
+    parser_bench.add_argument("--dimension", type=int, help="embedding dimension")
+    parser_bench.add_argument(
+        "--embed-latency", type=float, help="simulated seconds of each embed call"
+    )
+    parser_bench.add_argument(
+        "--embed-workers", type=int, help="embedding requests in flight"
+    )
+    parser_bench.add_argument("--seed", type=int, help="random seed of the corpus")
+    parser_bench.add_argument(
+        "--project", default=None, help="keep the generated project at this path"
+    )
+    parser_bench.add_argument(
+        "--output", "-o", default=None, help="write JSON results to a file"
+    )
+    parser_bench.set_defaults(func=cmd_bench)
+
     args = parser.parse_args()
-    exit(args.func(args) or 0)
+    metrics_path = getattr(args, "metrics", None)
+    if metrics_path is not None:
+        metrics.enabled = True
+    try:
+        code = args.func(args) or 0
+    finally:
+        if metrics_path is not None:
+            dump_metrics(metrics_path, args.metrics_format)
+    exit(code)
@@ -0,0 +1,126 @@
+from dataclasses import dataclass
+import math
+import re
+
+from .kv_model import KVModel, Field
+from .prompt import Knowledge, Prompt
+
+
+class ContextConfig(KVModel):
+    # estimated tokens sent in one chat request, 0 for no limit
+    max_tokens: int = Field(default=4096)
+    # at most this many of them are retrieved knowledge
+    knowledge_tokens: int = Field(default=2048)
+    # for text other than CJK, which counts one token for each character
+    chars_per_token: float = Field(default=4.0)
+
+
+@dataclass
+class ContextUsage:
+    """
+    Estimated tokens of one chat request.
+    """
+
+    preset: int = 0
+    knowledge: int = 0
+    history: int = 0
+    question: int = 0
+    # left out to fit the budget
+    dropped_knowledge: int = 0
+    dropped_turns: int = 0
+
+    @property
+    def total(self):
+        return self.preset + self.knowledge + self.history + self.question
+
+    def __str__(self):
+        return (
+            f"{self.total} tokens (preset {self.preset}, knowledge {self.knowledge}, "
+            f"history {self.history}, question {self.question}), "
+            f"dropped {self.dropped_knowledge} knowledge and {self.dropped_turns} turns"
+        )
+
+
+class ContextWindow:
+    """
+    Pack a chat request within a token budget:
+    the preset, the knowledge of the latest retrieval first and the best
+    by `dist` within one, the latest turns that fit, and the question,
+    in this order.
+    """
+
+    CJKPattern = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+    # role and separators of a message
+    MessageOverhead = 4
+
+    def __init__(self, config: ContextConfig = None):
+        if config is None:
+            config = ContextConfig()
+        self.config = config
+
+    def estimate(self, text: str) -> int:
+        cjk = len(self.CJKPattern.findall(text))
+        rest = (len(text) - cjk) / max(self.config.chars_per_token, 1e-6)
+        return cjk + math.ceil(rest)
+
+    def message_tokens(self, message: dict) -> int:
+        return self.estimate(message["content"]) + self.MessageOverhead
+
+    @staticmethod
+    def by_retrieval(knowledge: list[list[Knowledge]]):
+        for retrieved in reversed(knowledge):
+            yield from sorted(retrieved, key=lambda one: one.dist)
+
+    def pack(
+        self,
+        preset: list[dict],
+        knowledge: list[list[Knowledge]],
+        turns: list[dict],
+        question: dict,
+    ) -> tuple[Prompt, ContextUsage]:
+        usage = ContextUsage()
+        usage.preset = sum(self.message_tokens(one) for one in preset)
+        usage.question = self.message_tokens(question)
+        unlimited = self.config.max_tokens <= 0
+        left = self.config.max_tokens - usage.preset - usage.question
+
+        knowledge_left = left if unlimited else min(left, self.config.knowledge_tokens)
+        packed_knowledge = []
+        packed_ids = set()
+        # knowledge of earlier questions is dropped first
+        for one in self.by_retrieval(knowledge):
+            if one.id in packed_ids:
+                continue
+            packed_ids.add(one.id)
+            message = one.to_prompt()
+            tokens = self.message_tokens(message)
+            if not unlimited and tokens > knowledge_left:
+                # a smaller one may still fit
+                usage.dropped_knowledge += 1
+                continue
+            packed_knowledge.append(message)
+            knowledge_left -= tokens
+            usage.knowledge += tokens
+        left -= usage.knowledge
+
+        # the latest turns, without breaking one
+        kept = len(turns)
+        for i in range(len(turns) - 1, -1, -1):
+            tokens = self.message_tokens(turns[i])
+            if not unlimited and tokens > left:
+                break
+            left -= tokens
+            usage.history += tokens
+            kept = i
+        # the history starts with a question
+        while kept < len(turns) and turns[kept]["role"] != "user":
+            usage.history -= self.message_tokens(turns[kept])
+            kept += 1
+        usage.dropped_turns = kept
+
+        prompt = Prompt()
+        prompt.extend(preset)
+        prompt.extend(packed_knowledge)
+        prompt.extend(turns[kept:])
+        prompt.extend([question])
+        return prompt, usage
@@ -1,6 +1,10 @@
 from dataclasses import dataclass
+import json
 from pathlib import Path
-import yaml
+import tomllib
+
+from .chunker import Chunker
+from .kv_model import KVModel, Field
 
 
 @dataclass
@@ -21,6 +25,10 @@ class DocumentSentence:
             "sentence_index": self.sentence_index,
         }
 
+    @property
+    def metadata(self):
+        return self.dump()
+
 
 @dataclass
 class Document:
@@ -43,11 +51,22 @@ class Document:
         self.metadata["doc_index"] = self.index
         self.metadata["sentence_index"] = 0
 
-    def iter_doc_sentences(self):
-        lines = self.text.strip().split("\n")
-        if len(lines) == 1:
+    def iter_chunks(self, chunker: Chunker = None):
+        """
+        Iterate the document itself followed by its sentences,
+        i.e., everything to be embedded for this document.
+        """
+        yield self
+        yield from self.iter_doc_sentences(chunker)
+
+    def iter_doc_sentences(self, chunker: Chunker = None):
+        if chunker is None:
+            chunker = Chunker()
+        pieces = chunker.split(self.text)
+        # a single piece is the document itself
+        if len(pieces) <= 1:
             return
-        for i, sentence in enumerate(lines):
+        for i, sentence in enumerate(pieces):
             yield DocumentSentence(
                 self.rel_path,
                 self.doc_id,
@@ -56,16 +75,74 @@ class Document:
             )
 
 
+class DocumentConfig(KVModel):
+    # a line of only this separates documents in a .txt file
+    text_separator: str = Field(default="---")
+
+
 class DocumentLoader:
-    def __init__(self, base_dir: Path):
+    Extensions = (".yaml", ".yml", ".jsonl", ".toml", ".txt")
+
+    def __init__(self, base_dir: Path, config: DocumentConfig = None):
         self.base_dir = base_dir
+        if config is None:
+            config = DocumentConfig()
+        self.config = config
+
+    @staticmethod
+    def load_yaml(path: Path):
+        import yaml
+
+        # libyaml is much faster when available
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        with open(path, "r") as file:
+            yield from yaml.load_all(file, Loader=loader)
+
+    @staticmethod
+    def load_jsonl(path: Path):
+        with open(path, "r") as file:
+            for line in file:
+                if line.strip() == "":
+                    continue
+                yield json.loads(line)
 
     @staticmethod
-    def load_obj_stream_from_file(path: Path):
-        # TODO: read by file extension
+    def load_toml(path: Path):
+        """
+        TOML cannot be streamed, documents are an array of tables:
+        `[[documents]]`.
+        """
+        with open(path, "rb") as file:
+            data = tomllib.load(file)
+        yield from data.get("documents", [])
+
+    def load_text(self, path: Path):
+        separator = self.config.text_separator
+        lines = []
         with open(path, "r") as file:
-            for index, one in enumerate(yaml.safe_load_all(file)):
-                yield one
+            for line in file:
+                if line.rstrip("\r\n") != separator:
+                    lines.append(line)
+                    continue
+                text = "".join(lines)
+                lines = []
+                if text.strip() != "":
+                    yield {"text": text}
+        text = "".join(lines)
+        if text.strip() != "":
+            yield {"text": text}
+
+    def load_obj_stream_from_file(self, path: Path):
+        suffix = path.suffix.lower()
+        if suffix in (".yaml", ".yml"):
+            return self.load_yaml(path)
+        if suffix == ".jsonl":
+            return self.load_jsonl(path)
+        if suffix == ".toml":
+            return self.load_toml(path)
+        if suffix == ".txt":
+            return self.load_text(path)
+        raise NotImplementedError(f"unknown document format {path}")
 
     def iter_documents(self, path: Path):
         rel_path = path.relative_to(self.base_dir)
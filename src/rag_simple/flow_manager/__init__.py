@@ -1,4 +1,12 @@
+from .cache import LRUCache, QueryCacheConfig
 from .manager import FlowManager
+from .pipeline import IngestPipeline, PipelineConfig
 
 
-__all__ = ["FlowManager"]
+__all__ = [
+    "FlowManager",
+    "IngestPipeline",
+    "LRUCache",
+    "PipelineConfig",
+    "QueryCacheConfig",
+]
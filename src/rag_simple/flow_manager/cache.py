@@ -0,0 +1,52 @@
+from collections import OrderedDict
+import threading
+
+from ..kv_model import KVModel, Field
+
+
+class QueryCacheConfig(KVModel):
+    # entries of text -> query embedding, 0 to disable
+    embeddings: int = Field(default=1024)
+    # entries of (embedding, limit) -> retrieved knowledge, 0 to disable
+    results: int = Field(default=256)
+
+
+class LRUCache:
+    """
+    A thread-safe bounded mapping dropping the least recently used entries.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        return {"size": len(self.data), "hits": self.hits, "misses": self.misses}
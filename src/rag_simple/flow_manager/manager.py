@@ -1,18 +1,36 @@
-from typing import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from functools import partial
+import sys
+import threading
+from typing import AsyncIterator, Iterable
 from pathlib import Path
 
-from ..chatbot import Chatbot
+from ..chatbot import AsyncChatbot, Chatbot
+from ..chunker import Chunker
 from ..document import Document
 from ..llm_agent import BaseLLM
 from ..prompt import Knowledge, Prompt
+from ..tracing import traced
 from ..vector_db import BaseVectorDB
+from .cache import LRUCache, QueryCacheConfig
 
 
 class FlowManager:
-    def __init__(self, llm: BaseLLM, vector_db: BaseVectorDB):
+    def __init__(
+        self,
+        llm: BaseLLM,
+        vector_db: BaseVectorDB,
+        query_cache: QueryCacheConfig = None,
+    ):
         self.llm = llm
         self.vector_db = vector_db
         self.is_setup = False
+        self.setup_lock = threading.Lock()
+        if query_cache is None:
+            query_cache = QueryCacheConfig()
+        self.embedding_cache = LRUCache(query_cache.embeddings)
+        self.result_cache = LRUCache(query_cache.results)
 
     def connect(self):
         self.llm.connect()
@@ -21,18 +39,53 @@ class FlowManager:
     def setup(self):
         if self.is_setup:
             return
-        self.connect()
-        self.is_setup = True
+        # warm-up may set up from another thread
+        with self.setup_lock:
+            if self.is_setup:
+                return
+            self.connect()
+            self.is_setup = True
+
+    def warm_up(self):
+        """
+        Load both models and the index concurrently.
+        """
+        self.setup()
+        with ThreadPoolExecutor(2) as executor:
+            futures = [
+                executor.submit(self.llm.warm_up),
+                executor.submit(self.vector_db.warm_up),
+            ]
+            for future in futures:
+                future.result()
+
+    def start_warm_up(self) -> threading.Thread:
+        """
+        Warm up in the background, e.g., while the REPL banner is shown.
+        Failures are reported but not raised.
+        """
+
+        def run():
+            try:
+                self.warm_up()
+            except Exception as err:
+                print(f"warm-up failed: {err}", file=sys.stderr)
+
+        thread = threading.Thread(target=run, name="warm-up", daemon=True)
+        thread.start()
+        return thread
 
     def close(self):
         if not self.is_setup:
             return
         self.llm.close()
         self.vector_db.close()
+        self.is_setup = False
 
     def __del__(self):
         self.close()
 
+    @traced("flow.embed")
     def embed(self, input_text: list[str]) -> list[list[float]]:
         self.setup()
         return self.llm.embed(input_text)
@@ -41,23 +94,170 @@ class FlowManager:
         self.setup()
         return self.llm.chat(messages)
 
+    def flush(self):
+        if not self.is_setup:
+            return
+        self.vector_db.flush()
+
+    def reload_index(self):
+        """
+        Connect the vector database again, e.g., after another process built it.
+        """
+        if self.is_setup:
+            self.vector_db.close()
+            self.vector_db.connect()
+        self.result_cache.clear()
+
     def clear_db(self):
         self.setup()
         self.vector_db.clear()
+        self.result_cache.clear()
 
     def remove_by_rel_path(self, rel_path: str | Path):
         self.setup()
         self.vector_db.remove_by_rel_path(rel_path)
+        self.result_cache.clear()
+
+    def remove_ids(self, ids: list[str]):
+        self.setup()
+        self.vector_db.remove_ids(ids)
+        self.result_cache.clear()
 
-    def insert_documents(self, docs: Iterable[Document]):
+    def ids_by_rel_path(self, rel_path: str | Path) -> list[str]:
         self.setup()
-        return self.vector_db.insert_documents(docs, self.embed)
+        return self.vector_db.ids_by_rel_path(rel_path)
 
-    def retrieve_text(self, text, limit=5) -> Iterable[Knowledge]:
+    def insert_documents(self, docs: Iterable[Document], chunker: Chunker = None):
         self.setup()
-        embedding = self.embed([text])
-        return self.vector_db.retrieve(embedding, limit=limit)
+        try:
+            return self.vector_db.insert_documents(docs, self.embed, chunker)
+        finally:
+            self.result_cache.clear()
+
+    def add_chunks(self, chunks: list, embeddings: list[list[float]]):
+        self.setup()
+        self.vector_db.add_chunks(chunks, embeddings)
+        self.result_cache.clear()
+
+    def cache_stats(self):
+        return {
+            "embeddings": self.embedding_cache.stats(),
+            "results": self.result_cache.stats(),
+        }
+
+    def cached_results(self, embedding, limit, query=None, mode="vector"):
+        vector = None if embedding is None else tuple(embedding[0])
+        key = (vector, limit, query, mode)
+        found = self.result_cache.get(key)
+        if found is None:
+            return key, None
+        # knowledge may be changed by the caller, e.g., prefixed
+        return key, [replace(knowledge) for knowledge in found]
+
+    def cache_results(self, key, knowledge: list[Knowledge]):
+        self.result_cache.put(key, tuple(replace(one) for one in knowledge))
+
+    @staticmethod
+    def keyword_query(text, keywords=None):
+        if not keywords:
+            return text
+        return " ".join([text] + list(keywords))
+
+    def cached_embedding(self, text):
+        embedding = self.embedding_cache.get(text)
+        if embedding is None:
+            embedding = self.embed([text])
+            self.embedding_cache.put(text, embedding)
+        return embedding
+
+    @traced("flow.retrieve_text")
+    def retrieve_text(
+        self, text, limit=5, keywords=None, mode=None
+    ) -> Iterable[Knowledge]:
+        """
+        :param keywords: extra terms of the keyword search
+        :param mode: hybrid, vector or keyword, the configured one by default.
+            The keyword mode makes no embedding call.
+        """
+        self.setup()
+        mode = self.vector_db.resolve_mode(mode)
+        query = self.keyword_query(text, keywords)
+        embedding = None if mode == "keyword" else self.cached_embedding(text)
+        key, result = self.cached_results(embedding, limit, query, mode)
+        if result is not None:
+            return result
+        result = list(
+            self.vector_db.retrieve(embedding, limit=limit, text=query, mode=mode)
+        )
+        self.cache_results(key, result)
+        return result
+
+    @traced("flow.retrieve_many")
+    def retrieve_many(
+        self, texts: list[str], limit=5, batch_size=None, mode=None
+    ) -> list[list[Knowledge]]:
+        """
+        Retrieve for many texts, embedding them in batches
+        and querying each batch at once.
+        """
+        self.setup()
+        mode = self.vector_db.resolve_mode(mode)
+        if batch_size is None:
+            batch_size = self.vector_db.config.batch_size
+        batch_size = max(1, batch_size)
+        result = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start : start + batch_size]
+            embeddings = None if mode == "keyword" else self.embed(batch)
+            result.extend(
+                self.vector_db.retrieve_many(
+                    embeddings, limit=limit, texts=batch, mode=mode
+                )
+            )
+        return result
+
+    def chatbot(self, keywords=None, mode=None):
+        self.setup()
+        retrieve = partial(self.retrieve_text, keywords=keywords, mode=mode)
+        return Chatbot(self.chat, retrieve)
+
+    @traced("flow.embed")
+    async def aembed(self, input_text: list[str]) -> list[list[float]]:
+        self.setup()
+        return await self.llm.aembed(input_text)
+
+    def achat(self, messages: Prompt) -> AsyncIterator[str]:
+        self.setup()
+        return self.llm.achat(messages)
+
+    @traced("flow.retrieve_text")
+    async def aretrieve_text(
+        self, text, limit=5, keywords=None, mode=None
+    ) -> list[Knowledge]:
+        self.setup()
+        mode = self.vector_db.resolve_mode(mode)
+        query = self.keyword_query(text, keywords)
+        embedding = None
+        if mode != "keyword":
+            embedding = self.embedding_cache.get(text)
+            if embedding is None:
+                embedding = await self.aembed([text])
+                self.embedding_cache.put(text, embedding)
+        key, result = self.cached_results(embedding, limit, query, mode)
+        if result is not None:
+            return result
+        # the vector database is synchronous, so query it in a worker thread
+        import asyncio
+
+        result = await asyncio.to_thread(
+            lambda: list(
+                self.vector_db.retrieve(embedding, limit=limit, text=query, mode=mode)
+            )
+        )
+        self.cache_results(key, result)
+        return result
 
-    def chatbot(self):
+    def async_chatbot(self, keywords=None, mode=None):
         self.setup()
-        return Chatbot(self.chat, self.retrieve_text)
+        retrieve = partial(self.aretrieve_text, keywords=keywords, mode=mode)
+        return AsyncChatbot(self.achat, retrieve)
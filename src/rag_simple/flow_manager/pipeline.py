@@ -0,0 +1,365 @@
+from dataclasses import dataclass, field
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from ..chunker import Chunker
+from ..document import Document, DocumentLoader
+from ..journal import BuildJournal
+from ..kv_model import KVModel, Field
+from ..manifest import BuildTarget, hash_chunk
+from .manager import FlowManager
+
+
+class PipelineConfig(KVModel):
+    # how many embedding requests are in flight
+    embed_workers: int = Field(default=4)
+    # capacity of the queue between two stages
+    queue_size: int = Field(default=16)
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    busy: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, items, busy):
+        with self.lock:
+            self.items += items
+            self.busy += busy
+
+    @property
+    def rate(self):
+        if self.busy <= 0:
+            return 0.0
+        return self.items / self.busy
+
+    def __str__(self):
+        return f"{self.name}: {self.items} in {self.busy:.2f}s ({self.rate:.1f}/s)"
+
+
+@dataclass
+class _FileStart:
+    target: BuildTarget
+
+
+@dataclass
+class _FileEnd:
+    target: BuildTarget
+    batches: int
+    # of all chunks in the file, including unchanged ones
+    chunk_ids: list[str]
+    chunk_hashes: list[str]
+
+
+@dataclass
+class _Batch:
+    target: BuildTarget
+    index: int
+    chunks: list
+    embeddings: Any = None
+
+
+@dataclass
+class _FileState:
+    written: int = 0
+    end: _FileEnd | None = None
+
+    @property
+    def done(self):
+        return self.end is not None and self.written == self.end.batches
+
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    pass
+
+
+class IngestPipeline:
+    """
+    Staged ingestion: scan -> parse -> chunk -> embed -> write.
+
+    A file with a previous record is updated by difference: only chunks with
+    new ids or changed text and metadata are embedded and upserted,
+    and ids no longer there are removed.
+
+    Stages are threads connected by bounded queues.
+    Several embedding requests run concurrently,
+    while the calling thread is the only writer to the vector database.
+
+    With a journal, embedded batches are staged in it, batches staged before
+    are not embedded again, and a file is written to the vector database
+    only once all its batches are staged.
+    """
+
+    def __init__(
+        self,
+        flow_manager: FlowManager,
+        loader: DocumentLoader,
+        config: PipelineConfig = None,
+        chunker: Chunker = None,
+        journal: BuildJournal = None,
+    ):
+        if config is None:
+            config = PipelineConfig()
+        self.flow_manager = flow_manager
+        self.loader = loader
+        self.chunker = chunker
+        self.journal = journal
+        self.workers = max(1, config.embed_workers)
+        self.queue_size = max(1, config.queue_size)
+        self.stop = threading.Event()
+        self.error: BaseException | None = None
+        self.stats = {
+            name: StageStats(name) for name in ("parse", "chunk", "embed", "write")
+        }
+
+    def put(self, target_queue: queue.Queue, item):
+        while True:
+            if self.stop.is_set():
+                raise _Stopped()
+            try:
+                target_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, source_queue: queue.Queue):
+        while True:
+            if self.stop.is_set():
+                raise _Stopped()
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def run_stage(self, func, *args):
+        try:
+            func(*args)
+        except _Stopped:
+            pass
+        except BaseException as err:
+            self.error = err
+            self.stop.set()
+
+    def parse_stage(self, targets: Iterable[BuildTarget], doc_queue: queue.Queue):
+        stats = self.stats["parse"]
+        for target in targets:
+            start = time.perf_counter()
+            for doc in self.loader.iter_documents(target.path):
+                stats.add(1, time.perf_counter() - start)
+                self.put(doc_queue, (target, doc))
+                start = time.perf_counter()
+            self.put(doc_queue, (target, None))
+        self.put(doc_queue, _DONE)
+
+    def iter_file_docs(self, first, doc_queue: queue.Queue) -> Iterable[Document]:
+        item = first
+        while True:
+            _, doc = item
+            if doc is None:
+                return
+            yield doc
+            item = self.get(doc_queue)
+
+    def chunk_stage(
+        self,
+        doc_queue: queue.Queue,
+        embed_queue: queue.Queue,
+        write_queue: queue.Queue,
+    ):
+        stats = self.stats["chunk"]
+        vector_db = self.flow_manager.vector_db
+        while True:
+            item = self.get(doc_queue)
+            if item is _DONE:
+                break
+            target = item[0]
+            # the writer sees the start before any batch of this file
+            self.put(write_queue, _FileStart(target))
+            stored = {} if target.previous is None else target.previous.stored_chunks()
+            chunk_ids = []
+            chunk_hashes = []
+
+            def changed_chunks(docs):
+                for doc in docs:
+                    for chunk in doc.iter_chunks(self.chunker):
+                        chunk_hash = hash_chunk(chunk.text, chunk.metadata)
+                        chunk_ids.append(chunk.id)
+                        chunk_hashes.append(chunk_hash)
+                        if stored.get(chunk.id, None) != chunk_hash:
+                            yield chunk
+
+            index = 0
+            batches = vector_db.iter_chunk_batches(
+                changed_chunks(self.iter_file_docs(item, doc_queue))
+            )
+            while True:
+                start = time.perf_counter()
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                stats.add(len(batch), time.perf_counter() - start)
+                self.put(embed_queue, _Batch(target, index, batch))
+                index += 1
+            self.put(write_queue, _FileEnd(target, index, chunk_ids, chunk_hashes))
+        for _ in range(self.workers):
+            self.put(embed_queue, _DONE)
+
+    def embed_stage(self, embed_queue: queue.Queue, write_queue: queue.Queue):
+        stats = self.stats["embed"]
+        while True:
+            batch = self.get(embed_queue)
+            if batch is _DONE:
+                break
+            start = time.perf_counter()
+            if self.journal is not None:
+                batch.embeddings = self.journal.staged(
+                    batch.target, batch.index, batch.chunks
+                )
+            if batch.embeddings is None:
+                batch.embeddings = self.flow_manager.embed(
+                    [chunk.text for chunk in batch.chunks]
+                )
+                stats.add(len(batch.chunks), time.perf_counter() - start)
+            self.put(write_queue, batch)
+        self.put(write_queue, _DONE)
+
+    def write_stage(
+        self,
+        write_queue: queue.Queue,
+        on_file_done: Callable[[BuildTarget, list[str], list[str]], Any],
+    ):
+        stats = self.stats["write"]
+        files: dict[str, _FileState] = {}
+        finished = 0
+        while finished < self.workers:
+            item = self.get(write_queue)
+            if item is _DONE:
+                finished += 1
+                continue
+            start = time.perf_counter()
+            rel_path = item.target.rel_path
+            if isinstance(item, _FileStart):
+                files[rel_path] = _FileState()
+                continue
+            state = files[rel_path]
+            if isinstance(item, _Batch):
+                if self.journal is None:
+                    self.flow_manager.add_chunks(item.chunks, item.embeddings)
+                    stats.add(len(item.chunks), time.perf_counter() - start)
+                else:
+                    self.journal.stage(
+                        item.target, item.index, item.chunks, item.embeddings
+                    )
+                state.written += 1
+            elif isinstance(item, _FileEnd):
+                state.end = item
+            if state.done:
+                del files[rel_path]
+                end = state.end
+                if self.journal is not None:
+                    self.commit_file(end)
+                else:
+                    self.remove_stale(end)
+                on_file_done(end.target, end.chunk_ids, end.chunk_hashes)
+
+    def remove_stale(self, end: _FileEnd):
+        """
+        Remove chunks of a file no longer there, after the new ones are written.
+        """
+        previous = end.target.previous
+        if previous is None:
+            stored = self.flow_manager.ids_by_rel_path(end.target.rel_path)
+        else:
+            stored = previous.chunk_ids
+        current = set(end.chunk_ids)
+        stale = [one for one in stored if one not in current]
+        if len(stale) != 0:
+            self.flow_manager.remove_ids(stale)
+
+    def stage_embedded(self, write_queue: queue.Queue):
+        """
+        Keep batches embedded but not yet staged when stopped, for resuming.
+        """
+        while True:
+            try:
+                item = write_queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, _Batch) and item.embeddings is not None:
+                self.journal.stage(
+                    item.target, item.index, item.chunks, item.embeddings
+                )
+
+    def commit_file(self, end: _FileEnd):
+        """
+        Update a file in the vector database by its staged batches.
+        New chunks are upserted before stale ones are removed,
+        so a crash in between leaves extra old chunks, never missing ones.
+        """
+        stats = self.stats["write"]
+        start = time.perf_counter()
+        written = 0
+        target = end.target
+        self.journal.writing(target)
+        for chunks, embeddings in self.journal.iter_staged(target.rel_path):
+            self.flow_manager.add_chunks(chunks, embeddings)
+            written += len(chunks)
+        self.remove_stale(end)
+        self.journal.finish(target, end.chunk_ids, end.chunk_hashes)
+        stats.add(written, time.perf_counter() - start)
+
+    def run(
+        self,
+        targets: Iterable[BuildTarget],
+        on_file_done: Callable[[BuildTarget, list[str], list[str]], Any],
+    ):
+        """
+        Ingest targets. `on_file_done(target, chunk_ids, chunk_hashes)` is called
+        from the calling thread once all chunks of a file are written.
+        """
+        self.flow_manager.setup()
+        doc_queue = queue.Queue(self.queue_size)
+        embed_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(
+                target=self.run_stage,
+                args=(self.parse_stage, targets, doc_queue),
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self.run_stage,
+                args=(self.chunk_stage, doc_queue, embed_queue, write_queue),
+                daemon=True,
+            ),
+        ]
+        for _ in range(self.workers):
+            threads.append(
+                threading.Thread(
+                    target=self.run_stage,
+                    args=(self.embed_stage, embed_queue, write_queue),
+                    daemon=True,
+                )
+            )
+        for thread in threads:
+            thread.start()
+        try:
+            self.write_stage(write_queue, on_file_done)
+        except _Stopped:
+            pass
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            if self.journal is not None:
+                self.stage_embedded(write_queue)
+        if self.error is not None:
+            raise self.error
+        return self.stats
@@ -0,0 +1,268 @@
+from array import array
+from dataclasses import dataclass, asdict
+import json
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Iterable
+
+from .manifest import BuildManifest, BuildTarget, FileRecord
+
+
+@dataclass
+class StagedChunk:
+    """
+    A chunk read back from the journal or a snapshot, enough for `add_chunks`.
+    """
+
+    id: str
+    text: str
+    metadata: dict
+
+
+class BuildJournal:
+    """
+    Progress of a build in SQLite, committed as it goes.
+
+    `targets` holds the files of the running build, pending until all their
+    chunks are in the vector database. `batches` stages the embedded chunks
+    of pending files, which are written to the vector database only once
+    the whole file is embedded. Writing a file upserts its new chunks first
+    and removes stale ones last, so an interrupted file may keep extra old
+    chunks until the next build, but never misses any.
+
+    `done` of a target is 0 before its file is written to the vector database,
+    -1 while being written and 1 after.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.db: sqlite3.Connection | None = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            if self.db is not None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            # survives the process crashing, which is what it is for
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS targets ("
+                "rel_path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, content_hash TEXT NOT NULL, "
+                "done INTEGER NOT NULL DEFAULT 0, chunk_ids TEXT, chunk_hashes TEXT, "
+                "previous TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "rel_path TEXT NOT NULL, content_hash TEXT NOT NULL, "
+                "idx INTEGER NOT NULL, chunks TEXT NOT NULL, vectors BLOB NOT NULL, "
+                "PRIMARY KEY (rel_path, idx))"
+            )
+            db.commit()
+            self.db = db
+
+    def close(self):
+        with self.lock:
+            if self.db is None:
+                return
+            self.db.close()
+            self.db = None
+
+    def exists(self):
+        return self.path.exists()
+
+    def interrupted(self) -> list[str]:
+        """
+        Files of the last build never finished.
+        """
+        if not self.exists():
+            return []
+        self.connect()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT rel_path FROM targets WHERE done = 0 ORDER BY rel_path"
+            ).fetchall()
+        return [one for (one,) in rows]
+
+    def recover(self, manifest: BuildManifest, find_hashes) -> int:
+        """
+        Bring the manifest up to date with the last build.
+        Finished files are recorded if `find_hashes` finds their chunks stored,
+        which may not be the case if the vector database was not flushed.
+        Files never written get their previous records back,
+        and the other files are left to be built again as a whole.
+
+        :param find_hashes: ids to hashes of chunks stored in the vector database
+        :return: number of files to be built again
+        """
+        if not self.exists():
+            return 0
+        self.connect()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT rel_path, size, mtime_ns, content_hash, done, "
+                "chunk_ids, chunk_hashes, previous FROM targets"
+            ).fetchall()
+        again = 0
+        for rel_path, size, mtime_ns, content_hash, done, *rest in rows:
+            ids, hashes, previous = rest
+            if done == 1:
+                ids, hashes = json.loads(ids), json.loads(hashes)
+                if find_hashes(ids) == dict(zip(ids, hashes)):
+                    target = BuildTarget(
+                        Path(rel_path), rel_path, size, mtime_ns, content_hash
+                    )
+                    manifest.record(target, ids, hashes)
+                    continue
+            again += 1
+            if done == 0 and previous is not None:
+                manifest.files[rel_path] = FileRecord(**json.loads(previous))
+            else:
+                manifest.remove(rel_path)
+        return again
+
+    def begin(self, targets: list[BuildTarget], resume=False):
+        """
+        Start a build of targets. Staged batches of the same content are kept
+        for resuming, and the others are dropped.
+        """
+        self.connect()
+        with self.lock:
+            self.db.execute("DELETE FROM targets")
+            self.db.executemany(
+                "INSERT INTO targets "
+                "(rel_path, size, mtime_ns, content_hash, previous) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        one.rel_path,
+                        one.size,
+                        one.mtime_ns,
+                        one.content_hash,
+                        None
+                        if one.previous is None
+                        else json.dumps(asdict(one.previous), ensure_ascii=False),
+                    )
+                    for one in targets
+                ],
+            )
+            if resume:
+                self.db.execute(
+                    "DELETE FROM batches WHERE NOT EXISTS (SELECT 1 FROM targets "
+                    "WHERE targets.rel_path = batches.rel_path "
+                    "AND targets.content_hash = batches.content_hash)"
+                )
+            else:
+                self.db.execute("DELETE FROM batches")
+            self.db.commit()
+
+    @staticmethod
+    def dump_chunks(chunks) -> str:
+        return json.dumps(
+            [
+                {"id": one.id, "text": one.text, "metadata": dict(one.metadata)}
+                for one in chunks
+            ],
+            ensure_ascii=False,
+        )
+
+    def stage(self, target: BuildTarget, index: int, chunks, embeddings):
+        rows = array("f")
+        for vector in embeddings:
+            rows.extend(vector)
+        self.connect()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO batches "
+                "(rel_path, content_hash, idx, chunks, vectors) VALUES (?, ?, ?, ?, ?)",
+                (
+                    target.rel_path,
+                    target.content_hash,
+                    index,
+                    self.dump_chunks(chunks),
+                    rows.tobytes(),
+                ),
+            )
+            self.db.commit()
+
+    @staticmethod
+    def load_vectors(data: bytes, count: int) -> list[list[float]]:
+        rows = array("f")
+        rows.frombytes(data)
+        size = len(rows) // max(count, 1)
+        return [rows[i * size : (i + 1) * size].tolist() for i in range(count)]
+
+    def staged(self, target: BuildTarget, index: int, chunks) -> list | None:
+        """
+        Embeddings of a batch staged before, if its chunks are the same.
+        """
+        self.connect()
+        with self.lock:
+            found = self.db.execute(
+                "SELECT chunks, vectors FROM batches "
+                "WHERE rel_path = ? AND content_hash = ? AND idx = ?",
+                (target.rel_path, target.content_hash, index),
+            ).fetchone()
+        if found is None or found[0] != self.dump_chunks(chunks):
+            return None
+        return self.load_vectors(found[1], len(chunks))
+
+    def iter_staged(self, rel_path: str) -> Iterable[tuple[list, list]]:
+        """
+        Staged chunks and embeddings of a file, batch by batch.
+        """
+        self.connect()
+        with self.lock:
+            indices = self.db.execute(
+                "SELECT idx FROM batches WHERE rel_path = ? ORDER BY idx",
+                (rel_path,),
+            ).fetchall()
+        for (index,) in indices:
+            with self.lock:
+                chunks, vectors = self.db.execute(
+                    "SELECT chunks, vectors FROM batches "
+                    "WHERE rel_path = ? AND idx = ?",
+                    (rel_path, index),
+                ).fetchone()
+            chunks = [StagedChunk(**one) for one in json.loads(chunks)]
+            yield chunks, self.load_vectors(vectors, len(chunks))
+
+    def writing(self, target: BuildTarget):
+        """
+        Mark a file as being written to the vector database.
+        """
+        self.connect()
+        with self.lock:
+            self.db.execute(
+                "UPDATE targets SET done = -1 WHERE rel_path = ?", (target.rel_path,)
+            )
+            self.db.commit()
+
+    def finish(self, target: BuildTarget, chunk_ids: list[str], chunk_hashes):
+        self.connect()
+        with self.lock:
+            self.db.execute(
+                "UPDATE targets SET done = 1, chunk_ids = ?, chunk_hashes = ? "
+                "WHERE rel_path = ?",
+                (
+                    json.dumps(chunk_ids, ensure_ascii=False),
+                    json.dumps(list(chunk_hashes)),
+                    target.rel_path,
+                ),
+            )
+            self.db.execute(
+                "DELETE FROM batches WHERE rel_path = ?", (target.rel_path,)
+            )
+            self.db.commit()
+
+    def clear(self):
+        """
+        Forget a build whose results are in the manifest.
+        """
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            self.path.with_name(self.path.name + suffix).unlink(missing_ok=True)
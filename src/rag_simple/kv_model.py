@@ -60,6 +60,10 @@ class KVModel:
     def __init_subclass__(cls, /, **kwargs):
         super().__init_subclass__(**kwargs)
         cls.fields = {}
+        # inherit fields of parent models
+        for base in reversed(cls.__bases__):
+            if issubclass(base, KVModel):
+                cls.fields.update(base.fields)
         for key, field in cls.__dict__.items():
             if isinstance(field, Field):
                 cls.fields[key] = field
@@ -1,5 +1,5 @@
 from .base import LLMAgentConfig, LLMAgent
-from .loader import LLMAgentLoader
+from .loader import LLMAgentLoader, get_agent_class, register_agent
 from .llm import BaseLLM, LLM, LLMConfig
 
 
@@ -7,7 +7,20 @@ __all__ = [
     "LLMAgentConfig",
     "LLMAgent",
     "LLMAgentLoader",
+    "get_agent_class",
+    "register_agent",
     "BaseLLM",
     "LLM",
     "LLMConfig",
+    "StubAgent",
+    "StubAgentConfig",
 ]
+
+
+def __getattr__(name):
+    # agents import their dependencies only when used
+    if name == "StubAgent":
+        return get_agent_class("stub")
+    if name == "StubAgentConfig":
+        return get_agent_class("stub").config_class
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,4 @@
-from typing import Iterable
+from typing import AsyncIterator, Iterable
 
 from ..kv_model import KVModel, Field
 from ..prompt import Prompt
@@ -8,9 +8,35 @@ class LLMAgentConfig(KVModel, Field):
     api_url: str = Field(default="http://localhost:11434")
     model_dir: str = Field(default="")
     headers: str = Field(default_factory=lambda: {"X-Some-Header": "some_secret"})
+    # how long a model stays loaded after a request, e.g., "30m" or -1 for ever,
+    # empty for the server default
+    keep_alive: str = Field(default="")
+    # request options, e.g., num_ctx
+    options: dict = Field(default_factory=dict)
+    # overrides of keep_alive and options for each model, e.g.,
+    # [models."deepseek-r1:7b"] keep_alive = "1h"
+    models: dict = Field(default_factory=dict)
+
+    def request_args(self, model) -> dict:
+        """
+        keep_alive and options of requests to a model, when set.
+        """
+        override = self.models.get(model, {})
+        keep_alive = override.get("keep_alive", self.keep_alive)
+        options = dict(self.options)
+        options.update(override.get("options", {}))
+        args = {}
+        if keep_alive != "":
+            args["keep_alive"] = keep_alive
+        if len(options) != 0:
+            args["options"] = options
+        return args
 
 
 class LLMAgent:
+    # the configuration model in agents/{name}.toml
+    config_class = LLMAgentConfig
+
     def __init__(self, config: LLMAgentConfig):
         self.config = config
 
@@ -25,3 +51,32 @@ class LLMAgent:
 
     def chat(self, model, messages: Prompt) -> Iterable[str]:
         pass
+
+    def warm_up(self, model, task):
+        """
+        Load a model before the first real request.
+
+        :param task: embed or chat
+        """
+        pass
+
+    # asyncio is slow to import, and always loaded by the time these run
+
+    async def aembed(self, model, texts: list[str]) -> list[list[float]]:
+        import asyncio
+
+        return await asyncio.to_thread(self.embed, model, texts)
+
+    async def achat(self, model, messages: Prompt) -> AsyncIterator[str]:
+        """
+        By default, run the synchronous stream in worker threads.
+        """
+        import asyncio
+
+        iterator = iter(self.chat(model, messages))
+        end = object()
+        while True:
+            content = await asyncio.to_thread(next, iterator, end)
+            if content is end:
+                break
+            yield content
@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Callable
+
+from ..kv_model import KVModel, Field
+from ..tracing import BatchBuckets, metrics
+
+
+class EmbedBatchConfig(KVModel):
+    # coalesce concurrent embed calls into one request
+    enabled: bool = Field(default=False)
+    # texts of one request
+    max_batch: int = Field(default=64)
+    # how long the first call waits for others, in milliseconds
+    max_wait_ms: float = Field(default=5.0)
+    # requests in flight
+    workers: int = Field(default=1)
+
+
+@dataclass
+class PendingEmbed:
+    texts: list[str]
+    enqueued: float = field(default_factory=time.perf_counter)
+    done: threading.Event = field(default_factory=threading.Event)
+    result: list[list[float]] | None = None
+    error: BaseException | None = None
+
+
+class BatchingEmbedder:
+    """
+    Coalesce embed calls from many threads.
+
+    A collector thread takes pending calls until there are `max_batch` texts
+    or the first one has waited `max_wait_ms`, embeds them in one request,
+    and hands each caller its slice. Calls larger than `max_batch` go alone.
+    While all workers are busy, calls keep piling up into a larger batch.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[list[str]], list[list[float]]],
+        config: EmbedBatchConfig = None,
+    ):
+        if config is None:
+            config = EmbedBatchConfig()
+        self.embed_func = embed
+        self.config = config
+        self.pending: list[PendingEmbed] = []
+        self.condition = threading.Condition()
+        self.slots = threading.Semaphore(max(1, config.workers))
+        self.executor = ThreadPoolExecutor(
+            max(1, config.workers), thread_name_prefix="embed-batch"
+        )
+        self.collector: threading.Thread | None = None
+        self.closed = False
+
+    def start(self):
+        # under the condition
+        if self.collector is None:
+            self.collector = threading.Thread(
+                target=self.collect, name="embed-batching", daemon=True
+            )
+            self.collector.start()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.collector is not None:
+            self.collector.join()
+            self.collector = None
+        self.executor.shutdown()
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        if len(texts) == 0:
+            return []
+        one = PendingEmbed(list(texts))
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("the embedder is closed")
+            self.pending.append(one)
+            self.start()
+            self.condition.notify_all()
+        one.done.wait()
+        if one.error is not None:
+            raise one.error
+        return one.result
+
+    def pending_texts(self):
+        return sum(len(one.texts) for one in self.pending)
+
+    def take_batch(self) -> list[PendingEmbed] | None:
+        """
+        Wait for a batch, None when closed.
+        """
+        max_batch = max(1, self.config.max_batch)
+        with self.condition:
+            while len(self.pending) == 0:
+                if self.closed:
+                    return None
+                self.condition.wait()
+            deadline = self.pending[0].enqueued + self.config.max_wait_ms / 1000
+            while self.pending_texts() < max_batch and not self.closed:
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    break
+                self.condition.wait(left)
+            batch = [self.pending.pop(0)]
+            size = len(batch[0].texts)
+            while (
+                len(self.pending) > 0 and size + len(self.pending[0].texts) <= max_batch
+            ):
+                size += len(self.pending[0].texts)
+                batch.append(self.pending.pop(0))
+            return batch
+
+    def collect(self):
+        while True:
+            # wait for a free worker first, so that calls pile up meanwhile
+            self.slots.acquire()
+            batch = self.take_batch()
+            if batch is None:
+                self.slots.release()
+                return
+            self.executor.submit(self.run_batch, batch)
+
+    def run_batch(self, batch: list[PendingEmbed]):
+        try:
+            now = time.perf_counter()
+            texts = []
+            for one in batch:
+                metrics.observe("embed.batch.queue_wait", now - one.enqueued)
+                texts.extend(one.texts)
+            metrics.observe(
+                "embed.batch.size", len(texts), buckets=BatchBuckets, unit="texts"
+            )
+            try:
+                embeddings = self.embed_func(texts)
+            except BaseException as err:
+                for one in batch:
+                    one.error = err
+                    one.done.set()
+                return
+            start = 0
+            for one in batch:
+                one.result = embeddings[start : start + len(one.texts)]
+                start += len(one.texts)
+                one.done.set()
+        finally:
+            self.slots.release()
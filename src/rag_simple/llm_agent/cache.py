@@ -0,0 +1,162 @@
+from array import array
+import hashlib
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from ..kv_model import KVModel, Field
+
+
+class EmbedCacheConfig(KVModel):
+    enabled: bool = Field(default=True)
+    # eviction, by the number of vectors and by the last access
+    max_entries: int = Field(default=1_000_000)
+    max_age_days: float = Field(default=90.0)
+
+
+class EmbeddingCache:
+    """
+    A content-addressed embedding cache stored in SQLite.
+
+    Vectors are keyed by (agent, model, size, text) hashes
+    and stored as packed float32. Access times of hits are written
+    in batches, with the next write or eviction.
+    """
+
+    # pending access times written at once
+    MaxTouched = 1000
+
+    def __init__(self, path: Path, max_entries=1_000_000, max_age_days=90.0):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.db: sqlite3.Connection | None = None
+        self.lock = threading.Lock()
+        self.touched: dict[bytes, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(agent: str, model: str, size: int, text: str) -> bytes:
+        digest = hashlib.sha256()
+        for part in (agent, model, str(size), text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.digest()
+
+    def connect(self):
+        with self.lock:
+            if self.db is not None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key BLOB PRIMARY KEY, vector BLOB NOT NULL, accessed REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings(accessed)"
+            )
+            db.commit()
+            self.db = db
+
+    def close(self):
+        if self.db is None:
+            return
+        self.evict()
+        with self.lock:
+            self.db.close()
+            self.db = None
+
+    def get_many(self, agent: str, model: str, size: int, texts: list[str]) -> list:
+        """
+        :return: cached vectors in the order of texts, None for misses
+        """
+        self.connect()
+        keys = [self.make_key(agent, model, size, text) for text in texts]
+        found = {}
+        with self.lock:
+            # stay below the sqlite variable limit
+            for start in range(0, len(keys), 500):
+                part = keys[start : start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self.db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                )
+                found.update(rows)
+            now = time.time()
+            self.touched.update((key, now) for key in found)
+            if len(self.touched) >= self.MaxTouched:
+                self.write_touched()
+                self.db.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        result = []
+        for key in keys:
+            blob = found.get(key, None)
+            if blob is None:
+                result.append(None)
+                continue
+            vector = array("f")
+            vector.frombytes(blob)
+            result.append(vector.tolist())
+        return result
+
+    def write_touched(self):
+        """
+        Write pending access times, with the lock held and not committed.
+        """
+        if len(self.touched) == 0:
+            return
+        self.db.executemany(
+            "UPDATE embeddings SET accessed = ? WHERE key = ?",
+            [(now, key) for key, now in self.touched.items()],
+        )
+        self.touched.clear()
+
+    def put_many(self, agent: str, model: str, size: int, texts: list[str], embeddings):
+        self.connect()
+        now = time.time()
+        rows = [
+            (self.make_key(agent, model, size, text), array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, embeddings)
+        ]
+        with self.lock:
+            self.write_touched()
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, accessed) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            self.db.commit()
+
+    def evict(self):
+        """
+        Drop vectors not accessed within `max_age_days`,
+        then the least recently accessed ones beyond `max_entries`.
+        """
+        self.connect()
+        with self.lock:
+            self.write_touched()
+            if self.max_age_days is not None and self.max_age_days > 0:
+                deadline = time.time() - self.max_age_days * 86400
+                self.db.execute(
+                    "DELETE FROM embeddings WHERE accessed < ?", (deadline,)
+                )
+            if self.max_entries is not None and self.max_entries > 0:
+                (count,) = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+                if count > self.max_entries:
+                    self.db.execute(
+                        "DELETE FROM embeddings WHERE key IN ("
+                        "SELECT key FROM embeddings ORDER BY accessed LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+            self.db.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,15 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable
+from typing import AsyncIterator, Iterable
 
 from ..kv_model import KVModel, Field
+from .batching import BatchingEmbedder, EmbedBatchConfig
+from .cache import EmbedCacheConfig, EmbeddingCache
 from .loader import LLMAgentLoader
 from ..prompt import Prompt
+from ..tracing import metrics
 
 
 class EmbedConfig(KVModel):
     agent: str = Field(default="ollama")
     model: str = Field(default="mxbai-embed-large")
     size: int = Field(default=1024)
+    cache: EmbedCacheConfig = EmbedCacheConfig.as_field()
+    batch: EmbedBatchConfig = EmbedBatchConfig.as_field()
 
 
 class ChatConfig(KVModel):
@@ -35,30 +41,139 @@ class BaseLLM:
     def chat(self, messages: Prompt) -> Iterable[str]:
         pass
 
+    def warm_up(self):
+        pass
+
+    async def aembed(self, input_text: list[str]) -> list[list[float]]:
+        pass
+
+    async def achat(self, messages: Prompt) -> AsyncIterator[str]:
+        yield ""
+
 
 class LLM(BaseLLM):
+    EmbedCacheFilename = "embed_cache.sqlite"
+
     def __init__(
-        self, config: LLMConfig, agents_dir: Path, loader_class=LLMAgentLoader
+        self,
+        config: LLMConfig,
+        agents_dir: Path,
+        loader_class=LLMAgentLoader,
+        cache_dir: Path = None,
     ):
         self.config = config
         self.agents_dir = agents_dir
         self.agent_loader = loader_class(agents_dir)
 
+        self.embed_cache: EmbeddingCache | None = None
+        cache_config = self.config.embed.cache
+        if cache_dir is not None and cache_config.enabled:
+            self.embed_cache = EmbeddingCache(
+                Path(cache_dir) / self.EmbedCacheFilename,
+                max_entries=cache_config.max_entries,
+                max_age_days=cache_config.max_age_days,
+            )
+
         self.embedding_agent = self.agent_loader.load_agent_by_name(
             self.config.embed.agent
         )
         self.chatting_agent = self.agent_loader.load_agent_by_name(
             self.config.chat.agent
         )
+        # started by connect
+        self.batcher: BatchingEmbedder | None = None
 
     def connect(self):
         self.agent_loader.connect()
+        if self.config.embed.batch.enabled and self.batcher is None:
+            self.batcher = BatchingEmbedder(self.embed_texts, self.config.embed.batch)
 
     def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
         self.agent_loader.close()
+        if self.embed_cache is not None:
+            self.embed_cache.close()
+
+    def lookup_cache(self, input_text: list[str]):
+        """
+        :return: cached vectors (None for misses) and indices of missing texts
+        """
+        config = self.config.embed
+        # vectors of another size are stale, e.g. after changing the stub dimension
+        result = self.embed_cache.get_many(
+            config.agent, config.model, config.size, input_text
+        )
+        # only embed distinct texts that are not cached
+        missing: dict[str, list[int]] = {}
+        for i, vector in enumerate(result):
+            if vector is None:
+                missing.setdefault(input_text[i], []).append(i)
+        return result, missing
+
+    def fill_cache(self, result, missing: dict[str, list[int]], embeddings):
+        texts = list(missing.keys())
+        config = self.config.embed
+        self.embed_cache.put_many(
+            config.agent, config.model, config.size, texts, embeddings
+        )
+        for text, vector in zip(texts, embeddings):
+            for i in missing[text]:
+                result[i] = vector
+        return result
+
+    def embed_texts(self, input_text: list[str]) -> list[list[float]]:
+        with metrics.span("agent.embed"):
+            return self.embedding_agent.embed(self.config.embed.model, input_text)
+
+    def embed_uncached(self, input_text: list[str]) -> list[list[float]]:
+        if self.batcher is None:
+            return self.embed_texts(input_text)
+        return self.batcher.embed(input_text)
 
     def embed(self, input_text: list[str]) -> list[list[float]]:
-        return self.embedding_agent.embed(self.config.embed.model, input_text)
+        if self.embed_cache is None:
+            return self.embed_uncached(input_text)
+        result, missing = self.lookup_cache(input_text)
+        if len(missing) == 0:
+            return result
+        embeddings = self.embed_uncached(list(missing.keys()))
+        return self.fill_cache(result, missing, embeddings)
 
     def chat(self, messages):
         return self.chatting_agent.chat(self.config.chat.model, messages)
+
+    def warm_up(self):
+        """
+        Load the embedding and chat models concurrently.
+        """
+        with metrics.span("llm.warm_up"), ThreadPoolExecutor(2) as executor:
+            futures = [
+                executor.submit(
+                    self.embedding_agent.warm_up, self.config.embed.model, "embed"
+                ),
+                executor.submit(
+                    self.chatting_agent.warm_up, self.config.chat.model, "chat"
+                ),
+            ]
+            for future in futures:
+                future.result()
+
+    async def aembed(self, input_text: list[str]) -> list[list[float]]:
+        model = self.config.embed.model
+        if self.embed_cache is None:
+            with metrics.span("agent.embed"):
+                return await self.embedding_agent.aembed(model, input_text)
+        import asyncio
+
+        # sqlite calls block, keep them off the event loop
+        result, missing = await asyncio.to_thread(self.lookup_cache, input_text)
+        if len(missing) == 0:
+            return result
+        with metrics.span("agent.embed"):
+            embeddings = await self.embedding_agent.aembed(model, list(missing.keys()))
+        return await asyncio.to_thread(self.fill_cache, result, missing, embeddings)
+
+    def achat(self, messages: Prompt) -> AsyncIterator[str]:
+        return self.chatting_agent.achat(self.config.chat.model, messages)
@@ -1,12 +1,23 @@
 from pathlib import Path
+from ..registry import Registry
 from .base import LLMAgent, LLMAgentConfig
-from .ollama import OllamaAgent
+
+
+agents = Registry("rag_simple.llm_agent", "agent")
+agents.register("ollama", "rag_simple.llm_agent.ollama:OllamaAgent")
+agents.register("stub", "rag_simple.llm_agent.stub:StubAgent")
+
+
+def register_agent(name, target: str | type[LLMAgent]):
+    agents.register(name, target)
+
+
+def get_agent_class(name) -> type[LLMAgent]:
+    return agents.get(name)
 
 
 def get_agent(name, config: LLMAgentConfig) -> LLMAgent:
-    if name == "ollama":
-        return OllamaAgent(config)
-    raise NotImplementedError(f"unknown agent {name}")
+    return get_agent_class(name)(config)
 
 
 class LLMAgentLoader:
@@ -14,13 +25,21 @@ class LLMAgentLoader:
         self.agents_dir = agents_dir
         self.loaded_agents: dict[str, LLMAgent] = {}
 
+    def load_config(self, name) -> LLMAgentConfig:
+        """
+        Read the config file of an agent, written with defaults if absent.
+        """
+        return (
+            get_agent_class(name)
+            .config_class()
+            .from_config_file(self.agents_dir / f"{name}.toml", write_on_absence=True)
+        )
+
     def load_agent_by_name(self, name):
         agent = self.loaded_agents.get(name, None)
         if agent is None:
-            config = LLMAgentConfig().from_config_file(
-                self.agents_dir / f"{name}.toml", write_on_absence=True
-            )
-            agent = get_agent(name, config)
+            agent = get_agent(name, self.load_config(name))
+            self.loaded_agents[name] = agent
         return agent
 
     def connect(self):
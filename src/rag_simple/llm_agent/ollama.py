@@ -1,27 +1,270 @@
-from typing import Iterable
-
-import ollama
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import TYPE_CHECKING, AsyncIterator, Iterable
 
+from ..kv_model import Field
 from ..prompt import Prompt
 from .base import LLMAgent, LLMAgentConfig
+from .pool import Endpoint, EndpointPool
+
+if TYPE_CHECKING:
+    import ollama
+
+
+class OllamaAgentConfig(LLMAgentConfig):
+    # more servers with the same models besides api_url,
+    # each request goes to the one with the fewest in flight
+    endpoints: list[str] = Field(default_factory=list)
+    # requests in flight to each server, 0 for no limit
+    max_concurrency: int = Field(default=0)
+    # seconds a server is skipped after failing
+    retry_after: float = Field(default=30.0)
+    # seconds between health checks when there are more servers, 0 to disable
+    health_interval: float = Field(default=10.0)
 
 
 class OllamaAgent(LLMAgent):
-    def __init__(self, config: LLMAgentConfig):
+    """
+    Clients, and the `ollama` package, are loaded on first use.
+    A request failing to reach a server is retried on the others.
+    """
+
+    config_class = OllamaAgentConfig
+    config: OllamaAgentConfig
+    # seconds of a health check
+    HealthTimeout = 5.0
+
+    def __init__(self, config: OllamaAgentConfig):
         super().__init__(config)
-        self.client = ollama.Client(host=config.api_url, headers=config.headers)
+        self.pool = EndpointPool(
+            [config.api_url] + list(config.endpoints),
+            max_concurrency=config.max_concurrency,
+            retry_after=config.retry_after,
+        )
+        self.clients: dict[str, "ollama.Client"] = {}
+        self.async_clients: dict[str, "ollama.AsyncClient"] = {}
+        self.clients_lock = threading.Lock()
+        self.health_stop = threading.Event()
+        self.health_thread: threading.Thread | None = None
+
+    def client_of(self, url, **kwargs) -> "ollama.Client":
+        key = url if len(kwargs) == 0 else (url, tuple(sorted(kwargs.items())))
+        client = self.clients.get(key, None)
+        if client is None:
+            import ollama
+
+            with self.clients_lock:
+                client = self.clients.setdefault(
+                    key, ollama.Client(host=url, headers=self.config.headers, **kwargs)
+                )
+        return client
+
+    def async_client_of(self, url) -> "ollama.AsyncClient":
+        # created on first use, inside the running event loop
+        client = self.async_clients.get(url, None)
+        if client is None:
+            import ollama
+
+            with self.clients_lock:
+                client = self.async_clients.setdefault(
+                    url, ollama.AsyncClient(host=url, headers=self.config.headers)
+                )
+        return client
+
+    @property
+    def client(self) -> "ollama.Client":
+        return self.client_of(self.config.api_url)
+
+    @property
+    def async_client(self) -> "ollama.AsyncClient":
+        return self.async_client_of(self.config.api_url)
+
+    @staticmethod
+    def is_unreachable(err: Exception):
+        import httpx
+
+        return isinstance(err, (ConnectionError, httpx.TransportError))
+
+    def connect(self):
+        if len(self.pool) < 2 or self.config.health_interval <= 0:
+            return
+        if self.health_thread is not None:
+            return
+        self.health_stop.clear()
+        self.health_thread = threading.Thread(
+            target=self.check_health_loop, name="ollama-health", daemon=True
+        )
+        self.health_thread.start()
+
+    def close(self):
+        if self.health_thread is None:
+            return
+        self.health_stop.set()
+        self.health_thread.join()
+        self.health_thread = None
+
+    def check_health(self, endpoint: Endpoint):
+        client = self.client_of(endpoint.url, timeout=self.HealthTimeout)
+        try:
+            client.ps()
+        except Exception:
+            self.pool.set_health(endpoint, False)
+            return
+        self.pool.set_health(endpoint, True)
+
+    def check_health_loop(self):
+        while not self.health_stop.is_set():
+            for endpoint in self.pool.endpoints:
+                self.check_health(endpoint)
+            self.health_stop.wait(self.config.health_interval)
+
+    def request(self, func):
+        """
+        func(client) on the least busy server, or the others when unreachable.
+        """
+        tried = []
+        while True:
+            endpoint = self.pool.acquire(tried)
+            if endpoint is None:
+                raise ConnectionError(f"unable to reach any of {tried}")
+            try:
+                result = func(self.client_of(endpoint.url))
+            except Exception as err:
+                unreachable = self.is_unreachable(err)
+                self.pool.release(endpoint, ok=not unreachable)
+                if not unreachable:
+                    raise
+                tried.append(endpoint.url)
+                continue
+            self.pool.release(endpoint)
+            return result
+
+    async def aacquire(self, tried) -> Endpoint | None:
+        if self.pool.max_concurrency <= 0:
+            return self.pool.acquire(tried)
+        # waiting for room blocks
+        import asyncio
+
+        future = asyncio.ensure_future(asyncio.to_thread(self.pool.acquire, tried))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the thread can not be stopped, so give back what it gets
+            future.add_done_callback(self.release_abandoned)
+            raise
+
+    def release_abandoned(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        endpoint = future.result()
+        if endpoint is not None:
+            self.pool.release(endpoint)
 
     def embed(self, model, texts: list[str]) -> list[list[float]]:
-        resp = self.client.embed(model=model, input=texts)
-        embeddings = resp["embeddings"]
-        return embeddings
+        args = self.config.request_args(model)
+        resp = self.request(
+            lambda client: client.embed(model=model, input=texts, **args)
+        )
+        return resp["embeddings"]
 
     def chat(self, model, messages: Prompt) -> Iterable[str]:
-        stream = self.client.chat(
-            model=model,
-            messages=messages.messages,
-            stream=True,
-        )
+        tried = []
+        while True:
+            endpoint = self.pool.acquire(tried)
+            if endpoint is None:
+                raise ConnectionError(f"unable to reach any of {tried}")
+            ok = True
+            started = False
+            try:
+                stream = self.client_of(endpoint.url).chat(
+                    model=model,
+                    messages=messages.messages,
+                    stream=True,
+                    **self.config.request_args(model),
+                )
+                for chunk in stream:
+                    started = True
+                    yield chunk["message"]["content"]
+                return
+            except Exception as err:
+                ok = not self.is_unreachable(err)
+                # a broken answer can not be taken back
+                if ok or started:
+                    raise
+                tried.append(endpoint.url)
+            finally:
+                self.pool.release(endpoint, ok)
+
+    def warm_up(self, model, task):
+        """
+        Load the model on every server.
+        """
+        args = self.config.request_args(model)
+
+        def run(endpoint: Endpoint):
+            client = self.client_of(endpoint.url)
+            self.pool.acquire_endpoint(endpoint)
+            ok = True
+            try:
+                if task == "embed":
+                    client.embed(model=model, input=["warm up"], **args)
+                    return
+                # no message only loads the model
+                client.chat(model=model, messages=[], **args)
+            except Exception as err:
+                ok = not self.is_unreachable(err)
+                raise
+            finally:
+                self.pool.release(endpoint, ok)
+
+        with ThreadPoolExecutor(len(self.pool)) as executor:
+            for future in [executor.submit(run, one) for one in self.pool.endpoints]:
+                future.result()
+
+    async def aembed(self, model, texts: list[str]) -> list[list[float]]:
+        args = self.config.request_args(model)
+        tried = []
+        while True:
+            endpoint = await self.aacquire(tried)
+            if endpoint is None:
+                raise ConnectionError(f"unable to reach any of {tried}")
+            try:
+                resp = await self.async_client_of(endpoint.url).embed(
+                    model=model, input=texts, **args
+                )
+            except Exception as err:
+                unreachable = self.is_unreachable(err)
+                self.pool.release(endpoint, ok=not unreachable)
+                if not unreachable:
+                    raise
+                tried.append(endpoint.url)
+                continue
+            self.pool.release(endpoint)
+            return resp["embeddings"]
 
-        for chunk in stream:
-            yield chunk["message"]["content"]
+    async def achat(self, model, messages: Prompt) -> AsyncIterator[str]:
+        tried = []
+        while True:
+            endpoint = await self.aacquire(tried)
+            if endpoint is None:
+                raise ConnectionError(f"unable to reach any of {tried}")
+            ok = True
+            started = False
+            try:
+                stream = await self.async_client_of(endpoint.url).chat(
+                    model=model,
+                    messages=messages.messages,
+                    stream=True,
+                    **self.config.request_args(model),
+                )
+                async for chunk in stream:
+                    started = True
+                    yield chunk["message"]["content"]
+                return
+            except Exception as err:
+                ok = not self.is_unreachable(err)
+                if ok or started:
+                    raise
+                tried.append(endpoint.url)
+            finally:
+                self.pool.release(endpoint, ok)
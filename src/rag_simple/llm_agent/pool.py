@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+import threading
+import time
+
+
+@dataclass
+class Endpoint:
+    url: str
+    # requests in flight
+    outstanding: int = 0
+    # skipped until then, after a failure
+    down_until: float = 0.0
+    requests: int = 0
+    failures: int = 0
+
+    def is_up(self, now):
+        return self.down_until <= now
+
+    def dump(self):
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "up": self.is_up(time.monotonic()),
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class EndpointPool:
+    """
+    Spread requests over endpoints by the fewest outstanding requests,
+    at most `max_concurrency` each (0 for no limit).
+
+    An endpoint failing is skipped for `retry_after` seconds,
+    unless all of them are down.
+    """
+
+    def __init__(self, urls: list[str], max_concurrency=0, retry_after=30.0):
+        if len(urls) == 0:
+            raise ValueError("no endpoint")
+        self.endpoints = [Endpoint(url) for url in dict.fromkeys(urls)]
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def has_room(self, endpoint: Endpoint):
+        return self.max_concurrency <= 0 or endpoint.outstanding < self.max_concurrency
+
+    def pick(self, exclude=()) -> Endpoint | None:
+        now = time.monotonic()
+        candidates = [one for one in self.endpoints if one.url not in exclude]
+        if len(candidates) == 0:
+            return None
+        up = [one for one in candidates if one.is_up(now)]
+        if len(up) == 0:
+            # try the one back the soonest rather than fail
+            up = [min(candidates, key=lambda one: one.down_until)]
+        return min(
+            (one for one in up if self.has_room(one)),
+            key=lambda one: (one.outstanding, one.requests),
+            default=None,
+        )
+
+    def acquire(self, exclude=()) -> Endpoint | None:
+        """
+        Wait for an endpoint with room, None when all are excluded.
+        """
+        with self.condition:
+            while True:
+                if all(one.url in exclude for one in self.endpoints):
+                    return None
+                endpoint = self.pick(exclude)
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+                self.condition.wait()
+
+    def acquire_endpoint(self, endpoint: Endpoint):
+        """
+        Wait for room on this endpoint, up or not.
+        """
+        with self.condition:
+            while not self.has_room(endpoint):
+                self.condition.wait()
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+
+    def release(self, endpoint: Endpoint, ok=True):
+        with self.condition:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.down_until = 0.0
+            else:
+                self.mark_down(endpoint)
+            self.condition.notify_all()
+
+    def mark_down(self, endpoint: Endpoint):
+        endpoint.failures += 1
+        endpoint.down_until = time.monotonic() + self.retry_after
+
+    def set_health(self, endpoint: Endpoint, ok: bool):
+        with self.condition:
+            if ok:
+                endpoint.down_until = 0.0
+            elif endpoint.is_up(time.monotonic()):
+                self.mark_down(endpoint)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return [one.dump() for one in self.endpoints]
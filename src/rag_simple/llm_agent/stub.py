@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import AsyncIterator, Iterable
+
+from ..kv_model import Field
+from ..prompt import Prompt
+from .base import LLMAgent, LLMAgentConfig
+
+
+class StubAgentConfig(LLMAgentConfig):
+    dimension: int = Field(default=256)
+    reply: str = Field(default="This is a canned reply from the stub agent.")
+    # simulated latency in seconds
+    embed_latency: float = Field(default=0.0)
+    first_token_latency: float = Field(default=0.0)
+    token_latency: float = Field(default=0.0)
+
+
+def hash_embedding(text: str, dimension: int, salt: str = "") -> list[float]:
+    """
+    A deterministic bag-of-words embedding with the hashing trick,
+    so that texts sharing words are close to each other.
+    """
+    vector = [0.0] * dimension
+    words = re.findall(r"\w+", text.lower())
+    features = words + [f"{one} {another}" for one, another in zip(words, words[1:])]
+    for feature in features:
+        digest = hashlib.blake2b(
+            (salt + feature).encode("utf-8"), digest_size=8
+        ).digest()
+        value = int.from_bytes(digest, "little")
+        sign = 1.0 if value & 1 else -1.0
+        vector[(value >> 1) % dimension] += sign
+    norm = math.sqrt(sum(one * one for one in vector))
+    if norm == 0:
+        return vector
+    return [one / norm for one in vector]
+
+
+class StubAgent(LLMAgent):
+    """
+    An offline agent for tests and benchmarks, without any model.
+    """
+
+    config_class = StubAgentConfig
+    config: StubAgentConfig
+
+    def iter_tokens(self):
+        return re.findall(r"\S+\s*", self.config.reply)
+
+    def embed(self, model, texts: list[str]) -> list[list[float]]:
+        if self.config.embed_latency > 0:
+            time.sleep(self.config.embed_latency)
+        return [hash_embedding(text, self.config.dimension, model) for text in texts]
+
+    def chat(self, model, messages: Prompt) -> Iterable[str]:
+        if self.config.first_token_latency > 0:
+            time.sleep(self.config.first_token_latency)
+        for i, token in enumerate(self.iter_tokens()):
+            if i != 0 and self.config.token_latency > 0:
+                time.sleep(self.config.token_latency)
+            yield token
+
+    async def aembed(self, model, texts: list[str]) -> list[list[float]]:
+        if self.config.embed_latency > 0:
+            await asyncio.sleep(self.config.embed_latency)
+        return [hash_embedding(text, self.config.dimension, model) for text in texts]
+
+    async def achat(self, model, messages: Prompt) -> AsyncIterator[str]:
+        if self.config.first_token_latency > 0:
+            await asyncio.sleep(self.config.first_token_latency)
+        for i, token in enumerate(self.iter_tokens()):
+            if i != 0 and self.config.token_latency > 0:
+                await asyncio.sleep(self.config.token_latency)
+            yield token
@@ -0,0 +1,168 @@
+from dataclasses import dataclass, field, asdict
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+from .scanner import ScannedFile
+
+
+def hash_file(path: Path | str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while True:
+            block = file.read(1 << 20)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_chunk(text: str, metadata) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(text.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(metadata, sort_keys=True, ensure_ascii=False).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class FileRecord:
+    size: int
+    mtime_ns: int
+    content_hash: str
+    chunk_ids: list[str] = field(default_factory=list)
+    # of the text and metadata of each chunk, empty for old records
+    chunk_hashes: list[str] = field(default_factory=list)
+
+    def stored_chunks(self) -> dict[str, str]:
+        """
+        Chunk ids to hashes, if known.
+        """
+        if len(self.chunk_hashes) != len(self.chunk_ids):
+            return {}
+        return dict(zip(self.chunk_ids, self.chunk_hashes))
+
+
+@dataclass
+class BuildTarget:
+    path: Path
+    rel_path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+    # what is stored of the file, None to replace it as a whole
+    previous: FileRecord | None = field(default=None, repr=False, compare=False)
+
+    def __str__(self):
+        return str(self.path)
+
+
+@dataclass
+class BuildPlan:
+    targets: list[BuildTarget] = field(default_factory=list)
+    # files indexed before but no longer existing
+    removed: list[str] = field(default_factory=list)
+    # files whose stat changed but content did not
+    touched: list[BuildTarget] = field(default_factory=list)
+
+
+class BuildManifest:
+    """
+    Per-file records of what has been embedded,
+    i.e., the size, mtime, content hash and chunk ids of each document file.
+    """
+
+    Version = 1
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.files: dict[str, FileRecord] = {}
+
+    def load(self):
+        self.files = {}
+        if not self.path.exists():
+            return self
+        with open(self.path, "r") as file:
+            return self.load_data(json.load(file))
+
+    def load_data(self, data: dict):
+        self.files = {}
+        if data.get("version", None) != self.Version:
+            return self
+        for rel_path, record in data["files"].items():
+            self.files[rel_path] = FileRecord(**record)
+        return self
+
+    def dump(self) -> dict:
+        return {
+            "version": self.Version,
+            "files": {key: asdict(value) for key, value in self.files.items()},
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = self.dump()
+        # write then rename, so a crash never leaves a broken manifest
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.path)
+        return self
+
+    def plan(self, files: Iterable[ScannedFile], run_all=False) -> BuildPlan:
+        """
+        Compare scanned document files with the records.
+        Files are hashed only if their size or mtime changed.
+        """
+        plan = BuildPlan()
+        seen = set()
+        for one in files:
+            path, rel_path, stat = one.path, one.rel_path, one.stat
+            seen.add(rel_path)
+            record = self.files.get(rel_path, None)
+            if (
+                not run_all
+                and record is not None
+                and record.size == stat.st_size
+                and record.mtime_ns == stat.st_mtime_ns
+            ):
+                continue
+            target = BuildTarget(
+                path,
+                rel_path,
+                stat.st_size,
+                stat.st_mtime_ns,
+                hash_file(path),
+                None if run_all else record,
+            )
+            if (
+                not run_all
+                and record is not None
+                and record.content_hash == target.content_hash
+            ):
+                plan.touched.append(target)
+                continue
+            plan.targets.append(target)
+        plan.removed = [one for one in self.files if one not in seen]
+        return plan
+
+    def record(
+        self, target: BuildTarget, chunk_ids: list[str], chunk_hashes: list[str] = ()
+    ):
+        self.files[target.rel_path] = FileRecord(
+            target.size,
+            target.mtime_ns,
+            target.content_hash,
+            list(chunk_ids),
+            list(chunk_hashes),
+        )
+
+    def touch(self, target: BuildTarget):
+        record = self.files[target.rel_path]
+        record.size = target.size
+        record.mtime_ns = target.mtime_ns
+
+    def remove(self, rel_path: str):
+        self.files.pop(rel_path, None)
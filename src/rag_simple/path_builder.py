@@ -1,7 +1,8 @@
 from dataclasses import dataclass
-import os
 from pathlib import Path
 
+from .scanner import DocumentScanner, ScanConfig
+
 
 @dataclass
 class PathBuilder:
@@ -32,8 +33,12 @@ class PathBuilder:
         return self.project_path / "documents"
 
     @property
-    def embeddings_update_file(self) -> Path:
-        return self.embeddings_dir / "update.time"
+    def manifest_file(self) -> Path:
+        return self.embeddings_dir / "manifest.json"
+
+    @property
+    def journal_file(self) -> Path:
+        return self.embeddings_dir / "build_journal.sqlite"
 
     @property
     def agents_dir(self):
@@ -54,30 +59,6 @@ class PathBuilder:
             with open(self.agent_gitignore, "w") as file:
                 file.write("ollama.toml\n")
 
-    # iterate all documents
-    def iter_documents(self, base: Path = None):
-        if base is None:
-            base = self.documents_dir
-        one: Path
-        for one in base.iterdir():
-            if one.is_file():
-                if one.suffix in [".yaml", ".yml", ".toml", ".txt"]:
-                    yield one
-            elif one.is_dir():
-                self.iter_documents(one)
-
-    def touch_embeddings_update(self):
-        self.embeddings_update_file.touch()
-
-    # find outdated documents
-    def iter_build_targets(self, run_all):
-        target_time = None
-        if self.embeddings_update_file.exists():
-            target_time = os.path.getmtime(self.embeddings_update_file)
-        for one in self.iter_documents():
-            if run_all:
-                yield one
-                continue
-            source_time = os.path.getmtime(one)
-            if target_time is None or target_time < source_time:
-                yield one
+    # iterate all documents, recursively
+    def iter_documents(self, config: ScanConfig = None):
+        return DocumentScanner(self.documents_dir, config).scan()
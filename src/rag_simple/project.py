@@ -1,15 +1,28 @@
+from functools import cached_property
+import json
 import os
 from pathlib import Path
+import sys
+import time
 
-import tqdm
-import yaml
+import tomli_w
 
-from .document import DocumentLoader
+from .chunker import ChunkConfig, Chunker
+from .context import ContextConfig, ContextWindow
+from .document import DocumentConfig, DocumentLoader
+from .journal import BuildJournal
 from .kv_model import KVModel, Field
-from .flow_manager import FlowManager
-from .llm_agent import LLM, LLMConfig
+from .flow_manager import (
+    FlowManager,
+    IngestPipeline,
+    PipelineConfig,
+    QueryCacheConfig,
+)
+from .llm_agent import LLM, LLMAgentLoader, LLMConfig
+from .manifest import BuildManifest, hash_chunk
 from .path_builder import PathBuilder
 from .repl import Repl
+from .scanner import ScanConfig
 from .vector_db import VectorDBConfig, load_vector_db
 
 
@@ -27,10 +40,32 @@ class PromptConfig(KVModel):
     )
 
 
+class AskConfig(KVModel):
+    # load models and the index in the background when `ask` starts
+    warm_up: bool = Field(default=False)
+
+
+class ServeConfig(KVModel):
+    host: str = Field(default="127.0.0.1")
+    port: int = Field(default=8765)
+    # load models and the index before taking requests
+    warm_up: bool = Field(default=True)
+    # largest request body in bytes
+    max_body: int = Field(default=1 << 20)
+
+
 class RAGProjectConfig(KVModel):
     llm: LLMConfig = LLMConfig.as_field()
     vector_db: VectorDBConfig = VectorDBConfig.as_field()
     prompt: PromptConfig = PromptConfig.as_field()
+    ask: AskConfig = AskConfig.as_field()
+    serve: ServeConfig = ServeConfig.as_field()
+    documents: DocumentConfig = DocumentConfig.as_field()
+    scan: ScanConfig = ScanConfig.as_field()
+    chunk: ChunkConfig = ChunkConfig.as_field()
+    pipeline: PipelineConfig = PipelineConfig.as_field()
+    query_cache: QueryCacheConfig = QueryCacheConfig.as_field()
+    context: ContextConfig = ContextConfig.as_field()
 
 
 class RAGProject:
@@ -45,17 +80,40 @@ class RAGProject:
             self.load_project_file()
         else:
             self.config: RAGProjectConfig = config
-        self.llm = LLM(self.config.llm, self.paths.agents_dir)
-        self.vector_db = load_vector_db(
-            self.config.vector_db, self.paths.embeddings_dir
+
+    # clients are made on first use, so commands not touching them start fast
+
+    @cached_property
+    def llm(self) -> LLM:
+        return LLM(
+            self.config.llm, self.paths.agents_dir, cache_dir=self.paths.embeddings_dir
         )
-        self.flow_manager: FlowManager = FlowManager(
-            llm=self.llm, vector_db=self.vector_db
+
+    @cached_property
+    def vector_db(self):
+        return load_vector_db(self.config.vector_db, self.paths.embeddings_dir)
+
+    @cached_property
+    def flow_manager(self) -> FlowManager:
+        return FlowManager(
+            llm=self.llm,
+            vector_db=self.vector_db,
+            query_cache=self.config.query_cache,
         )
 
     def write_project_file(self):
         self.config.to_toml(self.paths.project_file)
 
+    def write_agent_configs(self):
+        """
+        Write the default config files of the agents in use, if absent.
+        """
+        loader = LLMAgentLoader(self.paths.agents_dir)
+        for name in dict.fromkeys(
+            [self.config.llm.embed.agent, self.config.llm.chat.agent]
+        ):
+            loader.load_config(name)
+
     def load_project_file(self):
         self.config.from_toml(self.paths.project_file)
 
@@ -86,6 +144,7 @@ class RAGProject:
         # make the instance
         inst = cls(project_path)
         inst.write_project_file()
+        inst.write_agent_configs()
         return inst
 
     @classmethod
@@ -99,7 +158,7 @@ class RAGProject:
     @staticmethod
     def new_doc(path: Path | str, force=False):
         path = Path(path)
-        if path.suffix not in {".toml", ".yaml", ".yml"}:
+        if path.suffix.lower() not in DocumentLoader.Extensions:
             path = Path(str(path) + ".yaml")
 
         if not path.parent.exists():
@@ -110,65 +169,297 @@ class RAGProject:
             print(f"Existing document file {path}.")
             return -1
 
-        with open(path, "w") as file:
-            data = [
-                {
-                    "metadata": {
-                        "role": "system",
-                        "desc": "put some desired meta data",
-                    },
-                    "text": "Example\ntext:\nThis will be held by `system`.\n",
+        data = [
+            {
+                "metadata": {
+                    "role": "system",
+                    "desc": "put some desired meta data",
                 },
-                {
-                    "metadata": {
-                        "role": "system",
-                        "desc": "put some desired meta data",
-                    },
-                    "text": "Another\ndocument.\nNote that YAML uses `--- !tag` to separate documents",
+                "text": "Example\ntext:\nThis will be held by `system`.\n",
+            },
+            {
+                "metadata": {
+                    "role": "system",
+                    "desc": "put some desired meta data",
                 },
-            ]
-            # TODO: write different format with respect to file extension
-            yaml.safe_dump_all(data, file)
+                "text": "Another\ndocument.\nNote that YAML uses `--- !tag` to separate documents",
+            },
+        ]
+        suffix = path.suffix.lower()
+        if suffix == ".toml":
+            with open(path, "wb") as file:
+                tomli_w.dump({"documents": data}, file)
+        elif suffix == ".jsonl":
+            with open(path, "w") as file:
+                for one in data:
+                    file.write(json.dumps(one, ensure_ascii=False) + "\n")
+        elif suffix == ".txt":
+            separator = DocumentConfig().text_separator
+            with open(path, "w") as file:
+                file.write(f"\n{separator}\n".join(one["text"] for one in data))
+        else:
+            import yaml
 
-    def build_db(self, dry_run, run_all):
-        targets = list(self.paths.iter_build_targets(run_all))
-        if len(targets) == 0:
+            with open(path, "w") as file:
+                yaml.safe_dump_all(data, file)
+
+    def recover_build(self, manifest: BuildManifest, journal: BuildJournal):
+        """
+        Take finished files of an interrupted build into the manifest.
+        """
+        if not journal.exists():
             return
+
+        def find_hashes(ids):
+            self.flow_manager.setup()
+            found = self.flow_manager.vector_db.find_by_ids(ids)
+            return {
+                one: hash_chunk(text, metadata)
+                for one, text, metadata in zip(found.ids, found.texts, found.metadatas)
+            }
+
+        again = journal.recover(manifest, find_hashes)
+        if again != 0:
+            print(f"{again} files of an interrupted build will be built again.")
+
+    def build_db(self, dry_run, run_all, resume=False):
+        """
+        :param resume: reuse chunks embedded by an interrupted build
+        """
+        manifest = BuildManifest(self.paths.manifest_file).load()
+        journal = BuildJournal(self.paths.journal_file)
+        self.recover_build(manifest, journal)
+        plan = manifest.plan(self.paths.iter_documents(self.config.scan), run_all)
+        targets = plan.targets
         if dry_run:
             for one in targets:
                 print(one)
+            for one in plan.removed:
+                print(f"removed: {one}")
+            journal.close()
+            return
+        for one in plan.touched:
+            manifest.touch(one)
+        # purge deleted documents
+        for one in plan.removed:
+            self.flow_manager.remove_by_rel_path(one)
+            manifest.remove(one)
+        if len(targets) == 0:
+            self.flow_manager.flush()
+            manifest.save()
+            journal.clear()
             return
-        loader = DocumentLoader(self.paths.documents_dir)
+        # unfinished targets must be rebuilt if interrupted
+        for one in targets:
+            manifest.remove(one.rel_path)
+        manifest.save()
+        journal.begin(targets, resume)
+        loader = DocumentLoader(self.paths.documents_dir, self.config.documents)
+        pipeline = IngestPipeline(
+            self.flow_manager,
+            loader,
+            self.config.pipeline,
+            Chunker(self.config.chunk),
+            journal,
+        )
         # build embedding
-        with tqdm.tqdm(targets) as progress:
-            for one in targets:
-                progress.set_postfix_str(str(one))
-                # do things
-                rel_path = one.relative_to(self.paths.documents_dir)
-                self.flow_manager.remove_by_rel_path(rel_path)
-                self.flow_manager.insert_documents(loader.iter_documents(one))
-                # set progress
-                progress.update()
-            progress.set_postfix_str("done")
-            progress.refresh()
-        self.paths.touch_embeddings_update()
-
-    def retrieve(self, content, limit=5):
-        for knowledge in self.flow_manager.retrieve_text(content, limit=limit):
+        chunks = 0
+        start = time.perf_counter()
+        finished = False
+        import tqdm
+
+        try:
+            with tqdm.tqdm(total=len(targets)) as progress:
+
+                def on_file_done(target, ids, hashes):
+                    nonlocal chunks
+                    manifest.record(target, ids, hashes)
+                    chunks += len(ids)
+                    embedded = pipeline.stats["embed"].items
+                    rate = embedded / max(time.perf_counter() - start, 1e-9)
+                    progress.set_postfix_str(f"{target.rel_path}, {rate:.1f} embeds/s")
+                    progress.update()
+
+                pipeline.run(targets, on_file_done)
+                progress.set_postfix_str("done")
+                progress.refresh()
+            finished = True
+        finally:
+            # keep what has been finished even if interrupted
+            self.flow_manager.flush()
+            manifest.save()
+            if finished:
+                journal.clear()
+            else:
+                journal.close()
+                print("Interrupted, `build --resume` continues.", file=sys.stderr)
+        elapsed = time.perf_counter() - start
+        embedded = pipeline.stats["embed"].items
+        print(
+            f"embedded {embedded} of {chunks} chunks in {elapsed:.2f}s "
+            f"({embedded / max(elapsed, 1e-9):.1f} embeds/s)"
+        )
+        for stage in pipeline.stats.values():
+            print(f"  {stage}")
+        cache = self.llm.embed_cache
+        if cache is not None:
+            print(f"embedding cache: {cache.hits} hits, {cache.misses} misses")
+            cache.evict()
+
+    def retrieve(self, content, limit=5, mode=None):
+        for knowledge in self.flow_manager.retrieve_text(
+            content, limit=limit, mode=mode
+        ):
             print(knowledge)
 
+    @staticmethod
+    def iter_queries(path: Path | str):
+        """
+        Read queries from a text file (one query per line),
+        or a JSONL file of strings or objects with `query` and optional `id`.
+        """
+        path = Path(path)
+        with open(path, "r") as file:
+            for index, line in enumerate(file):
+                line = line.strip()
+                if line == "":
+                    continue
+                if path.suffix != ".jsonl":
+                    yield index, line
+                    continue
+                one = json.loads(line)
+                if isinstance(one, str):
+                    yield index, one
+                    continue
+                yield one.get("id", index), one["query"]
+
+    def retrieve_file(self, path, limit=5, batch_size=None, output=None, mode=None):
+        if output is None:
+            output = sys.stdout
+        if batch_size is None:
+            batch_size = self.config.vector_db.batch_size
+
+        def write_batch(batch):
+            results = self.flow_manager.retrieve_many(
+                [query for _, query in batch],
+                limit=limit,
+                batch_size=batch_size,
+                mode=mode,
+            )
+            for (query_id, query), knowledge in zip(batch, results):
+                line = {
+                    "id": query_id,
+                    "query": query,
+                    "results": [one.dump() for one in knowledge],
+                }
+                output.write(json.dumps(line, ensure_ascii=False) + "\n")
+            output.flush()
+
+        batch = []
+        for one in self.iter_queries(path):
+            batch.append(one)
+            if len(batch) >= batch_size:
+                write_batch(batch)
+                batch = []
+        if len(batch) != 0:
+            write_batch(batch)
+
     def clear(self):
         self.flow_manager.clear_db()
-        self.paths.embeddings_update_file.unlink(missing_ok=True)
+        self.paths.manifest_file.unlink(missing_ok=True)
+
+    def export_snapshot(self, path, dtype="float32"):
+        """
+        Write the vector database to a snapshot directory,
+        to be imported by projects with other engines or on other machines.
+        """
+        from .snapshot import Snapshot
+
+        embed = self.config.llm.embed
+        info = {
+            "engine": self.config.vector_db.engine,
+            "embed": {"agent": embed.agent, "model": embed.model},
+            "chunk": self.config.chunk.dump(),
+        }
+        manifest = BuildManifest(self.paths.manifest_file).load()
+        self.flow_manager.setup()
+        start = time.perf_counter()
+        info = Snapshot(path).export(self.vector_db, info, manifest, dtype)
+        elapsed = time.perf_counter() - start
+        print(f"exported {info['count']} chunks to {path} in {elapsed:.2f}s")
+
+    def import_snapshot(self, path, force=False):
+        """
+        Replace the vector database by a snapshot, without embedding anything.
+
+        :param force: import even if the snapshot was embedded by another model,
+            or its dimension differs from the project's
+        """
+        from .snapshot import Snapshot, SnapshotError
+
+        snapshot = Snapshot(path)
+        info = snapshot.read_info()
+        manifest = snapshot.read_manifest()
+        # nothing is touched before the snapshot is known to fit
+        embed = self.config.llm.embed
+        model = f"{embed.agent}:{embed.model}"
+        theirs = f"{info['embed']['agent']}:{info['embed']['model']}"
+        if theirs != model and not force:
+            raise SnapshotError(
+                f"the snapshot was embedded by {theirs}, but this project uses {model}"
+            )
+        dimension = info["dimension"]
+        if info["count"] != 0 and not force:
+            if dimension != embed.size:
+                raise SnapshotError(
+                    f"the snapshot has {dimension}-d embeddings, "
+                    f"but llm.embed.size is {embed.size}"
+                )
+            self.flow_manager.setup()
+            existing = self.vector_db.any_embedding()
+            if existing is not None and len(existing) != dimension:
+                raise SnapshotError(
+                    f"the snapshot has {dimension}-d embeddings, "
+                    f"but the vector database has {len(existing)}-d ones"
+                )
+        start = time.perf_counter()
+        # an import stopped halfway must not look built
+        self.paths.manifest_file.unlink(missing_ok=True)
+        self.flow_manager.clear_db()
+        BuildJournal(self.paths.journal_file).clear()
+        for chunks, embeddings in snapshot.iter_batches():
+            self.flow_manager.add_chunks(chunks, embeddings)
+        self.flow_manager.flush()
+        # later builds only embed what changed since the snapshot
+        manifest.path = self.paths.manifest_file
+        manifest.save()
+        elapsed = time.perf_counter() - start
+        print(f"imported {info['count']} chunks from {path} in {elapsed:.2f}s")
 
-    def ask(self, question, limit):
-        chatbot = self.flow_manager.chatbot()
+    def chatbot(self, keywords=None, mode=None):
+        """
+        A chatbot with the configured prompt and context window.
+        """
+        chatbot = self.flow_manager.chatbot(keywords, mode)
         chatbot.set_retrieval_prefix(self.config.prompt.retrieval_prefix)
+        chatbot.set_context(ContextWindow(self.config.context))
         chatbot.extend(self.config.prompt.preset)
+        return chatbot
+
+    def ask(self, question, limit, keywords=None, mode=None, warm_up=None):
+        if warm_up is None:
+            warm_up = self.config.ask.warm_up
+        if warm_up:
+            # overlaps with retrieval, or the banner and typing in the REPL
+            self.flow_manager.start_warm_up()
+        chatbot = self.chatbot(keywords, mode)
 
         if question is not None:
             for knowledge in chatbot.retrieve(question, limit):
-                print(f"{knowledge.metadata['role']}: ", repr(knowledge.text.strip()))
+                print(
+                    f"{knowledge.metadata.get('role', 'system')}: ",
+                    repr(knowledge.text.strip()),
+                )
             chatbot.chat(question).print()
             return
 
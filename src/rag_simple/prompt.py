@@ -1,5 +1,5 @@
 from typing import Any, Mapping
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -8,11 +8,21 @@ class Knowledge:
     text: str
     metadata: Mapping[str, Any]
     dist: float
+    # the matched vector, only when fetched for re-ranking
+    embedding: Any = field(default=None, repr=False, compare=False)
 
     def set_prefix(self, prefix):
         self.text = prefix + self.text
         return self
 
+    def dump(self):
+        return {
+            "id": self.id,
+            "text": self.text,
+            "metadata": dict(self.metadata),
+            "dist": self.dist,
+        }
+
     def to_prompt(self):
         return {"role": self.metadata.get("role", "system"), "content": self.text}
 
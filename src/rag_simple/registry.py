@@ -0,0 +1,52 @@
+from importlib import import_module
+
+
+class Registry:
+    """
+    Implementations by name, imported only when resolved.
+
+    Built-in ones are given as "module:attribute" strings,
+    and third-party packages may add more with entry points of `group`, e.g.,
+
+        [project.entry-points."rag_simple.vector_db"]
+        my_engine = "my_package.engine:MyVectorDB"
+    """
+
+    def __init__(self, group: str, kind: str):
+        self.group = group
+        self.kind = kind
+        self.targets: dict[str, str | object] = {}
+        self.entry_points_loaded = False
+
+    def register(self, name: str, target: str | object):
+        """
+        :param target: the implementation, or "module:attribute" to import lazily
+        """
+        self.targets[name] = target
+
+    def load_entry_points(self):
+        from importlib import metadata
+
+        if self.entry_points_loaded:
+            return
+        self.entry_points_loaded = True
+        for entry_point in metadata.entry_points(group=self.group):
+            # built-in ones win
+            self.targets.setdefault(entry_point.name, entry_point.value)
+
+    def names(self) -> list[str]:
+        self.load_entry_points()
+        return sorted(self.targets)
+
+    def get(self, name: str):
+        target = self.targets.get(name, None)
+        if target is None:
+            self.load_entry_points()
+            target = self.targets.get(name, None)
+        if target is None:
+            raise NotImplementedError(f"unknown {self.kind} {name}")
+        if isinstance(target, str):
+            module_name, _, attribute = target.partition(":")
+            target = getattr(import_module(module_name), attribute)
+            self.targets[name] = target
+        return target
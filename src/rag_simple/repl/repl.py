@@ -3,8 +3,11 @@ from .respond import ChatResponder
 
 
 class Repl:
-    def __init__(self, chatbot: Chatbot, default_limit=3):
+    Banner = "Chat with your documents. Use /help to list commands, /exit to quit."
+
+    def __init__(self, chatbot: Chatbot, default_limit=3, banner=Banner):
         self.responder = ChatResponder(chatbot, default_limit)
+        self.banner = banner
 
     @staticmethod
     def read_input():
@@ -27,6 +30,8 @@ class Repl:
                 continue
 
     def loop(self):
+        if self.banner:
+            print(self.banner)
         while True:
             user_input = self.read_valid_input()
             if user_input is None:
@@ -128,7 +128,7 @@ class ChatResponder:
         self.chatbot.chat(text).print()
 
     @router.command("show", desc="Show chat information.").add_arguments(
-        Argument("target", help="what you want to show")
+        Argument("target", help="what you want to show: system, or tokens of each turn")
     )
     def show(self, target):
         if target == "system":
@@ -136,6 +136,11 @@ class ChatResponder:
                 if one["role"] == "system":
                     print(f"system:", repr(one['content']))
             return
+        if target == "tokens":
+            for i, usage in enumerate(self.chatbot.usage):
+                print(f"turn {i + 1}: {usage}")
+            return
+        print(f"unknown target {target}, use `system` or `tokens`")
 
     @router.command("retrieve", desc="Retrieve knowledge.").add_arguments(
         Argument("--limit", "-n", default=1, type=int),
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+import fnmatch
+import os
+from pathlib import Path
+import re
+from typing import Iterable
+
+from .document import DocumentLoader
+from .kv_model import KVModel, Field
+
+
+class ScanConfig(KVModel):
+    # glob patterns in this file under the documents directory are skipped
+    ignore_file: str = Field(default=".ragignore")
+    # whether to enter symlinked directories and read symlinked files,
+    # a directory is entered only once even so
+    follow_symlinks: bool = Field(default=True)
+
+
+@dataclass
+class ScannedFile:
+    # a str, since most files are unchanged and never opened
+    fs_path: str
+    rel_path: str
+    stat: os.stat_result
+
+    @property
+    def path(self) -> Path:
+        return Path(self.fs_path)
+
+
+class IgnorePatterns:
+    """
+    A subset of `.gitignore`: one glob for each line, `#` comments,
+    a trailing `/` matches only directories, and a pattern containing `/`
+    matches the relative path from the documents directory instead of the name.
+    """
+
+    def __init__(self, lines: Iterable[str] = ()):
+        by_name, by_path, dirs_by_name, dirs_by_path = [], [], [], []
+        for line in lines:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            only_dir = line.endswith("/")
+            line = line.rstrip("/")
+            if "/" in line:
+                regex = fnmatch.translate(line.lstrip("/"))
+                (dirs_by_path if only_dir else by_path).append(regex)
+            else:
+                regex = fnmatch.translate(line)
+                (dirs_by_name if only_dir else by_name).append(regex)
+        self.by_name = self.compile(by_name)
+        self.by_path = self.compile(by_path)
+        self.dirs_by_name = self.compile(dirs_by_name)
+        self.dirs_by_path = self.compile(dirs_by_path)
+
+    @staticmethod
+    def compile(regexes: list[str]):
+        if len(regexes) == 0:
+            return None
+        return re.compile("|".join(f"(?:{one})" for one in regexes))
+
+    @classmethod
+    def from_file(cls, path: Path):
+        if not path.is_file():
+            return cls()
+        with open(path, "r") as file:
+            return cls(file)
+
+    def match(self, name: str, rel_path: str, is_dir: bool) -> bool:
+        for regex, value in (
+            (self.by_name, name),
+            (self.by_path, rel_path),
+            (self.dirs_by_name if is_dir else None, name),
+            (self.dirs_by_path if is_dir else None, rel_path),
+        ):
+            if regex is not None and regex.match(value):
+                return True
+        return False
+
+
+class DocumentScanner:
+    """
+    Walk the documents directory with `os.scandir`,
+    reusing the stat results of directory entries.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        config: ScanConfig = None,
+        extensions: Iterable[str] = DocumentLoader.Extensions,
+    ):
+        self.base_dir = Path(base_dir)
+        if config is None:
+            config = ScanConfig()
+        self.config = config
+        self.extensions = frozenset(extensions)
+        self.ignore = IgnorePatterns.from_file(self.base_dir / config.ignore_file)
+
+    def scan(self) -> Iterable[ScannedFile]:
+        follow = self.config.follow_symlinks
+        # (dir path, rel path prefix), visited directories against symlink loops
+        stack = [(str(self.base_dir), "")]
+        visited = set()
+        while len(stack) != 0:
+            dir_path, prefix = stack.pop()
+            try:
+                stat = os.stat(dir_path)
+                if (stat.st_dev, stat.st_ino) in visited:
+                    continue
+                visited.add((stat.st_dev, stat.st_ino))
+                with os.scandir(dir_path) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except FileNotFoundError:
+                continue
+            subdirs = []
+            for entry in entries:
+                rel_path = prefix + entry.name
+                if not follow and entry.is_symlink():
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=follow):
+                        if not self.ignore.match(entry.name, rel_path, True):
+                            subdirs.append((entry.path, rel_path + "/"))
+                        continue
+                    if not entry.is_file(follow_symlinks=follow):
+                        continue
+                    dot = entry.name.rfind(".")
+                    if dot <= 0 or entry.name[dot:].lower() not in self.extensions:
+                        continue
+                    if self.ignore.match(entry.name, rel_path, False):
+                        continue
+                    stat = entry.stat(follow_symlinks=follow)
+                except FileNotFoundError:
+                    # removed while scanning, or a broken symlink
+                    continue
+                yield ScannedFile(entry.path, rel_path, stat)
+            # depth first, in name order
+            stack.extend(reversed(subdirs))
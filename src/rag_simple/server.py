@@ -0,0 +1,294 @@
+from contextlib import contextmanager
+from dataclasses import asdict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import sys
+import threading
+
+from .project import RAGProject, ServeConfig
+from .tracing import metrics
+
+
+class BadRequest(Exception):
+    pass
+
+
+class IndexWatcher:
+    """
+    Reload the vector database once the manifest changes, i.e.,
+    after `build`, `import` or `clear` in another process.
+    Queries run in `reading()`, and a reload waits for running ones.
+    """
+
+    def __init__(self, project: RAGProject):
+        self.project = project
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.reloading = False
+        self.version = self.current()
+
+    def current(self):
+        try:
+            stat = self.project.paths.manifest_file.stat()
+        except FileNotFoundError:
+            return None
+        # the manifest is replaced as a whole when saved
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @contextmanager
+    def reading(self):
+        with self.condition:
+            while self.reloading:
+                self.condition.wait()
+            version = self.current()
+            if version != self.version:
+                self.reloading = True
+                try:
+                    while self.readers != 0:
+                        self.condition.wait()
+                    self.project.flow_manager.reload_index()
+                    self.version = version
+                finally:
+                    self.reloading = False
+                    self.condition.notify_all()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                self.condition.notify_all()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON in and out. `/chat` streams NDJSON with chunked transfer encoding.
+    """
+
+    # keep-alive and chunked responses
+    protocol_version = "HTTP/1.1"
+    server: "RAGServer"
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json({"status": "ok"})
+        elif self.path == "/metrics":
+            self.send_text(metrics.to_prometheus())
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"no such path {self.path}")
+
+    def do_POST(self):
+        route = {
+            "/retrieve": self.handle_retrieve,
+            "/embed": self.handle_embed,
+            "/chat": self.handle_chat,
+        }.get(self.path, None)
+        if route is None:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"no such path {self.path}")
+            return
+        try:
+            route(self.read_json())
+        except BadRequest as err:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(err))
+        except BrokenPipeError:
+            # the client has gone
+            self.close_connection = True
+        except Exception as err:
+            self.log_error("%s failed: %r", self.path, err)
+            self.send_error_json(HTTPStatus.INTERNAL_SERVER_ERROR, str(err))
+
+    def read_json(self) -> dict:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            # the body cannot be skipped
+            self.close_connection = True
+            raise BadRequest("invalid Content-Length")
+        if length > self.server.config.max_body:
+            self.close_connection = True
+            raise BadRequest(f"body larger than {self.server.config.max_body} bytes")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as err:
+            raise BadRequest(f"invalid JSON: {err}")
+        if not isinstance(body, dict):
+            raise BadRequest("expect a JSON object")
+        return body
+
+    @staticmethod
+    def get_texts(body: dict) -> list[str]:
+        texts = body.get("texts", None)
+        if not isinstance(texts, list) or not all(
+            isinstance(one, str) for one in texts
+        ):
+            raise BadRequest("expect `texts`, a list of strings")
+        return texts
+
+    @staticmethod
+    def get_positive(body: dict, key, default):
+        value = body.get(key, default)
+        if value is None and default is None:
+            return None
+        # bool is an int too
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            raise BadRequest(f"expect `{key}`, a positive integer")
+        return value
+
+    @staticmethod
+    def get_options(body: dict) -> dict:
+        """
+        `keywords` and `mode` of retrieval.
+        """
+        keywords = body.get("keywords", None)
+        if keywords is not None and (
+            not isinstance(keywords, list)
+            or not all(isinstance(one, str) for one in keywords)
+        ):
+            raise BadRequest("expect `keywords`, a list of strings")
+        mode = body.get("mode", None)
+        if mode not in (None, "hybrid", "vector", "keyword"):
+            raise BadRequest("expect `mode`, one of hybrid, vector and keyword")
+        return {"keywords": keywords, "mode": mode}
+
+    @staticmethod
+    def get_history(body: dict) -> list[dict]:
+        history = body.get("history", [])
+        if not isinstance(history, list) or not all(
+            isinstance(one, dict)
+            and one.get("role", None) in ("system", "user", "assistant")
+            and isinstance(one.get("content", None), str)
+            for one in history
+        ):
+            raise BadRequest(
+                "expect `history`, a list of {role, content}, "
+                "role being system, user or assistant"
+            )
+        return [{"role": one["role"], "content": one["content"]} for one in history]
+
+    def send_bytes(self, status, data: bytes, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, obj, status=HTTPStatus.OK):
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_bytes(status, data, "application/json")
+
+    def send_text(self, text, status=HTTPStatus.OK):
+        self.send_bytes(status, text.encode("utf-8"), "text/plain; charset=utf-8")
+
+    def send_error_json(self, status, message):
+        self.send_json({"error": message}, status)
+
+    def write_chunk(self, obj):
+        data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def handle_retrieve(self, body: dict):
+        """
+        `{"text": ..., "limit": 5, "keywords": [...], "mode": ...}`
+        for `{"knowledge": [...]}`, or `{"texts": [...], ...}` for `{"results": [[...], ...]}`.
+        """
+        flow_manager = self.server.project.flow_manager
+        limit = self.get_positive(body, "limit", 5)
+        options = self.get_options(body)
+        if "texts" in body:
+            texts = self.get_texts(body)
+            batch_size = self.get_positive(body, "batch_size", None)
+            with self.server.watcher.reading():
+                results = flow_manager.retrieve_many(
+                    texts, limit, batch_size, options["mode"]
+                )
+            self.send_json(
+                {"results": [[one.dump() for one in result] for result in results]}
+            )
+            return
+        text = body.get("text", None)
+        if not isinstance(text, str):
+            raise BadRequest("expect `text` or `texts`")
+        with self.server.watcher.reading():
+            result = flow_manager.retrieve_text(text, limit, **options)
+        self.send_json({"knowledge": [one.dump() for one in result]})
+
+    def handle_embed(self, body: dict):
+        """
+        `{"texts": [...]}` for `{"embeddings": [...]}`.
+        """
+        embeddings = self.server.project.flow_manager.embed(self.get_texts(body))
+        self.send_json({"embeddings": [list(one) for one in embeddings]})
+
+    def handle_chat(self, body: dict):
+        """
+        `{"question": ..., "limit": 3, "keywords": [...], "mode": ..., "history": [...]}`
+        for lines of `{"knowledge": [...]}`, then `{"content": ...}` of each token,
+        and `{"done": true, "usage": {...}}`.
+        """
+        question = body.get("question", None)
+        if not isinstance(question, str):
+            raise BadRequest("expect `question`")
+        history = self.get_history(body)
+        limit = self.get_positive(body, "limit", 3)
+        chatbot = self.server.project.chatbot(**self.get_options(body))
+        chatbot.turns.extend(history)
+        # dumped before the retrieval prefix is added
+        with self.server.watcher.reading():
+            knowledge = [one.dump() for one in chatbot.retrieve(question, limit)]
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.write_chunk({"knowledge": knowledge})
+        try:
+            for content in chatbot.chat(question).iter_message():
+                self.write_chunk({"content": content})
+            self.write_chunk({"done": True, "usage": asdict(chatbot.usage[-1])})
+        except BrokenPipeError:
+            raise
+        except Exception as err:
+            # the status has been sent
+            self.log_error("/chat failed: %r", err)
+            self.write_chunk({"error": str(err)})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class RAGServer(ThreadingHTTPServer):
+    """
+    Serve a project with one warm flow manager, a thread for each connection.
+    The index is reloaded when another process builds or imports the project.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, project: RAGProject, config: ServeConfig = None):
+        if config is None:
+            config = project.config.serve
+        self.project = project
+        self.config = config
+        self.watcher = IndexWatcher(project)
+        super().__init__((config.host, config.port), RequestHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve(self, warm_up=None):
+        if warm_up is None:
+            warm_up = self.config.warm_up
+        if warm_up:
+            self.project.flow_manager.start_warm_up()
+        print(f"Serving on {self.url}", file=sys.stderr)
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
+            self.project.flow_manager.close()
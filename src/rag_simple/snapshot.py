@@ -0,0 +1,157 @@
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from .journal import StagedChunk
+from .manifest import BuildManifest
+from .vector_db.base import BaseVectorDB
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Snapshot:
+    """
+    A vector database in a directory, independent of the engine:
+    `vectors.npy` holds one embedding a row (float32 or float16),
+    `rows.jsonl` the id, text and metadata of each row,
+    `manifest.json` the build manifest,
+    and `snapshot.json` the version and the embedding model.
+
+    `snapshot.json` is written last, so a directory without it is incomplete.
+    """
+
+    Version = 1
+    InfoFilename = "snapshot.json"
+    VectorsFilename = "vectors.npy"
+    RowsFilename = "rows.jsonl"
+    ManifestFilename = "manifest.json"
+    DTypes = ("float32", "float16")
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+
+    @property
+    def info_file(self) -> Path:
+        return self.path / self.InfoFilename
+
+    @property
+    def vectors_file(self) -> Path:
+        return self.path / self.VectorsFilename
+
+    @property
+    def rows_file(self) -> Path:
+        return self.path / self.RowsFilename
+
+    @property
+    def manifest_file(self) -> Path:
+        return self.path / self.ManifestFilename
+
+    def exists(self):
+        return self.info_file.exists()
+
+    def export(
+        self,
+        vector_db: BaseVectorDB,
+        info: dict,
+        manifest: BuildManifest,
+        dtype="float32",
+        batch_size=1024,
+    ) -> dict:
+        """
+        Write everything in `vector_db` and the manifest,
+        with `info` kept in `snapshot.json`.
+
+        :return: the written info
+        """
+        if dtype not in self.DTypes:
+            raise SnapshotError(f"unsupported dtype {dtype}")
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.info_file.unlink(missing_ok=True)
+        # rows are counted while streaming, so vectors go to a raw file first
+        raw_path = self.path / (self.VectorsFilename + ".raw")
+        count = 0
+        dimension = 0
+        with open(self.rows_file, "w") as rows, open(raw_path, "wb") as raw:
+            for found in vector_db.iter_all(batch_size):
+                if len(found.ids) == 0:
+                    continue
+                vectors = np.asarray(found.embeddings, dtype=dtype)
+                dimension = vectors.shape[1]
+                raw.write(np.ascontiguousarray(vectors).tobytes())
+                for one, text, metadata in zip(found.ids, found.texts, found.metadatas):
+                    row = {"id": one, "text": text, "metadata": metadata}
+                    rows.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += len(found.ids)
+        matrix = np.lib.format.open_memmap(
+            self.vectors_file, mode="w+", dtype=dtype, shape=(count, dimension)
+        )
+        if count != 0:
+            matrix[:] = np.memmap(raw_path, dtype=dtype, mode="r").reshape(
+                count, dimension
+            )
+        matrix.flush()
+        del matrix
+        raw_path.unlink()
+        BuildManifest(self.manifest_file).load_data(manifest.dump()).save()
+        info = dict(
+            info, version=self.Version, count=count, dimension=dimension, dtype=dtype
+        )
+        tmp_path = self.info_file.with_name(self.InfoFilename + ".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(info, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.info_file)
+        return info
+
+    def read_info(self) -> dict:
+        if not self.exists():
+            raise SnapshotError(f"no snapshot at {self.path}")
+        with open(self.info_file, "r") as file:
+            info = json.load(file)
+        if info.get("version", None) != self.Version:
+            raise SnapshotError(
+                f"snapshot version {info.get('version', None)} is not supported"
+            )
+        return info
+
+    def read_manifest(self) -> BuildManifest:
+        return BuildManifest(self.manifest_file).load()
+
+    def iter_batches(
+        self, batch_size=1024
+    ) -> Iterable[tuple[list[StagedChunk], np.ndarray]]:
+        """
+        Chunks and their embeddings as float32, batch by batch.
+        """
+        info = self.read_info()
+        vectors = np.load(self.vectors_file, mmap_mode="r")
+        if len(vectors) != info["count"]:
+            raise SnapshotError(
+                f"broken snapshot {self.path}: "
+                f"{len(vectors)} vectors for {info['count']} rows"
+            )
+        rows = 0
+        chunks = []
+        with open(self.rows_file, "r") as file:
+            for line in file:
+                chunks.append(StagedChunk(**json.loads(line)))
+                rows += 1
+                if rows > len(vectors):
+                    break
+                if len(chunks) == batch_size:
+                    yield (
+                        chunks,
+                        np.asarray(vectors[rows - len(chunks) : rows], np.float32),
+                    )
+                    chunks = []
+        if rows != len(vectors):
+            raise SnapshotError(
+                f"broken snapshot {self.path}: "
+                f"{len(vectors)} vectors for more or less rows"
+            )
+        if len(chunks) != 0:
+            yield chunks, np.asarray(vectors[rows - len(chunks) : rows], np.float32)
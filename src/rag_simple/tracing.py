@@ -0,0 +1,199 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import inspect
+import json
+import math
+import re
+import threading
+import time
+
+
+# upper bounds of latency buckets, in seconds
+LatencyBuckets = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+RateBuckets = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+BatchBuckets = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+TokenBuckets = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+
+
+class Histogram:
+    def __init__(self, name, buckets=LatencyBuckets, unit="seconds"):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.unit = unit
+        # the last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimated by the upper bound of the bucket.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def dump(self):
+        return {
+            "unit": self.unit,
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                str(bound): count
+                for bound, count in zip(self.buckets + (math.inf,), self.counts)
+            },
+        }
+
+
+class Metrics:
+    """
+    Process-wide histograms of hot paths. Disabled by default,
+    so that spans cost one attribute lookup.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms: dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def histogram(self, name, buckets=LatencyBuckets, unit="seconds") -> Histogram:
+        histogram = self.histograms.get(name, None)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(
+                    name, Histogram(name, buckets, unit)
+                )
+        return histogram
+
+    def observe(self, name, value, buckets=LatencyBuckets, unit="seconds"):
+        if not self.enabled:
+            return
+        self.histogram(name, buckets, unit).observe(value)
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def traced(self, name):
+        """
+        Time a function. For generators, only the time spent inside counts.
+        """
+
+        def decorator(func):
+            if inspect.isgeneratorfunction(func):
+
+                @wraps(func)
+                def wrapped_generator(*args, **kwargs):
+                    if not self.enabled:
+                        return (yield from func(*args, **kwargs))
+                    generator = func(*args, **kwargs)
+                    elapsed = 0.0
+                    try:
+                        while True:
+                            start = time.perf_counter()
+                            try:
+                                item = next(generator)
+                            except StopIteration as err:
+                                elapsed += time.perf_counter() - start
+                                return err.value
+                            elapsed += time.perf_counter() - start
+                            yield item
+                    finally:
+                        self.observe(name, elapsed)
+
+                return wrapped_generator
+
+            if inspect.iscoroutinefunction(func):
+
+                @wraps(func)
+                async def wrapped_coroutine(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+
+                return wrapped_coroutine
+
+            @wraps(func)
+            def wrapped(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapped
+
+        return decorator
+
+    def dump(self):
+        return {
+            name: histogram.dump()
+            for name, histogram in sorted(self.histograms.items())
+        }
+
+    def to_json(self):
+        return json.dumps(self.dump(), indent=2)
+
+    def to_prometheus(self, prefix="rag_simple"):
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            metric = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{name}")
+            if histogram.unit is not None:
+                metric += f"_{histogram.unit}"
+            lines.append(f"# TYPE {metric} histogram")
+            total = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                total += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {total}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+traced = metrics.traced
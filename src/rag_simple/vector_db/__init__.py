@@ -1,7 +1,7 @@
 from pathlib import Path
 
+from ..registry import Registry
 from .base import BaseVectorDB, VectorDB, VectorDBConfig
-from .chroma_db import ChromeVectorDB
 
 
 __all__ = [
@@ -9,11 +9,34 @@ __all__ = [
     "VectorDB",
     "VectorDBConfig",
     "ChromeVectorDB",
+    "NumpyVectorDB",
+    "get_vector_db_class",
     "load_vector_db",
+    "register_vector_db",
 ]
 
 
+engines = Registry("rag_simple.vector_db", "vector database")
+engines.register("chroma", "rag_simple.vector_db.chroma_db:ChromeVectorDB")
+engines.register("numpy", "rag_simple.vector_db.numpy_db:NumpyVectorDB")
+
+
+def register_vector_db(name, target: str | type[BaseVectorDB]):
+    engines.register(name, target)
+
+
+def get_vector_db_class(name) -> type[BaseVectorDB]:
+    return engines.get(name)
+
+
 def load_vector_db(config: VectorDBConfig, embeddings_dir: Path):
-    if config.engine == "chroma":
-        return ChromeVectorDB(config, embeddings_dir)
-    raise NotImplementedError(f"unknown vector database {config.engine}")
+    return get_vector_db_class(config.engine)(config, embeddings_dir)
+
+
+def __getattr__(name):
+    # engines import their dependencies only when used
+    if name == "ChromeVectorDB":
+        return get_vector_db_class("chroma")
+    if name == "NumpyVectorDB":
+        return get_vector_db_class("numpy")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,35 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import List, Iterable, Any, Mapping
 from pathlib import Path
 
-from ..document import Document
+from ..chunker import Chunker
+from ..document import Document, DocumentSentence
 from ..kv_model import KVModel, Field
 from ..prompt import Knowledge
+from ..tracing import traced
+from .keyword import KeywordIndex
+
+
+Chunk = Document | DocumentSentence
+
+
+def iter_batches(chunks: Iterable[Chunk], max_size: int, max_chars: int):
+    """
+    Group chunks into batches limited by count and by total characters.
+    A single chunk longer than `max_chars` still makes its own batch.
+    """
+    batch = []
+    chars = 0
+    for chunk in chunks:
+        size = len(chunk.text)
+        if len(batch) > 0 and (len(batch) >= max_size or chars + size > max_chars):
+            yield batch
+            batch = []
+            chars = 0
+        batch.append(chunk)
+        chars += size
+    if len(batch) > 0:
+        yield batch
 
 
 @dataclass
@@ -31,75 +56,331 @@ class BaseVectorDB:
     def close(self):
         pass
 
+    def flush(self):
+        pass
+
     def clear(self):
         pass
 
     def remove_by_rel_path(self, rel_path: str | Path):
         pass
 
-    def insert_documents(self, docs: Iterable[Document], embed):
+    def remove_ids(self, ids: list[str]):
+        pass
+
+    def ids_by_rel_path(self, rel_path: str | Path) -> list[str]:
+        """
+        Ids of all chunks stored of a file.
+        """
+        return []
+
+    def insert_documents(
+        self, docs: Iterable[Document], embed, chunker: Chunker = None
+    ) -> list[str]:
+        pass
+
+    def add_chunks(self, chunks: list[Chunk], embeddings: list[list[float]]):
+        pass
+
+    def any_embedding(self):
+        """
+        A stored embedding, None if empty.
+        """
+        pass
+
+    def warm_up(self):
         pass
 
-    def query_embeddings(self, embeddings, where, n_results) -> QueryResult:
+    def query_embeddings(
+        self, embeddings, where, n_results, with_embeddings=False
+    ) -> QueryResult:
         pass
 
     def find_by_ids(self, ids) -> FindResult:
         pass
 
-    def retrieve(self, embedding, *, limit=5) -> Iterable[Knowledge]:
+    def iter_all(self, batch_size=1024) -> Iterable[FindResult]:
+        """
+        Everything stored, with embeddings, batch by batch.
+        """
+        return iter(())
+
+    @traced("vector_db.search_diverse")
+    def search_diverse(self, embeddings, limit=5) -> list[list[Knowledge]]:
+        """
+        Over-fetch documents and sentences with their embeddings,
+        and keep `2 * limit` of them by maximal marginal relevance,
+        as many as documents and those of sentences without it.
+        """
+        # numpy is only needed here
+        from .mmr import maximal_marginal_relevance
+
+        n_results = limit * max(1, self.mmr_overfetch)
+        docs = self.search_docs(embeddings, n_results, with_embeddings=True)
+        escapings = [[knowledge.id for knowledge in one] for one in docs]
+        sentences = self.search_sentences(
+            embeddings, n_results, escapings, with_embeddings=True
+        )
+        result = []
+        for embedding, one, another in zip(embeddings, docs, sentences):
+            candidates = [
+                knowledge
+                for knowledge in one + another
+                if knowledge.embedding is not None
+            ]
+            picked = maximal_marginal_relevance(
+                embedding,
+                [knowledge.embedding for knowledge in candidates],
+                2 * limit,
+                self.mmr_lambda,
+            )
+            result.append([replace(candidates[i], embedding=None) for i in picked])
+        return result
+
+    def retrieve(
+        self, embedding, *, limit=5, text=None, mode=None
+    ) -> Iterable[Knowledge]:
+        pass
+
+    def retrieve_many(
+        self, embeddings, *, limit=5, texts=None, mode=None
+    ) -> list[list[Knowledge]]:
         pass
 
 
 class VectorDBSearch(BaseVectorDB):
-    def retrieve_one(self, embedding, escaping=None):
-        if escaping is None:
-            escaping = []
-        where = None
-        if len(escaping) != 0:
-            where = {"doc_id": {"$nin": escaping}}
-        results = self.query_embeddings(embeddings=embedding, n_results=1, where=where)
-        metadata = results.metadatas[0]
-        if len(metadata) == 0:
-            return None
-        metadata = metadata[0]
-        data_id = results.ids[0][0]
-        text = results.texts[0][0]
-        dist = results.distances[0][0]
-        doc_id = metadata["doc_id"]
-        if metadata["sentence_index"] != 0:
-            results = self.find_by_ids([f"{doc_id}|0"])
-            data_id = results.ids[0]
-            text = results.texts[0]
-            metadata = results.metadatas[0]
-        return doc_id, data_id, text, metadata, dist
+    # candidates fetched for each wanted document when searching sentences
+    sentence_overfetch = 4
+    keywords: KeywordIndex | None = None
+    # hybrid, vector or keyword
+    retrieval_mode = "vector"
+    # the constant of reciprocal rank fusion
+    rrf_k = 60
+    # maximal marginal relevance re-ranking, see RetrievalConfig
+    mmr = False
+    mmr_lambda = 0.7
+    mmr_overfetch = 3
+
+    def resolve_mode(self, mode=None) -> str:
+        """
+        The retrieval mode in effect, vector only without a keyword index.
+        """
+        if mode is None:
+            mode = self.retrieval_mode
+        if mode not in ("hybrid", "vector", "keyword"):
+            raise ValueError(f"unknown retrieval mode {mode}")
+        if self.keywords is None:
+            return "vector"
+        return mode
+
+    @staticmethod
+    def embeddings_of(results: QueryResult, which, wanted=True):
+        """
+        Embeddings of the hits of one query, None for each if not fetched.
+        """
+        if not wanted or results.embeddings is None or len(results.embeddings) <= which:
+            return [None] * len(results.ids[which])
+        found = results.embeddings[which]
+        if found is None or len(found) != len(results.ids[which]):
+            return [None] * len(results.ids[which])
+        return found
+
+    @classmethod
+    def pick_by_doc(
+        cls, results: QueryResult, which, limit, escaping, with_embeddings=False
+    ):
+        """
+        Keep the best hit of each document not in `escaping`, by distance.
+        """
+        picked = []
+        seen = set(escaping)
+        for data_id, text, metadata, dist, embedding in zip(
+            results.ids[which],
+            results.texts[which],
+            results.metadatas[which],
+            results.distances[which],
+            cls.embeddings_of(results, which, with_embeddings),
+        ):
+            doc_id = metadata["doc_id"]
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            picked.append((doc_id, data_id, text, metadata, dist, embedding))
+            if len(picked) >= limit:
+                break
+        return picked
+
+    @traced("vector_db.search_docs")
+    def search_docs(
+        self, embeddings, limit=5, with_embeddings=False
+    ) -> list[list[Knowledge]]:
+        """
+        Search documents (sentence_index 0) for each embedding in one query.
+        """
+        if limit <= 0:
+            return [[] for _ in embeddings]
+        results = self.query_embeddings(
+            embeddings=embeddings,
+            n_results=limit,
+            where={"sentence_index": 0},
+            with_embeddings=with_embeddings,
+        )
+        found = []
+        for which in range(len(results.ids)):
+            found.append(
+                [
+                    Knowledge(metadata["doc_id"], text, metadata, dist, embedding)
+                    for text, metadata, dist, embedding in zip(
+                        results.texts[which],
+                        results.metadatas[which],
+                        results.distances[which],
+                        self.embeddings_of(results, which, with_embeddings),
+                    )
+                ]
+            )
+        return found
+
+    @traced("vector_db.search_sentences")
+    def search_sentences(
+        self,
+        embeddings,
+        limit=5,
+        escapings: list[list[str]] = None,
+        with_embeddings=False,
+    ) -> list[list[Knowledge]]:
+        """
+        Search the best chunks of other documents for each embedding,
+        and replace sentences by their documents.
+        The embedding of a replaced sentence is kept.
+        """
+        if escapings is None:
+            escapings = [[] for _ in embeddings]
+        if limit <= 0:
+            return [[] for _ in embeddings]
+        # over-fetch once and group by documents in memory,
+        # instead of one filtered query for each document
+        longest = max((len(one) for one in escapings), default=0)
+        n_results = (limit + longest) * max(1, self.sentence_overfetch)
+        picked: list = [None] * len(embeddings)
+        waiting = list(range(len(embeddings)))
+        while len(waiting) != 0:
+            results = self.query_embeddings(
+                embeddings=[embeddings[i] for i in waiting],
+                n_results=n_results,
+                where=None,
+                with_embeddings=with_embeddings,
+            )
+            still_waiting = []
+            for which, i in enumerate(waiting):
+                picked[i] = self.pick_by_doc(
+                    results, which, limit, escapings[i], with_embeddings
+                )
+                if len(picked[i]) < limit and len(results.ids[which]) >= n_results:
+                    # too many hits of the same documents, fetch more
+                    still_waiting.append(i)
+            waiting = still_waiting
+            n_results *= 2
+
+        # sentences are replaced by their documents, fetched together
+        parent_ids = {
+            f"{doc_id}|0"
+            for one in picked
+            for doc_id, _, _, metadata, _, _ in one
+            if metadata["sentence_index"] != 0
+        }
+        parents = {}
+        if len(parent_ids) != 0:
+            found = self.find_by_ids(list(parent_ids))
+            for data_id, text, metadata in zip(found.ids, found.texts, found.metadatas):
+                parents[data_id] = (text, metadata)
+
+        result = []
+        for one in picked:
+            knowledge = []
+            for doc_id, data_id, text, metadata, dist, embedding in one:
+                if metadata["sentence_index"] != 0:
+                    parent = parents.get(f"{doc_id}|0", None)
+                    if parent is None:
+                        continue
+                    text, metadata = parent
+                knowledge.append(Knowledge(doc_id, text, metadata, dist, embedding))
+            result.append(knowledge)
+        return result
 
     def retrieve_by_sentence(self, embedding, limit=5, escaping=None):
         if escaping is None:
             escaping = []
-        for i in range(limit):
-            one = self.retrieve_one(embedding, escaping)
-            if one is None:
-                continue
-            doc_id, data_id, text, metadata, dist = one
-            yield Knowledge(doc_id, text, metadata, dist)
-            escaping.append(doc_id)
+        yield from self.search_sentences(embedding[:1], limit, [escaping])[0]
 
     def retrieve_doc(self, embedding, limit=5):
-        results = self.query_embeddings(
-            embeddings=embedding, n_results=limit, where={"sentence_index": 0}
-        )
-        escaping = []
-        for data_id, text, metadata, dist in zip(
-            results.ids[0], results.texts[0], results.metadatas[0], results.distances[0]
-        ):
-            doc_id = metadata["doc_id"]
-            yield Knowledge(doc_id, text, metadata, dist)
-            escaping.append(doc_id)
-        return escaping
+        found = self.search_docs(embedding[:1], limit)[0]
+        yield from found
+        return [knowledge.id for knowledge in found]
+
+    def search_keywords(self, texts: list[str], limit=5) -> list[list[Knowledge]]:
+        if self.keywords is None:
+            return [[] for _ in texts]
+        return [self.keywords.search(text, limit) for text in texts]
+
+    def fuse(self, rankings: list[list[Knowledge]], limit) -> list[Knowledge]:
+        """
+        Reciprocal rank fusion of several rankings of documents.
+        `dist` becomes the negative fused score, so lower is still better.
+        """
+        scores = {}
+        found = {}
+        for ranking in rankings:
+            for rank, knowledge in enumerate(ranking):
+                scores[knowledge.id] = scores.get(knowledge.id, 0.0) + 1.0 / (
+                    self.rrf_k + rank + 1
+                )
+                found.setdefault(knowledge.id, knowledge)
+        best = sorted(scores, key=lambda one: scores[one], reverse=True)[:limit]
+        return [replace(found[one], dist=-scores[one]) for one in best]
+
+    def retrieve(
+        self, embedding, *, limit=5, text=None, mode=None
+    ) -> Iterable[Knowledge]:
+        """
+        Documents, then documents of the best sentences, by the embedding;
+        or by keywords in text; or both fused.
+        """
+        mode = self.resolve_mode(mode) if text is not None else "vector"
+        if mode == "keyword":
+            yield from self.search_keywords([text], limit)[0]
+            return
+        if mode == "vector" and not self.mmr:
+            escaping = yield from self.retrieve_doc(embedding, limit)
+            yield from self.retrieve_by_sentence(embedding, limit, escaping)
+            return
+        texts = None if text is None else [text]
+        found = self.retrieve_many([embedding[0]], limit=limit, texts=texts, mode=mode)
+        yield from found[0]
 
-    def retrieve(self, embedding, *, limit=5) -> Iterable[Knowledge]:
-        escaping = yield from self.retrieve_doc(embedding, limit)
-        yield from self.retrieve_by_sentence(embedding, limit, escaping)
+    def retrieve_many(
+        self, embeddings, *, limit=5, texts=None, mode=None
+    ) -> list[list[Knowledge]]:
+        """
+        Retrieve for many query embeddings with two queries in total,
+        fused with keyword search of texts in the hybrid mode.
+        """
+        mode = self.resolve_mode(mode) if texts is not None else "vector"
+        if mode == "keyword":
+            return self.search_keywords(texts, limit)
+        if self.mmr:
+            vectors = self.search_diverse(embeddings, limit)
+        else:
+            docs = self.search_docs(embeddings, limit)
+            escapings = [[knowledge.id for knowledge in one] for one in docs]
+            sentences = self.search_sentences(embeddings, limit, escapings)
+            vectors = [one + another for one, another in zip(docs, sentences)]
+        if mode == "vector":
+            return vectors
+        keywords = self.search_keywords(texts, 2 * limit)
+        return [
+            self.fuse([one, another], 2 * limit) if len(another) != 0 else one
+            for one, another in zip(vectors, keywords)
+        ]
 
 
 class HNSWConfig(KVModel):
@@ -109,13 +390,103 @@ class HNSWConfig(KVModel):
     M: int = Field(default=16)
 
 
+class RetrievalConfig(KVModel):
+    sentence_overfetch: int = Field(default=4)
+    # hybrid, vector or keyword
+    mode: str = Field(default="hybrid")
+    # a BM25 index of documents, `embeddings/keywords.sqlite`
+    keyword_index: bool = Field(default=True)
+    rrf_k: int = Field(default=60)
+    # re-rank by maximal marginal relevance, keeping `limit` diverse hits
+    mmr: bool = Field(default=False)
+    # 1 for relevance only, 0 for diversity only
+    mmr_lambda: float = Field(default=0.7)
+    # candidates fetched for each kept hit
+    mmr_overfetch: int = Field(default=3)
+
+
 class VectorDBConfig(KVModel):
     engine: str = Field(default="chroma")
     db_name: str = Field(default="default_database")
+    # limits of one embedding request and one database write
+    batch_size: int = Field(default=64)
+    batch_chars: int = Field(default=16384)
     hnsw: HNSWConfig = HNSWConfig.as_field()
+    retrieval: RetrievalConfig = RetrievalConfig.as_field()
 
 
 class VectorDB(VectorDBSearch):
+    KeywordsFilename = "keywords.sqlite"
+
     def __init__(self, config: VectorDBConfig, embeddings_dir: Path):
         self.embeddings_dir: Path = embeddings_dir
         self.config: VectorDBConfig = config
+        self.sentence_overfetch = config.retrieval.sentence_overfetch
+        self.retrieval_mode = config.retrieval.mode
+        self.rrf_k = config.retrieval.rrf_k
+        self.mmr = config.retrieval.mmr
+        self.mmr_lambda = config.retrieval.mmr_lambda
+        self.mmr_overfetch = config.retrieval.mmr_overfetch
+        if config.retrieval.keyword_index:
+            self.keywords = KeywordIndex(embeddings_dir / self.KeywordsFilename)
+
+    # the keyword index follows the vector store in these,
+    # engines call them with super()
+
+    def connect(self):
+        if self.keywords is not None:
+            self.keywords.connect()
+
+    def close(self):
+        if self.keywords is not None:
+            self.keywords.close()
+
+    def clear(self):
+        if self.keywords is not None:
+            self.keywords.clear()
+
+    def remove_by_rel_path(self, rel_path: str | Path):
+        if self.keywords is not None:
+            self.keywords.remove_by_rel_path(rel_path)
+
+    def remove_ids(self, ids: list[str]):
+        if self.keywords is not None:
+            self.keywords.remove_ids(ids)
+
+    def add_chunks(self, chunks: list[Chunk], embeddings: list[list[float]]):
+        if self.keywords is not None:
+            self.keywords.add_chunks(chunks)
+
+    @traced("vector_db.warm_up")
+    def warm_up(self):
+        """
+        Load the index from disk by one query with a stored embedding.
+        """
+        embedding = self.any_embedding()
+        if embedding is not None:
+            self.query_embeddings([embedding], where=None, n_results=1)
+        if self.keywords is not None:
+            self.keywords.search("warm up", 1)
+
+    def iter_batches(self, docs: Iterable[Document], chunker: Chunker = None):
+        chunks = (chunk for doc in docs for chunk in doc.iter_chunks(chunker))
+        return self.iter_chunk_batches(chunks)
+
+    def iter_chunk_batches(self, chunks: Iterable[Chunk]):
+        return iter_batches(chunks, self.config.batch_size, self.config.batch_chars)
+
+    def insert_documents(
+        self, docs: Iterable[Document], embed, chunker: Chunker = None
+    ) -> list[str]:
+        """
+        Embed documents and their sentences batch by batch,
+        one embedding call and one write for each batch.
+
+        :return: ids of inserted chunks
+        """
+        ids = []
+        for batch in self.iter_batches(docs, chunker):
+            embeddings = embed([chunk.text for chunk in batch])
+            self.add_chunks(batch, embeddings)
+            ids.extend(chunk.id for chunk in batch)
+        return ids
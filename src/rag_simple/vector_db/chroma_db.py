@@ -1,10 +1,9 @@
 from pathlib import Path
-from typing import Iterable
 
 
 import chromadb
-from .base import VectorDB, QueryResult, FindResult
-from ..document import Document
+from ..tracing import traced
+from .base import Chunk, VectorDB, QueryResult, FindResult
 
 
 class ChromeVectorDB(VectorDB):
@@ -12,10 +11,14 @@ class ChromeVectorDB(VectorDB):
     embedding_coll: chromadb.Collection
 
     def connect(self):
+        super().connect()
         chroma_path = self.embeddings_dir / "chroma"
         self.chroma = chromadb.PersistentClient(
             str(chroma_path), database=self.config.db_name
         )
+        self.open_collection()
+
+    def open_collection(self):
         self.embedding_coll = self.chroma.get_or_create_collection(
             "chunks",
             metadata={
@@ -26,33 +29,63 @@ class ChromeVectorDB(VectorDB):
             },
         )
 
+    def close(self):
+        # drop the index in memory, so connecting again sees writes of others
+        if getattr(self, "chroma", None) is not None:
+            if hasattr(self.chroma, "close"):
+                self.chroma.close()
+            else:
+                self.chroma.clear_system_cache()
+            self.chroma = None
+        super().close()
+
     def clear(self):
         self.chroma.delete_collection("chunks")
+        # ready to be added to again
+        self.open_collection()
+        super().clear()
 
     def remove_by_rel_path(self, rel_path: str | Path):
         self.embedding_coll.delete(where={"rel_path": str(rel_path)})
+        super().remove_by_rel_path(rel_path)
 
-    def insert_documents(self, docs: Iterable[Document], embed):
-        for doc in docs:
-            embedding = embed([doc.text])
-            self.embedding_coll.add(
-                ids=[doc.id],
-                embeddings=embedding,
-                metadatas=[doc.metadata],
-                documents=[doc.text],
-            )
-            for sentence in doc.iter_doc_sentences():
-                embedding = embed([sentence.text])
-                self.embedding_coll.add(
-                    ids=[sentence.id],
-                    embeddings=embedding,
-                    metadatas=[sentence.dump()],
-                    documents=[sentence.text],
-                )
-
-    def query_embeddings(self, embeddings, where, n_results) -> QueryResult:
+    def ids_by_rel_path(self, rel_path: str | Path) -> list[str]:
+        found = self.embedding_coll.get(where={"rel_path": str(rel_path)}, include=[])
+        return found["ids"]
+
+    def remove_ids(self, ids: list[str]):
+        if len(ids) != 0:
+            self.embedding_coll.delete(ids=list(ids))
+        super().remove_ids(ids)
+
+    def add_chunks(self, chunks: list[Chunk], embeddings: list[list[float]]):
+        # chroma ignores existing ids in add
+        self.embedding_coll.upsert(
+            ids=[chunk.id for chunk in chunks],
+            embeddings=embeddings,
+            metadatas=[chunk.metadata for chunk in chunks],
+            documents=[chunk.text for chunk in chunks],
+        )
+        super().add_chunks(chunks, embeddings)
+
+    def any_embedding(self):
+        found = self.embedding_coll.get(limit=1, include=["embeddings"])
+        if len(found["ids"]) == 0:
+            return None
+        return found["embeddings"][0]
+
+    @traced("vector_db.query_embeddings")
+    def query_embeddings(
+        self, embeddings, where, n_results, with_embeddings=False
+    ) -> QueryResult:
+        include = ["documents", "metadatas", "distances"]
+        if with_embeddings:
+            include.append("embeddings")
         result = self.embedding_coll.query(
-            query_embeddings=embeddings, n_results=n_results, where=where
+            query_embeddings=embeddings,
+            n_results=n_results,
+            where=where,
+            include=include,
         )
         return QueryResult(
             result["ids"],
@@ -62,6 +95,25 @@ class ChromeVectorDB(VectorDB):
             result["distances"],
         )
 
+    def iter_all(self, batch_size=1024):
+        offset = 0
+        while True:
+            found = self.embedding_coll.get(
+                limit=batch_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"],
+            )
+            if len(found["ids"]) == 0:
+                return
+            yield FindResult(
+                found["ids"],
+                found["embeddings"],
+                found["documents"],
+                found["metadatas"],
+            )
+            offset += len(found["ids"])
+
+    @traced("vector_db.find_by_ids")
     def find_by_ids(self, ids) -> FindResult:
         result = self.embedding_coll.get(
             ids=ids,
@@ -0,0 +1,154 @@
+import json
+from pathlib import Path
+import re
+import sqlite3
+import threading
+
+from ..document import Document, DocumentSentence
+from ..prompt import Knowledge
+from ..tracing import traced
+
+
+class KeywordIndex:
+    """
+    A BM25 index of documents (sentence_index 0) in SQLite FTS5.
+
+    `docs` keeps ids, paths and metadata, and `docs_fts` the text,
+    sharing the same rowid.
+    """
+
+    # hyphens and underscores are part of a token, e.g., 1991-02-29
+    Tokenizer = "unicode61 tokenchars '-_'"
+    TokenPattern = re.compile(r"[\w\-]+")
+    # terms of one query
+    max_terms = 64
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.db: sqlite3.Connection | None = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            if self.db is not None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                "id TEXT PRIMARY KEY, rel_path TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS docs_rel_path ON docs(rel_path)")
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts "
+                f'USING fts5(text, tokenize="{self.Tokenizer}")'
+            )
+            db.commit()
+            self.db = db
+
+    def close(self):
+        with self.lock:
+            if self.db is None:
+                return
+            self.db.close()
+            self.db = None
+
+    def clear(self):
+        self.connect()
+        with self.lock:
+            self.db.execute("DELETE FROM docs")
+            self.db.execute("DELETE FROM docs_fts")
+            self.db.commit()
+
+    def remove_by_rel_path(self, rel_path: str | Path):
+        self.connect()
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM docs_fts WHERE rowid IN "
+                "(SELECT rowid FROM docs WHERE rel_path = ?)",
+                (str(rel_path),),
+            )
+            self.db.execute("DELETE FROM docs WHERE rel_path = ?", (str(rel_path),))
+            self.db.commit()
+
+    def remove_ids(self, ids: list[str]):
+        self.connect()
+        with self.lock:
+            for start in range(0, len(ids), 500):
+                part = ids[start : start + 500]
+                marks = ", ".join("?" * len(part))
+                self.db.execute(
+                    "DELETE FROM docs_fts WHERE rowid IN "
+                    f"(SELECT rowid FROM docs WHERE id IN ({marks}))",
+                    part,
+                )
+                self.db.execute(f"DELETE FROM docs WHERE id IN ({marks})", part)
+            self.db.commit()
+
+    def add_chunks(self, chunks: list[Document | DocumentSentence]):
+        """
+        Index documents among chunks, replacing those of the same ids.
+        """
+        docs = [chunk for chunk in chunks if chunk.metadata["sentence_index"] == 0]
+        if len(docs) == 0:
+            return
+        self.connect()
+        with self.lock:
+            for doc in docs:
+                found = self.db.execute(
+                    "SELECT rowid FROM docs WHERE id = ?", (doc.id,)
+                ).fetchone()
+                if found is not None:
+                    self.db.execute("DELETE FROM docs_fts WHERE rowid = ?", found)
+                    self.db.execute("DELETE FROM docs WHERE rowid = ?", found)
+                cursor = self.db.execute(
+                    "INSERT INTO docs (id, rel_path, metadata) VALUES (?, ?, ?)",
+                    (
+                        doc.id,
+                        doc.metadata["rel_path"],
+                        json.dumps(doc.metadata, ensure_ascii=False),
+                    ),
+                )
+                self.db.execute(
+                    "INSERT INTO docs_fts (rowid, text) VALUES (?, ?)",
+                    (cursor.lastrowid, doc.text),
+                )
+            self.db.commit()
+
+    @classmethod
+    def make_query(cls, text: str) -> str | None:
+        """
+        Any of the terms in text, each quoted as an FTS5 string.
+        """
+        terms = []
+        for term in cls.TokenPattern.findall(text.lower()):
+            term = term.strip("-")
+            if term != "" and term not in terms:
+                terms.append(term)
+        if len(terms) == 0:
+            return None
+        return " OR ".join(f'"{term}"' for term in terms[: cls.max_terms])
+
+    @traced("keyword_index.search")
+    def search(self, text: str, limit=5) -> list[Knowledge]:
+        """
+        Best documents by BM25. `dist` is the FTS5 rank, lower is better.
+        """
+        query = self.make_query(text)
+        if query is None or limit <= 0:
+            return []
+        self.connect()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT docs.metadata, docs_fts.text, docs_fts.rank "
+                "FROM docs_fts JOIN docs ON docs.rowid = docs_fts.rowid "
+                "WHERE docs_fts MATCH ? ORDER BY docs_fts.rank LIMIT ?",
+                (query, limit),
+            ).fetchall()
+        result = []
+        for metadata, text, rank in rows:
+            metadata = json.loads(metadata)
+            result.append(Knowledge(metadata["doc_id"], text, metadata, rank))
+        return result
@@ -0,0 +1,34 @@
+import numpy as np
+
+
+def maximal_marginal_relevance(query, vectors, limit, weight=0.7) -> list[int]:
+    """
+    Pick `limit` rows of vectors, each maximizing
+    `weight * sim(query, row) - (1 - weight) * max(sim(row, picked))`
+    by cosine similarity.
+
+    :return: indices of picked rows, in the order of picking
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) == 0 or limit <= 0:
+        return []
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    unit = vectors / norms[:, None]
+    query_norm = np.linalg.norm(query)
+    relevance = unit @ (query / (query_norm if query_norm != 0 else 1.0))
+    similarity = unit @ unit.T
+
+    picked = []
+    # the highest similarity to any picked row
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    for _ in range(min(limit, len(vectors))):
+        scores = weight * relevance - (1.0 - weight) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return picked
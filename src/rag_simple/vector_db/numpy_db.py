@@ -0,0 +1,321 @@
+import json
+import os
+from pathlib import Path
+import shutil
+import threading
+
+import numpy as np
+
+from ..tracing import traced
+from .base import Chunk, VectorDB, QueryResult, FindResult
+
+
+class NumpyVectorDB(VectorDB):
+    """
+    Exact search over a flat float32 matrix.
+
+    Embeddings are kept in `vectors.npy`, memory-mapped when loaded,
+    and ids, texts and metadata in `rows.jsonl`, one line for each row.
+    Changes stay in memory until `flush`.
+    """
+
+    VectorsFilename = "vectors.npy"
+    RowsFilename = "rows.jsonl"
+
+    def __init__(self, config, embeddings_dir: Path):
+        super().__init__(config, embeddings_dir)
+        self.lock = threading.RLock()
+        self.reset()
+
+    @property
+    def data_dir(self) -> Path:
+        return self.embeddings_dir / "numpy" / self.config.db_name
+
+    def reset(self):
+        self.vectors: np.ndarray | None = None
+        self.pending: list[np.ndarray] = []
+        self.ids: list[str] = []
+        self.texts: list[str] = []
+        self.metadatas: list[dict] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.index: dict[str, int] = {}
+        self.columns: dict[str, np.ndarray] = {}
+        self.norms: np.ndarray | None = None
+        self.dirty = False
+
+    def connect(self):
+        super().connect()
+        with self.lock:
+            self.reset()
+            vectors_path = self.data_dir / self.VectorsFilename
+            rows_path = self.data_dir / self.RowsFilename
+            if not vectors_path.exists() or not rows_path.exists():
+                return
+            with open(rows_path, "r") as file:
+                for line in file:
+                    row = json.loads(line)
+                    self.index[row["id"]] = len(self.ids)
+                    self.ids.append(row["id"])
+                    self.texts.append(row["text"])
+                    self.metadatas.append(row["metadata"])
+            vectors = np.load(vectors_path, mmap_mode="r")
+            if len(vectors) != len(self.ids):
+                raise RuntimeError(
+                    f"broken vector store {self.data_dir}: "
+                    f"{len(vectors)} vectors for {len(self.ids)} rows"
+                )
+            self.vectors = vectors
+            self.alive = np.ones(len(self.ids), dtype=bool)
+
+    def close(self):
+        self.flush()
+        super().close()
+
+    def flush(self):
+        """
+        Compact deleted rows and write both files.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            matrix = self.matrix()
+            keep = np.flatnonzero(self.alive)
+            self.data_dir.mkdir(parents=True, exist_ok=True)
+            rows_path = self.data_dir / self.RowsFilename
+            vectors_path = self.data_dir / self.VectorsFilename
+            rows_tmp = rows_path.with_name(rows_path.name + ".tmp")
+            vectors_tmp = vectors_path.with_name(vectors_path.name + ".tmp")
+            with open(rows_tmp, "w") as file:
+                for i in keep:
+                    row = {
+                        "id": self.ids[i],
+                        "text": self.texts[i],
+                        "metadata": self.metadatas[i],
+                    }
+                    file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            with open(vectors_tmp, "wb") as file:
+                if matrix is None:
+                    matrix = np.zeros((0, 0), dtype=np.float32)
+                np.save(file, np.ascontiguousarray(matrix[keep]))
+            # release the memory map before replacing its file
+            self.vectors = None
+            self.pending = []
+            os.replace(rows_tmp, rows_path)
+            os.replace(vectors_tmp, vectors_path)
+            self.dirty = False
+            self.connect()
+
+    def clear(self):
+        with self.lock:
+            self.reset()
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+        super().clear()
+
+    def matrix(self) -> np.ndarray | None:
+        """
+        All vectors, including deleted rows, as one matrix.
+        """
+        with self.lock:
+            if len(self.pending) != 0:
+                parts = self.pending
+                if self.vectors is not None:
+                    parts = [self.vectors] + parts
+                self.vectors = np.concatenate(parts, axis=0)
+                self.pending = []
+            return self.vectors
+
+    def squared_norms(self, matrix: np.ndarray) -> np.ndarray:
+        with self.lock:
+            if self.norms is None or len(self.norms) != len(matrix):
+                self.norms = np.einsum("ij,ij->i", matrix, matrix)
+            return self.norms
+
+    def column(self, key) -> np.ndarray:
+        with self.lock:
+            column = self.columns.get(key, None)
+            if column is None or len(column) != len(self.metadatas):
+                column = np.empty(len(self.metadatas), dtype=object)
+                column[:] = [metadata.get(key, None) for metadata in self.metadatas]
+                self.columns[key] = column
+            return column
+
+    def delete_rows(self, rows):
+        with self.lock:
+            if len(rows) == 0:
+                return
+            self.alive[rows] = False
+            for i in rows:
+                self.index.pop(self.ids[i], None)
+            self.dirty = True
+
+    def remove_by_rel_path(self, rel_path: str | Path):
+        mask = self.match({"rel_path": str(rel_path)})
+        self.delete_rows(np.flatnonzero(mask))
+        super().remove_by_rel_path(rel_path)
+
+    def ids_by_rel_path(self, rel_path: str | Path) -> list[str]:
+        mask = self.match({"rel_path": str(rel_path)})
+        return [self.ids[i] for i in np.flatnonzero(mask)]
+
+    def remove_ids(self, ids: list[str]):
+        with self.lock:
+            rows = [self.index[one] for one in ids if one in self.index]
+            self.delete_rows(rows)
+        super().remove_ids(ids)
+
+    def add_chunks(self, chunks: list[Chunk], embeddings: list[list[float]]):
+        if len(chunks) == 0:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self.lock:
+            # the same as upsert
+            replaced = [
+                self.index[chunk.id] for chunk in chunks if chunk.id in self.index
+            ]
+            self.delete_rows(replaced)
+            for chunk in chunks:
+                self.index[chunk.id] = len(self.ids)
+                self.ids.append(chunk.id)
+                self.texts.append(chunk.text)
+                self.metadatas.append(dict(chunk.metadata))
+            self.pending.append(vectors)
+            self.alive = np.concatenate([self.alive, np.ones(len(chunks), dtype=bool)])
+            self.norms = None
+            self.dirty = True
+        super().add_chunks(chunks, embeddings)
+
+    def any_embedding(self):
+        matrix = self.matrix()
+        alive = np.flatnonzero(self.alive)
+        if matrix is None or len(alive) == 0:
+            return None
+        return matrix[alive[0]]
+
+    @staticmethod
+    def match_condition(column: np.ndarray, condition) -> np.ndarray:
+        if not isinstance(condition, dict):
+            return column == condition
+        mask = np.ones(len(column), dtype=bool)
+        for op, value in condition.items():
+            if op == "$eq":
+                mask &= column == value
+            elif op == "$ne":
+                mask &= column != value
+            elif op in ("$in", "$nin"):
+                values = set(value)
+                found = np.fromiter(
+                    (one in values for one in column), dtype=bool, count=len(column)
+                )
+                mask &= found if op == "$in" else ~found
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                valid = np.array([one is not None for one in column], dtype=bool)
+                compared = np.zeros(len(column), dtype=bool)
+                left = column[valid]
+                if op == "$gt":
+                    compared[valid] = left > value
+                elif op == "$gte":
+                    compared[valid] = left >= value
+                elif op == "$lt":
+                    compared[valid] = left < value
+                else:
+                    compared[valid] = left <= value
+                mask &= compared
+            else:
+                raise NotImplementedError(f"unknown where operator {op}")
+        return mask
+
+    def match(self, where) -> np.ndarray:
+        """
+        Evaluate a chroma-style `where` filter on alive rows.
+        """
+        with self.lock:
+            mask = self.alive.copy()
+        if where is None:
+            return mask
+        for key, condition in where.items():
+            if key == "$and":
+                for one in condition:
+                    mask &= self.match(one)
+            elif key == "$or":
+                any_mask = np.zeros(len(mask), dtype=bool)
+                for one in condition:
+                    any_mask |= self.match(one)
+                mask &= any_mask
+            else:
+                mask &= self.match_condition(self.column(key), condition)
+        return mask
+
+    def distances(self, queries: np.ndarray, matrix: np.ndarray, rows) -> np.ndarray:
+        space = self.config.hnsw.space
+        candidates = matrix if rows is None else matrix[rows]
+        products = queries @ candidates.T
+        if space == "ip":
+            return 1.0 - products
+        norms = self.squared_norms(matrix)
+        if rows is not None:
+            norms = norms[rows]
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        if space == "cosine":
+            scale = np.sqrt(np.outer(query_norms, norms))
+            scale[scale == 0] = 1.0
+            return 1.0 - products / scale
+        # squared l2, the same as chroma
+        return np.maximum(query_norms[:, None] - 2 * products + norms[None, :], 0.0)
+
+    @traced("vector_db.query_embeddings")
+    def query_embeddings(
+        self, embeddings, where, n_results, with_embeddings=False
+    ) -> QueryResult:
+        # rows of the matrix cost nothing, so embeddings are always returned
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        matrix = self.matrix()
+        result = QueryResult([], [], [], [], [])
+        mask = self.match(where)
+        if matrix is None or not mask.any():
+            for _ in range(len(queries)):
+                for one in (result.ids, result.texts, result.metadatas):
+                    one.append([])
+                result.embeddings.append([])
+                result.distances.append([])
+            return result
+        rows = None if mask.all() else np.flatnonzero(mask)
+        dists = self.distances(queries, matrix, rows)
+        k = min(n_results, dists.shape[1])
+        if k < dists.shape[1]:
+            top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(dists.shape[1]), (len(queries), k))
+        for query_dists, query_top in zip(dists, top):
+            order = query_top[np.argsort(query_dists[query_top], kind="stable")]
+            found = order if rows is None else rows[order]
+            result.ids.append([self.ids[i] for i in found])
+            result.texts.append([self.texts[i] for i in found])
+            result.metadatas.append([self.metadatas[i] for i in found])
+            result.embeddings.append(matrix[found])
+            result.distances.append(query_dists[order].tolist())
+        return result
+
+    def iter_all(self, batch_size=1024):
+        matrix = self.matrix()
+        with self.lock:
+            rows = np.flatnonzero(self.alive)
+        for start in range(0, len(rows), batch_size):
+            part = rows[start : start + batch_size]
+            yield FindResult(
+                [self.ids[i] for i in part],
+                matrix[part],
+                [self.texts[i] for i in part],
+                [self.metadatas[i] for i in part],
+            )
+
+    @traced("vector_db.find_by_ids")
+    def find_by_ids(self, ids) -> FindResult:
+        with self.lock:
+            rows = [self.index[one] for one in ids if one in self.index]
+        matrix = self.matrix()
+        return FindResult(
+            [self.ids[i] for i in rows],
+            [] if matrix is None else matrix[rows],
+            [self.texts[i] for i in rows],
+            [self.metadatas[i] for i in rows],
+        )
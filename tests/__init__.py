@@ -1 +1,10 @@
 from .test_kv_model import *
+from .test_vector_db import *
+from .test_llm import *
+from .test_document import *
+from .test_context import *
+from .test_server import *
+from .test_build import *
+from .test_flow_manager import *
+from .test_tracing import *
+from .test_cmd import *
@@ -0,0 +1,272 @@
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import yaml
+
+from rag_simple.manifest import BuildManifest, BuildTarget
+from rag_simple.project import RAGProject
+from rag_simple.scanner import ScannedFile
+from rag_simple.snapshot import SnapshotError
+
+
+def make_project(path: Path) -> RAGProject:
+    project = RAGProject.new(path)
+    project.config.llm.embed.agent = "stub"
+    project.config.llm.embed.size = 256
+    project.config.llm.embed.cache.enabled = False
+    project.config.llm.chat.agent = "stub"
+    project.config.vector_db.engine = "numpy"
+    project.config.vector_db.batch_size = 4
+    project.config.pipeline.embed_workers = 1
+    project.write_project_file()
+    return RAGProject(path)
+
+
+def write_docs(path: Path, count, word="doc"):
+    docs = [{"metadata": {}, "text": f"{word} {i}\nline {i}"} for i in range(count)]
+    with open(path, "w") as file:
+        yaml.safe_dump_all(docs, file)
+
+
+class TestBuildManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.manifest = BuildManifest(self.dir / "manifest.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def scan(self, *names):
+        return [
+            ScannedFile(str(self.dir / one), one, os.stat(self.dir / one))
+            for one in names
+        ]
+
+    def record(self, name):
+        (target,) = self.manifest.plan(self.scan(name), run_all=True).targets
+        self.manifest.record(target, [f"{name}|0|0"], ["hash"])
+
+    def test_plan(self):
+        for one in ("a.yaml", "b.yaml", "c.yaml"):
+            (self.dir / one).write_text(one)
+            self.record(one)
+        self.manifest.save()
+        self.manifest = BuildManifest(self.manifest.path).load()
+
+        # a is unchanged, b only touched, c changed and d deleted
+        self.manifest.files["d.yaml"] = self.manifest.files["a.yaml"]
+        b = self.dir / "b.yaml"
+        os.utime(b, ns=(b.stat().st_atime_ns, b.stat().st_mtime_ns + 10**9))
+        (self.dir / "c.yaml").write_text("changed")
+        plan = self.manifest.plan(self.scan("a.yaml", "b.yaml", "c.yaml"))
+        self.assertEqual([one.rel_path for one in plan.touched], ["b.yaml"])
+        self.assertEqual([one.rel_path for one in plan.targets], ["c.yaml"])
+        self.assertEqual(plan.targets[0].previous, self.manifest.files["c.yaml"])
+        self.assertEqual(plan.removed, ["d.yaml"])
+        self.manifest.touch(plan.touched[0])
+        self.assertEqual(self.manifest.files["b.yaml"].mtime_ns, b.stat().st_mtime_ns)
+
+        plan = self.manifest.plan(self.scan("a.yaml", "b.yaml", "c.yaml"), True)
+        self.assertEqual(len(plan.targets), 3)
+        self.assertEqual(plan.touched, [])
+        for one in plan.targets:
+            self.assertIsInstance(one, BuildTarget)
+            self.assertIsNone(one.previous)
+
+
+class TestBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "project"
+        self.quiet = io.StringIO()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, project: RAGProject, fail_after=None, **kwargs):
+        """
+        :return: texts embedded
+        """
+        embed = project.flow_manager.embed
+        texts = []
+
+        def counted(batch):
+            if fail_after is not None and len(texts) >= fail_after:
+                raise RuntimeError("interrupted")
+            texts.extend(batch)
+            return embed(batch)
+
+        project.flow_manager.embed = counted
+        with redirect_stdout(self.quiet), redirect_stderr(self.quiet):
+            project.build_db(dry_run=False, run_all=False, **kwargs)
+        project.flow_manager.close()
+        return texts
+
+    def stored_ids(self):
+        project = RAGProject(self.path)
+        project.flow_manager.setup()
+        ids = {
+            one
+            for one, alive in zip(project.vector_db.ids, project.vector_db.alive)
+            if alive
+        }
+        project.flow_manager.close()
+        return ids
+
+    def test_resume(self):
+        project = make_project(self.path)
+        write_docs(project.paths.documents_dir / "a.yaml", 2)
+        self.build(project)
+        old_ids = self.stored_ids()
+        self.assertEqual(len(old_ids), 6)
+
+        # 10 changed chunks in 3 batches, interrupted after 2
+        write_docs(project.paths.documents_dir / "a.yaml", 4, word="new")
+        project = RAGProject(self.path)
+        with self.assertRaises(RuntimeError):
+            self.build(project, fail_after=8)
+        # the old version stays, not a half of the new one
+        self.assertEqual(self.stored_ids(), old_ids)
+
+        project = RAGProject(self.path)
+        texts = self.build(project, resume=True)
+        self.assertEqual(len(texts), 2)
+        self.assertEqual(len(self.stored_ids()), 12)
+        self.assertFalse(project.paths.journal_file.exists())
+        self.assertEqual(self.build(RAGProject(self.path)), [])
+
+    def test_removed_and_touched(self):
+        project = make_project(self.path)
+        write_docs(project.paths.documents_dir / "a.yaml", 1)
+        write_docs(project.paths.documents_dir / "b.yaml", 1)
+        self.build(project)
+        self.assertEqual(len(self.stored_ids()), 6)
+
+        (project.paths.documents_dir / "b.yaml").unlink()
+        os.utime(project.paths.documents_dir / "a.yaml")
+        self.assertEqual(self.build(RAGProject(self.path)), [])
+        self.assertEqual(self.stored_ids(), {"a.yaml|0|0", "a.yaml|0|1", "a.yaml|0|2"})
+        manifest = BuildManifest(project.paths.manifest_file).load()
+        self.assertEqual(list(manifest.files), ["a.yaml"])
+
+    def test_interrupted_write(self):
+        project = make_project(self.path)
+        path = project.paths.documents_dir / "a.yaml"
+        write_docs(path, 2)
+        self.build(project)
+
+        # stopped after upserting the new chunks, before removing stale ones
+        write_docs(path, 1, word="new")
+        project = RAGProject(self.path)
+
+        def crash(ids):
+            raise RuntimeError("interrupted")
+
+        project.flow_manager.remove_ids = crash
+        with self.assertRaises(RuntimeError):
+            self.build(project)
+        project = RAGProject(self.path)
+        found = project.flow_manager.retrieve_text("new 0", limit=1, mode="keyword")
+        self.assertEqual([one.text for one in found], ["new 0\nline 0"])
+        # old chunks are still there, none missing
+        self.assertEqual(len(self.stored_ids()), 6)
+
+        self.build(project)
+        self.assertEqual(self.stored_ids(), {"a.yaml|0|0", "a.yaml|0|1", "a.yaml|0|2"})
+
+    def test_diff(self):
+        project = make_project(self.path)
+        path = project.paths.documents_dir / "a.yaml"
+        write_docs(path, 2)
+        self.build(project)
+
+        # only the appended document
+        write_docs(path, 3)
+        texts = self.build(RAGProject(self.path))
+        self.assertEqual(texts, ["doc 2\nline 2", "doc 2", "line 2"])
+        self.assertEqual(len(self.stored_ids()), 9)
+
+        # only the changed chunks, upserted before stale ones are removed
+        write_docs(path, 1, word="new")
+        project = RAGProject(self.path)
+        calls = []
+        add_chunks = project.flow_manager.add_chunks
+        remove_ids = project.flow_manager.remove_ids
+
+        def logged_add(chunks, embeddings):
+            calls.append(("add", [chunk.id for chunk in chunks]))
+            return add_chunks(chunks, embeddings)
+
+        def logged_remove(ids):
+            calls.append(("remove", sorted(ids)))
+            return remove_ids(ids)
+
+        project.flow_manager.add_chunks = logged_add
+        project.flow_manager.remove_ids = logged_remove
+        texts = self.build(project)
+        self.assertEqual(
+            calls,
+            [
+                ("add", ["a.yaml|0|0", "a.yaml|0|1"]),
+                ("remove", [f"a.yaml|{i}|{j}" for i in (1, 2) for j in range(3)]),
+            ],
+        )
+        self.assertEqual(texts, ["new 0\nline 0", "new 0"])
+        self.assertEqual(self.stored_ids(), {"a.yaml|0|0", "a.yaml|0|1", "a.yaml|0|2"})
+
+    def test_snapshot(self):
+        project = make_project(self.path)
+        write_docs(project.paths.documents_dir / "a.yaml", 2)
+        self.build(project)
+        snapshot = Path(self.tmp.name) / "snapshot"
+        with redirect_stdout(self.quiet):
+            project.export_snapshot(snapshot, dtype="float16")
+        project.flow_manager.close()
+
+        other = make_project(Path(self.tmp.name) / "other")
+        other.config.vector_db.engine = "chroma"
+        other.write_project_file()
+        other.config.llm.embed.model = "another"
+        with self.assertRaises(SnapshotError):
+            other.import_snapshot(snapshot)
+        other.config.llm.embed.model = project.config.llm.embed.model
+        with redirect_stdout(self.quiet):
+            other.import_snapshot(snapshot)
+        found = other.vector_db.find_by_ids(sorted(self.stored_ids()))
+        self.assertEqual(len(found.ids), 6)
+        self.assertIn("doc 1\nline 1", found.texts)
+        knowledge = other.flow_manager.retrieve_text("doc 1\nline 1", limit=1)
+        self.assertEqual(next(iter(knowledge)).text, "doc 1\nline 1")
+
+        # documents shipped with the snapshot are not embedded again
+        shutil.copytree(
+            project.paths.documents_dir, other.paths.documents_dir, dirs_exist_ok=True
+        )
+        self.assertEqual(self.build(other), [])
+
+        # refused before anything is touched
+        other = RAGProject(other.project_path)
+        other.config.llm.embed.size = 128
+        with self.assertRaises(SnapshotError):
+            other.import_snapshot(snapshot)
+        other.flow_manager.setup()
+        self.assertEqual(len(other.vector_db.find_by_ids(found.ids).ids), 6)
+        other.config.llm.embed.size = project.config.llm.embed.size
+
+        # a broken import leaves nothing looking built
+        rows = snapshot / "rows.jsonl"
+        rows.write_text(rows.read_text().splitlines()[0] + "\n")
+        with redirect_stdout(self.quiet), self.assertRaises(SnapshotError):
+            other.import_snapshot(snapshot)
+        self.assertFalse(other.paths.manifest_file.exists())
+        self.assertEqual(len(self.build(other)), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
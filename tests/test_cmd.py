@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+import rag_simple
+
+
+class TestColdStart(unittest.TestCase):
+    def test_lazy_imports(self):
+        # heavy modules are only loaded by the commands that need them
+        heavy = ["asyncio", "chromadb", "ollama", "numpy"]
+        code = (
+            "import rag_simple.cmd, sys; "
+            f"print(','.join(one for one in {heavy!r} if one in sys.modules))"
+        )
+        env = dict(os.environ)
+        src = str(Path(rag_simple.__file__).parents[1])
+        env["PYTHONPATH"] = os.pathsep.join(
+            one for one in (src, env.get("PYTHONPATH")) if one
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
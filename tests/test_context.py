@@ -0,0 +1,85 @@
+import unittest
+
+from rag_simple.chatbot import Chatbot
+from rag_simple.context import ContextConfig, ContextWindow
+from rag_simple.prompt import Knowledge
+
+
+class TestContextWindow(unittest.TestCase):
+    def test_pack(self):
+        config = ContextConfig()
+        config.max_tokens = 40
+        config.knowledge_tokens = 14
+        config.chars_per_token = 1.0
+        sent = []
+
+        def chat(prompt):
+            sent.append(list(prompt))
+            yield "ok"
+
+        def retrieve(text, limit=5):
+            return [
+                Knowledge("far", "f" * 6, {}, 0.9),
+                Knowledge("near", "n" * 6, {}, 0.1),
+                Knowledge("big", "b" * 20, {}, 0.0),
+            ]
+
+        chatbot = Chatbot(chat, retrieve).set_context(ContextWindow(config))
+        chatbot.extend([{"role": "system", "content": "sys"}])
+        chatbot.retrieve("q1").drain()
+        list(chatbot.chat("q1").iter_message())
+        usage = chatbot.usage[0]
+        self.assertEqual((usage.preset, usage.knowledge, usage.question), (7, 10, 6))
+        self.assertEqual(usage.dropped_knowledge, 2)
+        self.assertEqual([one["content"] for one in sent[0]], ["sys", "nnnnnn", "q1"])
+
+        for question in ["q2", "q3"]:
+            list(chatbot.chat(question).iter_message())
+        # 23 tokens of the preset, knowledge and question leave two turns of 6
+        self.assertEqual(
+            [one["content"] for one in sent[2]], ["sys", "nnnnnn", "q2", "ok", "q3"]
+        )
+        self.assertEqual(chatbot.usage[2].dropped_turns, 2)
+        self.assertEqual(chatbot.usage[2].total, 35)
+        self.assertEqual(len(list(chatbot.messages)), 10)
+
+    def test_pack_latest_first(self):
+        config = ContextConfig()
+        config.knowledge_tokens = 24
+        config.chars_per_token = 1.0
+        sent = []
+
+        def chat(prompt):
+            sent.append([one["content"] for one in prompt])
+            yield "ok"
+
+        found = {
+            "q1": [Knowledge("old", "o" * 6, {}, 0.0)],
+            "q2": [
+                Knowledge("far", "f" * 6, {}, 0.8),
+                Knowledge("new", "n" * 6, {}, 0.5),
+            ],
+        }
+
+        def retrieve(text, limit=5):
+            return found[text]
+
+        chatbot = Chatbot(chat, retrieve).set_context(ContextWindow(config))
+        chatbot.set_retrieval_prefix("> ")
+        for question in ["q1", "q2"]:
+            chatbot.retrieve(question).drain()
+            list(chatbot.chat(question).iter_message())
+        # the closer but older one is dropped for the current question
+        self.assertEqual(sent[1], ["> nnnnnn", "> ffffff", "q1", "ok", "q2"])
+        self.assertEqual(chatbot.usage[1].dropped_knowledge, 1)
+
+        # found again, it comes back once, and prefixed once
+        found["q3"] = [Knowledge("old", "o" * 6, {}, 0.1)]
+        chatbot.retrieve("q3").drain()
+        list(chatbot.chat("q3").iter_message())
+        self.assertEqual(sent[2][:2], ["> oooooo", "> nnnnnn"])
+        self.assertEqual(len(chatbot.knowledge), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
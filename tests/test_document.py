@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from rag_simple.chunker import ChunkConfig, Chunker
+from rag_simple.document import Document, DocumentConfig, DocumentLoader
+from rag_simple.project import RAGProject
+from rag_simple.scanner import DocumentScanner, ScanConfig
+
+
+class TestDocumentLoader(unittest.TestCase):
+    def test_formats(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp)
+            loader = DocumentLoader(base)
+            for suffix in DocumentLoader.Extensions:
+                path = base / f"doc{suffix}"
+                RAGProject.new_doc(path)
+                docs = list(loader.iter_documents(path))
+                self.assertEqual(len(docs), 2, suffix)
+                self.assertEqual([doc.index for doc in docs], [0, 1])
+                self.assertEqual(docs[0].rel_path, path.name)
+                self.assertIn("Example", docs[0].text)
+                self.assertIn("Another", docs[1].text)
+
+    def test_text_separator(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "doc.txt"
+            path.write_text("a\n===\n\n===\nb\nc\n")
+            config = DocumentConfig()
+            config.text_separator = "==="
+            docs = list(DocumentLoader(Path(tmp), config).iter_documents(path))
+            self.assertEqual([doc.text for doc in docs], ["a\n", "b\nc\n"])
+
+
+class TestDocumentScanner(unittest.TestCase):
+    def test_scan(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp) / "documents"
+            for one in ["a.yaml", "b.md", "x/c.txt", "x/y/d.jsonl", "tmp/e.yaml"]:
+                (base / one).parent.mkdir(parents=True, exist_ok=True)
+                (base / one).write_text("text: a\n")
+            (base / "x" / "y" / "skip.toml").write_text("")
+            (base / ".ragignore").write_text("# comment\ntmp/\nskip.*\n")
+            (base / "link").symlink_to(base / "x")
+            (base / "linked.yaml").symlink_to(base / "a.yaml")
+
+            scanned = list(DocumentScanner(base).scan())
+            # a directory is scanned once
+            self.assertEqual(
+                [one.rel_path for one in scanned],
+                ["a.yaml", "linked.yaml", "link/c.txt", "link/y/d.jsonl"],
+            )
+            self.assertEqual(scanned[0].stat.st_size, 8)
+
+            config = ScanConfig()
+            config.follow_symlinks = False
+            rel_paths = [one.rel_path for one in DocumentScanner(base, config).scan()]
+            self.assertEqual(rel_paths, ["a.yaml", "x/c.txt", "x/y/d.jsonl"])
+
+
+class TestChunker(unittest.TestCase):
+    def chunker(self, strategy, size, overlap=0, max_chars=0):
+        config = ChunkConfig()
+        config.strategy = strategy
+        config.size = size
+        config.overlap = overlap
+        config.max_chars = max_chars
+        return Chunker(config)
+
+    def test_strategies(self):
+        text = "One two three. Four five!\nSix seven eight nine."
+        self.assertEqual(
+            self.chunker("line", 0).split(text),
+            ["One two three. Four five!", "Six seven eight nine."],
+        )
+        self.assertEqual(
+            self.chunker("line", 0, max_chars=15).split(text),
+            ["One two three.", "Four five!", "Six seven eight", "nine."],
+        )
+        self.assertEqual(
+            self.chunker("chars", 20, 5).split("abcdefghij" * 4),
+            ["abcdefghijabcdefghij", "fghijabcdefghijabcde", "abcdefghij"],
+        )
+        self.assertEqual(
+            self.chunker("tokens", 4, 1).split(text),
+            ["One two three.", ". Four five!", "!\nSix seven eight", "eight nine."],
+        )
+        self.assertEqual(
+            self.chunker("sentences", 30).split(text),
+            ["One two three. Four five!", "Six seven eight nine."],
+        )
+
+    def test_document_ids(self):
+        doc = Document("a.txt", 3, "x " * 50, {})
+        chunks = list(doc.iter_chunks(self.chunker("chars", 40)))
+        self.assertEqual(
+            [one.id for one in chunks],
+            ["a.txt|3|0", "a.txt|3|1", "a.txt|3|2", "a.txt|3|3"],
+        )
+        # a single chunk is the document itself
+        self.assertEqual(len(list(doc.iter_chunks(self.chunker("chars", 200)))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
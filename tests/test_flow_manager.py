@@ -0,0 +1,73 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from rag_simple.document import Document
+from rag_simple.flow_manager import FlowManager
+from rag_simple.flow_manager.cache import LRUCache
+from rag_simple.llm_agent import BaseLLM
+from rag_simple.vector_db import NumpyVectorDB, VectorDBConfig
+
+from .test_vector_db import embed
+
+
+class FakeLLM(BaseLLM):
+    def embed(self, input_text):
+        return embed(input_text)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evict(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        # b is the least recently used now
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 2, "misses": 1})
+        disabled = LRUCache(0)
+        disabled.put("a", 1)
+        self.assertEqual(len(disabled), 0)
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        config = VectorDBConfig()
+        config.engine = "numpy"
+        config.retrieval.mode = "vector"
+        self.flow = FlowManager(FakeLLM(), NumpyVectorDB(config, Path(self.tmp.name)))
+        self.flow.insert_documents([Document("a.yaml", 0, "zzz", {})])
+
+    def tearDown(self):
+        self.flow.close()
+        self.tmp.cleanup()
+
+    def top(self, text="vvvv"):
+        found = list(self.flow.retrieve_text(text, limit=1))
+        return found[0].text if len(found) != 0 else None
+
+    def test_hit(self):
+        first = self.top()
+        self.assertEqual(self.top(), first)
+        stats = self.flow.cache_stats()["results"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        # the embedding is cached too
+        self.assertEqual(self.flow.cache_stats()["embeddings"]["hits"], 1)
+
+    def test_invalidate(self):
+        self.assertEqual(self.top(), "zzz")
+        doc = Document("b.yaml", 0, "vvvv", {})
+        self.flow.add_chunks([doc], embed([doc.text]))
+        self.assertEqual(self.top(), "vvvv")
+        self.flow.remove_ids([doc.id])
+        self.assertEqual(self.top(), "zzz")
+        self.flow.clear_db()
+        self.assertIsNone(self.top())
+        self.assertEqual(self.flow.cache_stats()["results"]["hits"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,6 +27,19 @@ class TestKVModel(unittest.TestCase):
             b.dump(), {"a": {"a1": 3, "a2": 9}, "b1": "b1", "b2": "b2"}
         )
 
+    def test_inherited_fields(self):
+        class A(KVModel):
+            a1: int = Field(default=3)
+
+        class C(A):
+            c1: int = Field(default=5)
+
+        self.assertEqual(list(C.fields), ["a1", "c1"])
+        self.assertEqual(list(A.fields), ["a1"])
+        c = C()
+        c.load({"a1": 4})
+        self.assertDictEqual(c.dump(), {"a1": 4, "c1": 5})
+
 
 if __name__ == "__main__":
     unittest.main()
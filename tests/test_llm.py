@@ -0,0 +1,184 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import unittest
+from pathlib import Path
+
+from rag_simple.llm_agent import LLM, LLMAgentConfig, LLMConfig
+from rag_simple.llm_agent.batching import BatchingEmbedder, EmbedBatchConfig
+from rag_simple.llm_agent.cache import EmbeddingCache
+from rag_simple.llm_agent.ollama import OllamaAgent, OllamaAgentConfig
+from rag_simple.llm_agent.pool import EndpointPool
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_get_put_evict(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbeddingCache(Path(tmp) / "cache.sqlite", max_entries=2)
+            cache.put_many("a", "m", 2, ["x", "y"], [[1.0, 2.0], [3.0, 4.0]])
+            self.assertEqual(
+                cache.get_many("a", "m", 2, ["y", "z", "x"]),
+                [[3.0, 4.0], None, [1.0, 2.0]],
+            )
+            self.assertEqual(cache.get_many("b", "m", 2, ["x"]), [None])
+            self.assertEqual(cache.stats(), {"hits": 2, "misses": 2})
+            cache.put_many("a", "m", 2, ["z"], [[5.0, 6.0]])
+            cache.evict()
+            self.assertEqual(cache.get_many("a", "m", 2, ["z"]), [[5.0, 6.0]])
+            # vectors of another size are missed
+            self.assertEqual(cache.get_many("a", "m", 3, ["z"]), [None])
+            cache.close()
+
+    def test_touched(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbeddingCache(Path(tmp) / "cache.sqlite", max_entries=2)
+            cache.put_many("a", "m", 2, ["x"], [[1.0]])
+            cache.put_many("a", "m", 2, ["y"], [[2.0]])
+            cache.get_many("a", "m", 2, ["x"])
+            # not written on a hit, but before the eviction
+            self.assertEqual(len(cache.touched), 1)
+            cache.put_many("a", "m", 2, ["z"], [[3.0]])
+            self.assertEqual(cache.touched, {})
+            cache.evict()
+            self.assertEqual(
+                cache.get_many("a", "m", 2, ["x", "y", "z"]), [[1.0], None, [3.0]]
+            )
+            cache.close()
+
+    def test_llm_size(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = LLMConfig()
+            config.embed.agent = "stub"
+            config.chat.agent = "stub"
+            config.embed.size = 256
+            llm = LLM(config, Path(tmp) / "agents", cache_dir=Path(tmp))
+            self.assertEqual(len(llm.embed(["x"])[0]), 256)
+            llm.embedding_agent.config.dimension = 8
+            config.embed.size = 8
+            self.assertEqual(len(llm.embed(["x"])[0]), 8)
+            self.assertEqual(llm.embed_cache.stats(), {"hits": 0, "misses": 2})
+            llm.close()
+
+
+class TestLLMAgentConfig(unittest.TestCase):
+    def test_request_args(self):
+        config = LLMAgentConfig()
+        self.assertEqual(config.request_args("m"), {})
+        config.keep_alive = "30m"
+        config.options = {"num_ctx": 4096, "temperature": 0.5}
+        config.models = {"big": {"keep_alive": -1, "options": {"num_ctx": 8192}}}
+        self.assertEqual(
+            config.request_args("m"),
+            {"keep_alive": "30m", "options": {"num_ctx": 4096, "temperature": 0.5}},
+        )
+        self.assertEqual(
+            config.request_args("big"),
+            {"keep_alive": -1, "options": {"num_ctx": 8192, "temperature": 0.5}},
+        )
+
+
+class TestBatchingEmbedder(unittest.TestCase):
+    def test_coalesce(self):
+        calls = []
+
+        def embed(texts):
+            calls.append(len(texts))
+            return [[float(text)] for text in texts]
+
+        config = EmbedBatchConfig()
+        config.max_batch = 4
+        config.max_wait_ms = 200
+        embedder = BatchingEmbedder(embed, config)
+        inputs = [[str(i)] for i in range(8)] + [[str(i) for i in range(10)]]
+        with ThreadPoolExecutor(len(inputs)) as executor:
+            results = list(executor.map(embedder.embed, inputs))
+        embedder.close()
+        for texts, result in zip(inputs, results):
+            self.assertEqual(result, [[float(text)] for text in texts])
+        self.assertEqual(sum(calls), 18)
+        # the large call goes alone, and the others are coalesced
+        self.assertIn(10, calls)
+        self.assertLess(len(calls), 9)
+        self.assertLessEqual(max(calls), 10)
+
+
+class TestEndpointPool(unittest.TestCase):
+    def test_least_outstanding(self):
+        pool = EndpointPool(["a", "b"], max_concurrency=1)
+        a = pool.acquire()
+        b = pool.acquire()
+        self.assertEqual({a.url, b.url}, {"a", "b"})
+        pool.release(a)
+        self.assertIs(pool.acquire(), a)
+        pool.release(a, ok=False)
+        pool.release(b)
+        # a is down, and b is the only choice
+        self.assertIs(pool.acquire(), b)
+        self.assertIsNone(pool.acquire(exclude=["a", "b"]))
+
+    def test_failover(self):
+        class Client:
+            def __init__(self, url):
+                self.url = url
+
+            def embed(self, model, input):
+                if self.url == "http://down":
+                    raise ConnectionError("refused")
+                return {"embeddings": [[1.0]] * len(input)}
+
+        config = OllamaAgentConfig()
+        config.api_url = "http://down"
+        config.endpoints = ["http://up"]
+        agent = OllamaAgent(config)
+        agent.client_of = Client
+        for _ in range(3):
+            self.assertEqual(agent.embed("m", ["x"]), [[1.0]])
+        down, up = agent.pool.stats()
+        self.assertEqual((down["up"], down["failures"]), (False, 1))
+        self.assertEqual((up["requests"], up["outstanding"]), (3, 0))
+
+    def test_cancel_waiting(self):
+        config = OllamaAgentConfig()
+        config.max_concurrency = 1
+        agent = OllamaAgent(config)
+        busy = agent.pool.acquire()
+
+        async def cancel():
+            task = asyncio.create_task(agent.aacquire([]))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # the waiting thread gets the endpoint after this
+            agent.pool.release(busy)
+            for _ in range(100):
+                if agent.pool.stats()[0]["requests"] == 2:
+                    break
+                await asyncio.sleep(0.01)
+            # and gives it back
+            await asyncio.sleep(0.01)
+
+        asyncio.run(cancel())
+        (stats,) = agent.pool.stats()
+        self.assertEqual((stats["requests"], stats["outstanding"]), (2, 0))
+
+    def test_warm_up_limited(self):
+        class Client:
+            def __init__(self, url):
+                pass
+
+            def embed(self, model, input):
+                in_flight.append(agent.pool.stats()[0]["outstanding"])
+
+        config = OllamaAgentConfig()
+        config.max_concurrency = 1
+        agent = OllamaAgent(config)
+        agent.client_of = Client
+        in_flight = []
+        agent.warm_up("m", "embed")
+        self.assertEqual(in_flight, [1])
+        self.assertEqual(agent.pool.stats()[0]["outstanding"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
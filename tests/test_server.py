@@ -0,0 +1,126 @@
+from contextlib import ExitStack, redirect_stderr, redirect_stdout
+import http.client
+import io
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from rag_simple.project import RAGProject
+from rag_simple.server import RAGServer
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        # quiet progress bars and request logs
+        self.quiet = ExitStack()
+        self.quiet.enter_context(redirect_stdout(io.StringIO()))
+        self.quiet.enter_context(redirect_stderr(io.StringIO()))
+        self.tmp = tempfile.TemporaryDirectory()
+        path = Path(self.tmp.name) / "project"
+        project = RAGProject.new(path)
+        project.config.llm.embed.agent = "stub"
+        project.config.llm.embed.size = 256
+        project.config.llm.embed.cache.enabled = False
+        project.config.llm.chat.agent = "stub"
+        project.config.vector_db.engine = "numpy"
+        project.write_project_file()
+        RAGProject.new_doc(path / "documents" / "example.yaml")
+        self.project = RAGProject(path)
+        self.project.build_db(dry_run=False, run_all=False)
+
+        self.project.config.serve.port = 0
+        self.server = RAGServer(self.project)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.project.flow_manager.close()
+        self.tmp.cleanup()
+        self.quiet.close()
+
+    def post(self, path, body):
+        host, port = self.server.server_address[:2]
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        connection.request("POST", path, json.dumps(body))
+        response = connection.getresponse()
+        data = response.read().decode("utf-8")
+        connection.close()
+        return response.status, data
+
+    def test_retrieve(self):
+        status, data = self.post("/retrieve", {"text": "Example", "limit": 1})
+        self.assertEqual(status, 200)
+        knowledge = json.loads(data)["knowledge"]
+        # documents, then those of the best sentences
+        self.assertLessEqual(len(knowledge), 2)
+        self.assertIn("Example", knowledge[0]["text"])
+
+        status, data = self.post("/embed", {"texts": ["a", "b"]})
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(data)["embeddings"]), 2)
+
+        status, _ = self.post("/embed", {"text": "a"})
+        self.assertEqual(status, 400)
+        for limit in ("abc", None, 0, -1, True):
+            status, _ = self.post("/retrieve", {"text": "Example", "limit": limit})
+            self.assertEqual(status, 400)
+        status, _ = self.post("/retrieve", {"text": "Example", "mode": "fuzzy"})
+        self.assertEqual(status, 400)
+        host, port = self.server.server_address[:2]
+        for length in ("abc", "-1"):
+            connection = http.client.HTTPConnection(host, port, timeout=10)
+            connection.putrequest("POST", "/embed")
+            connection.putheader("Content-Length", length)
+            connection.endheaders()
+            response = connection.getresponse()
+            self.assertEqual(response.status, 400)
+            self.assertIn("Content-Length", response.read().decode("utf-8"))
+            connection.close()
+
+    def test_reload(self):
+        body = {"text": "Xylophone\nlessons", "limit": 1, "mode": "vector"}
+        status, data = self.post("/retrieve", body)
+        texts = [one["text"] for one in json.loads(data)["knowledge"]]
+        self.assertNotIn("Xylophone\nlessons", texts)
+
+        # built by another process
+        path = self.project.project_path
+        with open(path / "documents" / "more.txt", "w") as file:
+            file.write("Xylophone\nlessons")
+        other = RAGProject(path)
+        other.build_db(dry_run=False, run_all=False)
+        other.flow_manager.close()
+        status, data = self.post("/retrieve", body)
+        self.assertEqual(status, 200)
+        knowledge = json.loads(data)["knowledge"]
+        self.assertEqual(knowledge[0]["text"], "Xylophone\nlessons")
+
+    def test_chat(self):
+        status, data = self.post("/chat", {"question": "Example?", "limit": 1})
+        self.assertEqual(status, 200)
+        lines = [json.loads(line) for line in data.splitlines()]
+        self.assertGreater(len(lines[0]["knowledge"]), 0)
+        reply = "".join(line.get("content", "") for line in lines[1:])
+        self.assertEqual(reply, "This is a canned reply from the stub agent.")
+        self.assertTrue(lines[-1]["done"])
+
+        for history in (
+            [{"role": "user"}],
+            ["hello"],
+            [{"role": "robot", "content": "hi"}],
+            [{"role": "user", "content": 1}],
+        ):
+            body = {"question": "Example?", "history": history}
+            status, _ = self.post("/chat", body)
+            self.assertEqual(status, 400)
+        status, _ = self.post("/chat", {"question": "Example?", "limit": "3"})
+        self.assertEqual(status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from rag_simple.tracing import Histogram, Metrics
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observe(self):
+        histogram = Histogram("h", buckets=(0.01, 0.1, 1.0))
+        for value in (0.005, 0.01, 0.05, 0.05, 0.5, 3.0):
+            histogram.observe(value)
+        # a bound is inclusive, the last one is +Inf
+        self.assertEqual(histogram.counts, [2, 2, 1, 1])
+        self.assertEqual(histogram.count, 6)
+        self.assertAlmostEqual(histogram.sum, 3.615)
+        self.assertEqual(histogram.max, 3.0)
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.2), 0.01)
+        self.assertEqual(histogram.quantile(0.99), 3.0)
+        dumped = histogram.dump()
+        self.assertEqual(dumped["p50"], 0.1)
+        self.assertEqual(dumped["buckets"], {"0.01": 2, "0.1": 2, "1.0": 1, "inf": 1})
+        self.assertEqual(Histogram("empty").quantile(0.5), 0.0)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.enabled = True
+        self.clock = Clock()
+        patcher = mock.patch("rag_simple.tracing.time.perf_counter", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_span(self):
+        with self.metrics.span("s"):
+            self.clock.now += 0.02
+        histogram = self.metrics.histograms["s"]
+        self.assertEqual(histogram.count, 1)
+        self.assertAlmostEqual(histogram.sum, 0.02)
+
+    def test_traced(self):
+        @self.metrics.traced("f")
+        def function(x):
+            self.clock.now += 0.5
+            return x + 1
+
+        @self.metrics.traced("g")
+        def generator():
+            for i in range(3):
+                self.clock.now += 0.01
+                yield i
+            return "done"
+
+        @self.metrics.traced("c")
+        async def coroutine():
+            self.clock.now += 0.25
+            return "c"
+
+        self.assertEqual(function(1), 2)
+        self.assertEqual(asyncio.run(coroutine()), "c")
+
+        def consume():
+            result = yield from generator()
+            self.assertEqual(result, "done")
+
+        for _ in consume():
+            # time spent by the consumer is not counted
+            self.clock.now += 1.0
+        dumped = self.metrics.dump()
+        self.assertEqual(list(dumped), ["c", "f", "g"])
+        self.assertAlmostEqual(dumped["f"]["sum"], 0.5)
+        self.assertAlmostEqual(dumped["c"]["sum"], 0.25)
+        self.assertEqual(dumped["g"]["count"], 1)
+        self.assertAlmostEqual(dumped["g"]["sum"], 0.03)
+        self.assertEqual(json.loads(self.metrics.to_json()).keys(), dumped.keys())
+
+    def test_disabled(self):
+        self.metrics.enabled = False
+
+        @self.metrics.traced("f")
+        def function():
+            return 1
+
+        @self.metrics.traced("g")
+        def generator():
+            yield 1
+
+        self.assertEqual(function(), 1)
+        self.assertEqual(list(generator()), [1])
+        with self.metrics.span("s"):
+            pass
+        self.metrics.observe("o", 1.0)
+        self.assertEqual(self.metrics.histograms, {})
+        self.assertEqual(self.metrics.to_prometheus(), "\n")
+
+    def test_prometheus(self):
+        self.metrics.observe("embed.batch", 1.5, buckets=(1, 2), unit=None)
+        self.metrics.observe("vector_db.query", 0.2, buckets=(0.1, 1.0))
+        self.metrics.observe("vector_db.query", 0.05, buckets=(0.1, 1.0))
+        self.assertEqual(
+            self.metrics.to_prometheus(),
+            "# TYPE rag_simple_embed_batch histogram\n"
+            'rag_simple_embed_batch_bucket{le="1"} 0\n'
+            'rag_simple_embed_batch_bucket{le="2"} 1\n'
+            'rag_simple_embed_batch_bucket{le="+Inf"} 1\n'
+            "rag_simple_embed_batch_sum 1.5\n"
+            "rag_simple_embed_batch_count 1\n"
+            "# TYPE rag_simple_vector_db_query_seconds histogram\n"
+            'rag_simple_vector_db_query_seconds_bucket{le="0.1"} 1\n'
+            'rag_simple_vector_db_query_seconds_bucket{le="1.0"} 2\n'
+            'rag_simple_vector_db_query_seconds_bucket{le="+Inf"} 2\n'
+            "rag_simple_vector_db_query_seconds_sum 0.25\n"
+            "rag_simple_vector_db_query_seconds_count 2\n",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from rag_simple.document import Document
+from rag_simple.registry import Registry
+from rag_simple.vector_db import NumpyVectorDB, VectorDBConfig
+from rag_simple.vector_db.base import iter_batches
+from rag_simple.vector_db.mmr import maximal_marginal_relevance
+
+
+def embed(texts):
+    # two dimensional embeddings, by the numbers in the texts
+    return [[float(sum(map(ord, text)) % 7), float(len(text))] for text in texts]
+
+
+class TestBatches(unittest.TestCase):
+    def test_iter_batches(self):
+        doc = Document("a.yaml", 0, "a\nbb\nccc\ndddd", {})
+        chunks = list(doc.iter_chunks())
+        self.assertEqual(len(chunks), 5)
+        batches = list(iter_batches(chunks, max_size=2, max_chars=100))
+        self.assertEqual([len(one) for one in batches], [2, 2, 1])
+        batches = list(iter_batches(chunks, max_size=10, max_chars=5))
+        self.assertEqual(
+            [[chunk.text for chunk in one] for one in batches],
+            [["a\nbb\nccc\ndddd"], ["a", "bb"], ["ccc"], ["dddd"]],
+        )
+        self.assertEqual(chunks[2].metadata["sentence_index"], 2)
+
+
+class TestMMR(unittest.TestCase):
+    def test_maximal_marginal_relevance(self):
+        vectors = [[1.0, 0.9], [0.9, 1.0], [1.0, 0.0], [0.0, 1.0]]
+        query = [1.0, 1.0]
+        self.assertEqual(maximal_marginal_relevance(query, vectors, 2, 1.0), [0, 1])
+        # the near-duplicate of the first is skipped
+        self.assertEqual(maximal_marginal_relevance(query, vectors, 2, 0.5), [0, 3])
+        self.assertEqual(maximal_marginal_relevance(query, vectors, 9), [0, 1, 2, 3])
+        self.assertEqual(maximal_marginal_relevance(query, [], 2), [])
+
+
+class TestNumpyVectorDB(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        config = VectorDBConfig()
+        config.engine = "numpy"
+        self.config = config
+        self.db = NumpyVectorDB(config, Path(self.tmp.name))
+        self.db.connect()
+        self.docs = [
+            Document("a.yaml", 0, "x\nyy", {"role": "system"}),
+            Document("a.yaml", 1, "zzz", {"role": "system"}),
+            Document("b.yaml", 0, "w\nvvvv\nuuuuu", {"role": "system"}),
+        ]
+        self.db.insert_documents(self.docs, embed)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_query_where(self):
+        query = embed(["vvvv"])
+        result = self.db.query_embeddings(query, where=None, n_results=3)
+        self.assertEqual(result.ids[0][0], "b.yaml|0|2")
+        self.assertEqual(result.distances[0][0], 0.0)
+        self.assertEqual(len(result.ids[0]), 3)
+        result = self.db.query_embeddings(
+            query, where={"sentence_index": 0}, n_results=10
+        )
+        self.assertEqual(
+            sorted(result.ids[0]), ["a.yaml|0|0", "a.yaml|1|0", "b.yaml|0|0"]
+        )
+        result = self.db.query_embeddings(
+            query * 2,
+            where={"doc_id": {"$nin": ["b.yaml|0"]}, "rel_path": "a.yaml"},
+            n_results=10,
+        )
+        self.assertEqual(len(result.ids), 2)
+        self.assertEqual(len(result.ids[1]), 4)
+
+    def test_retrieve(self):
+        result = list(self.db.retrieve(embed(["vvvv"]), limit=2))
+        ids = [one.id for one in result]
+        # two documents, then the only document left by sentences
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(set(ids), {"a.yaml|0", "a.yaml|1", "b.yaml|0"})
+        self.assertEqual(ids[2], "b.yaml|0")
+        self.assertEqual(result[2].dist, 0.0)
+        for one in result:
+            self.assertEqual(one.metadata["sentence_index"], 0)
+            self.assertEqual(one.metadata["role"], "system")
+
+    def test_retrieve_many(self):
+        queries = embed(["vvvv", "x", "zzz"])
+        many = self.db.retrieve_many(queries, limit=2)
+        self.assertEqual(len(many), 3)
+        for query, result in zip(queries, many):
+            single = list(self.db.retrieve([query], limit=2))
+            self.assertEqual(result, single)
+
+    def test_keywords(self):
+        self.db.insert_documents(
+            [Document("c.yaml", 0, "My birthday is 1991-02-29.", {})], embed
+        )
+        found = list(self.db.retrieve(None, text="born 1991-02-29?", mode="keyword"))
+        self.assertEqual([one.id for one in found], ["c.yaml|0"])
+        # sentences are not indexed
+        found = self.db.retrieve(None, text="uuuuu vvvv", mode="keyword")
+        self.assertEqual([one.id for one in found], ["b.yaml|0"])
+
+        hybrid = list(self.db.retrieve(embed(["x"]), limit=2, text="uuuuu"))
+        vector = list(self.db.retrieve(embed(["x"]), limit=2, mode="vector"))
+        self.assertIn("b.yaml|0", [one.id for one in hybrid])
+        self.assertEqual(
+            {one.id for one in hybrid}, {one.id for one in vector} | {"b.yaml|0"}
+        )
+        # without keyword hits, the same as vector search
+        self.assertEqual(
+            list(self.db.retrieve(embed(["x"]), limit=2, text="none")), vector
+        )
+
+        self.db.remove_by_rel_path("c.yaml")
+        self.assertEqual(self.db.search_keywords(["1991-02-29"]), [[]])
+
+    def test_mmr(self):
+        queries = embed(["vvvv", "x"])
+        plain = [self.db.retrieve_many(queries, limit=n) for n in (1, 2)]
+        self.db.mmr = True
+        # as many hits as without it
+        for n, expected in zip((1, 2), plain):
+            found = self.db.retrieve_many(queries, limit=n)
+            self.assertEqual(
+                [len(one) for one in found], [len(one) for one in expected]
+            )
+        found = self.db.retrieve_many(queries, limit=2)
+        self.assertEqual([len(one) for one in found], [3, 3])
+        for one in found:
+            self.assertEqual(len({knowledge.id for knowledge in one}), 3)
+            for knowledge in one:
+                self.assertIsNone(knowledge.embedding)
+        self.assertEqual(list(self.db.retrieve(embed(["vvvv"]), limit=2)), found[0])
+
+    def test_remove_and_flush(self):
+        self.db.remove_by_rel_path("a.yaml")
+        self.db.flush()
+        db = NumpyVectorDB(self.config, Path(self.tmp.name))
+        db.connect()
+        self.assertEqual(
+            sorted(db.ids), ["b.yaml|0|0", "b.yaml|0|1", "b.yaml|0|2", "b.yaml|0|3"]
+        )
+        found = db.find_by_ids(["b.yaml|0|2", "a.yaml|0|0", "b.yaml|0|0"])
+        self.assertEqual(found.ids, ["b.yaml|0|2", "b.yaml|0|0"])
+        self.assertEqual(found.texts, ["vvvv", "w\nvvvv\nuuuuu"])
+
+
+class TestRegistry(unittest.TestCase):
+    def test_get(self):
+        registry = Registry("rag_simple.test", "engine")
+        registry.register("numpy", "rag_simple.vector_db.numpy_db:NumpyVectorDB")
+        registry.register("mine", NumpyVectorDB)
+        self.assertIs(registry.get("numpy"), NumpyVectorDB)
+        self.assertIs(registry.get("mine"), NumpyVectorDB)
+        self.assertEqual(registry.names(), ["mine", "numpy"])
+        with self.assertRaises(NotImplementedError):
+            registry.get("missing")
+
+
+if __name__ == "__main__":
+    unittest.main()